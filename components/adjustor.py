@@ -1,15 +1,21 @@
-from typing import Dict, Any
-from openai import AsyncOpenAI
+from typing import Dict, Any, Optional
+import time
+
+from .entities import UserContext
+from .llm import get_client
+from .routing import RouteDecision, model_registry, record_completion
 
 class ResponseAdjustor:
     def __init__(self, api_key: str):
-        self.model = AsyncOpenAI(api_key=api_key)
+        self.model = get_client(api_key)
         
-    async def process(self, message_data: Dict[str, Any], context: Dict[str, Any]) -> str:
+    async def process(self, message_data: Dict[str, Any], context: UserContext,
+                      route: Optional[RouteDecision] = None) -> str:
         """Adjust the response to match the user's communication style."""
+        model = model_registry.get("adjustor", route.tier if route else "strong")
         
         # Get the user's communication style
-        style = context.get("profile", {}).get("communication_style", "")
+        style = context.communication_style
         if not style:
             return message_data["content"]  # No adjustment needed
             
@@ -26,14 +32,16 @@ class ResponseAdjustor:
         Provide only the adjusted response, with no explanations or additional text."""
         
         try:
+            started = time.perf_counter()
             response = await self.model.chat.completions.create(
-                model="gpt-3.5-turbo",  # Using 3.5 for faster, lighter adjustments
+                model=model,  # Fast model by default for lighter adjustments
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": "Please adjust this response."}
                 ],
                 temperature=0.7
             )
+            record_completion("adjustor", model, started, response, route, message_data.get("user_id"))
             
             # Return the adjusted response, not the input message
             return response.choices[0].message.content.strip()
@@ -0,0 +1,159 @@
+from typing import List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import os
+import time
+
+from .metrics import metrics
+
+# Token buckets: sustained requests per second and burst size, per API key and per user
+RATE_LIMIT_KEY_PER_SEC = float(os.getenv("RATE_LIMIT_KEY_PER_SEC", 20))
+RATE_LIMIT_KEY_BURST = int(os.getenv("RATE_LIMIT_KEY_BURST", 40))
+RATE_LIMIT_USER_PER_SEC = float(os.getenv("RATE_LIMIT_USER_PER_SEC", 0.5))
+RATE_LIMIT_USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", 5))
+
+# Messages processed at once, and how many more may wait for a slot
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 32))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", 64))
+
+# Longest a message may wait for a slot before it is shed instead
+ADMISSION_MAX_WAIT_MS = float(os.getenv("ADMISSION_MAX_WAIT_MS", 2000))
+
+# Buckets kept in memory (least recently used are dropped; a dropped bucket starts full again)
+MAX_BUCKETS = 10000
+
+class AdmissionRejected(Exception):
+    """Raised when a message is rate limited (429) or shed under load (503)."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def wait(self) -> float:
+        """Seconds until a token is available (0 if one is now), without taking it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        retry_after = self.wait()
+        if not retry_after:
+            self.tokens -= 1
+        return retry_after
+
+class AdmissionController:
+    """Rate limits per API key and user, plus a global in-flight cap with a bounded wait queue."""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_queue: int = MAX_QUEUE,
+                 max_wait_ms: float = ADMISSION_MAX_WAIT_MS):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000
+        self.in_flight = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        # Smoothed time a message holds a slot, used to predict queue wait
+        self._service_time = 1.0
+
+    @asynccontextmanager
+    async def admit(self, api_key: Optional[str], user_id: Optional[str]):
+        """Hold a processing slot for one message, or raise AdmissionRejected."""
+        self._check_rates([("key", api_key, RATE_LIMIT_KEY_PER_SEC, RATE_LIMIT_KEY_BURST),
+                           ("user", user_id, RATE_LIMIT_USER_PER_SEC, RATE_LIMIT_USER_BURST)])
+
+        waited = await self._acquire_slot()
+        metrics.inc("admission", decision="admitted", queued=waited > 0)
+        metrics.observe("admission_queue_ms", waited * 1000)
+
+        started = time.perf_counter()
+        self.in_flight += 1
+        self._publish()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.perf_counter() - started)
+            self._publish()
+
+    def expected_wait(self) -> float:
+        """Predicted seconds until a new arrival gets a slot."""
+        if self.in_flight < self.max_in_flight:
+            return 0.0
+        return (self.queued + 1) * self._service_time / self.max_in_flight
+
+    def _check_rates(self, limits: List[Tuple[str, Optional[str], float, int]]) -> None:
+        """Take a token from each (scope, key, rate, burst) bucket, or from none if any of them is empty.
+
+        Every bucket is checked before any is debited, so a message refused by its user's limit doesn't
+        spend a token of its API key's.
+        """
+        buckets = [(scope, self._bucket(scope, key, rate, burst)) for scope, key, rate, burst in limits
+                   if key and rate > 0]
+        for scope, bucket in buckets:
+            retry_after = bucket.wait()
+            if retry_after:
+                metrics.inc("admission", decision="rate_limited", scope=scope)
+                raise AdmissionRejected(429, f"Rate limit exceeded for {scope}", retry_after)
+        for _, bucket in buckets:
+            bucket.take()
+
+    def _bucket(self, scope: str, key: str, rate: float, burst: int) -> TokenBucket:
+        bucket = self._buckets.get((scope, key))
+        if bucket is None:
+            bucket = self._buckets[(scope, key)] = TokenBucket(rate, burst)
+            while len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end((scope, key))
+        return bucket
+
+    async def _acquire_slot(self) -> float:
+        """Wait for a processing slot; returns the seconds spent queued."""
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return 0.0
+
+        # Shed right away when the queue is full or the wait would blow the budget
+        expected = self.expected_wait()
+        if self.queued >= self.max_queue or expected > self.max_wait:
+            metrics.inc("admission", decision="shed", reason="queue_full" if self.queued >= self.max_queue else "slo")
+            raise AdmissionRejected(503, "Server busy", expected)
+
+        started = time.perf_counter()
+        self.queued += 1
+        self._publish()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            metrics.inc("admission", decision="shed", reason="timeout")
+            raise AdmissionRejected(503, "Server busy", self.expected_wait())
+        finally:
+            self.queued -= 1
+            self._publish()
+        return time.perf_counter() - started
+
+    def _publish(self) -> None:
+        metrics.set("admission_in_flight", self.in_flight)
+        metrics.set("admission_queue_depth", self.queued)
+
+# Shared controller for HTTP and WebSocket messages
+admission = AdmissionController()
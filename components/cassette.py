@@ -0,0 +1,240 @@
+from typing import Any, Callable, Dict, List, Optional
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+
+from openai.types.chat import ChatCompletion
+
+from .metrics import metrics
+from .serialization import dumps, dumps_canonical, loads
+
+# Directory that pipeline executions are recorded to as JSONL cassettes, one file per day (unset disables
+# recording). Cassettes hold user messages, context and LLM output, so treat them like the database.
+PIPELINE_RECORD_DIR = os.getenv("PIPELINE_RECORD_DIR", "")
+
+# Share of executions recorded
+PIPELINE_RECORD_RATE = float(os.getenv("PIPELINE_RECORD_RATE", 1.0))
+
+# Characters of the first prompt message identifying which prompt template a request used
+TEMPLATE_PREFIX_CHARS = 80
+
+# Tape of the execution running in the current task (background tasks it starts inherit it)
+_tape: ContextVar[Optional["Tape"]] = ContextVar("cassette_tape", default=None)
+
+# Recorded execution whose LLM responses are being replayed in the current task
+_replay: ContextVar[Optional["Replay"]] = ContextVar("cassette_replay", default=None)
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Hash of the model and messages of an LLM request."""
+    return hashlib.blake2b(dumps_canonical([request.get("model"), request.get("messages")]), digest_size=16).hexdigest()
+
+def template_key(request: Dict[str, Any]) -> str:
+    """Start of the first prompt message: the same for every request a phase makes, whatever the user."""
+    messages = request.get("messages") or [{}]
+    return str(messages[0].get("content", ""))[:TEMPLATE_PREFIX_CHARS]
+
+class Tape:
+    """What one pipeline execution did: its input and context, LLM calls, DB queries and phase steps."""
+    __slots__ = ("message_data", "context", "llm", "queries", "steps", "recorded_at", "started", "duration_ms")
+
+    def __init__(self, message_data: Dict[str, Any]):
+        self.message_data = dict(message_data)
+        # The deadline is a monotonic clock reading, only meaningful in this process; keep what was left of it
+        deadline_at = self.message_data.pop("deadline_at", None)
+        if deadline_at:
+            self.message_data["deadline_ms"] = round((deadline_at - time.monotonic()) * 1000, 1)
+        self.context = None
+        self.llm: List[Dict[str, Any]] = []
+        self.queries: List[Dict[str, Any]] = []
+        self.steps: List[Dict[str, Any]] = []
+        self.recorded_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+
+    def at_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def step(self, step: Dict[str, Any]) -> None:
+        self.steps.append({"phase": step.get("phase"), "status": step.get("status"), "at_ms": self.at_ms(),
+                           "details": step.get("details") or {}})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "recorded_at": self.recorded_at,
+            "duration_ms": self.duration_ms,
+            "message_data": self.message_data,
+            "context": self.context,
+            "llm": self.llm,
+            "queries": self.queries,
+            "steps": self.steps
+        }
+
+class Recorder:
+    """Records pipeline executions to cassette files, or hands them to `sink` (replays collect them that way)."""
+
+    def __init__(self, directory: str = PIPELINE_RECORD_DIR, rate: float = PIPELINE_RECORD_RATE):
+        self.directory = directory
+        self.rate = rate
+        self.sink: Optional[Callable[[Tape], None]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) or self.sink is not None
+
+    def start(self, message_data: Dict[str, Any]) -> Optional[Tape]:
+        """Begin recording an execution in the current task, or return None when it isn't sampled."""
+        if not self.enabled or random.random() >= self.rate:
+            return None
+        tape = Tape(message_data)
+        _tape.set(tape)
+        return tape
+
+    def finish(self, tape: Optional[Tape]) -> None:
+        if tape is None:
+            return
+        _tape.set(None)
+        tape.duration_ms = tape.at_ms()
+        if self.sink is not None:
+            self.sink(tape)
+        if self.directory:
+            line = dumps(tape.to_dict()) + b"\n"
+            path = Path(self.directory) / f"{tape.recorded_at:%Y%m%d}.jsonl"
+            # Off the event loop; the lock keeps concurrent lines from interleaving
+            asyncio.get_running_loop().run_in_executor(None, self._append, path, line)
+        metrics.inc("cassette_recorded")
+
+    def _append(self, path: Path, line: bytes) -> None:
+        try:
+            with self._lock:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "ab") as f:
+                    f.write(line)
+        except Exception as e:
+            print(f"Error writing cassette: {str(e)}")
+
+def note_context(context: Any) -> None:
+    """Keep the user context the execution worked with, so a replay can seed the same rows."""
+    tape = _tape.get()
+    if tape is not None:
+        tape.context = context.to_dict()
+
+def note_phase(response: Any, phase: str) -> None:
+    """Label the recorded LLM call that produced `response` with its pipeline phase."""
+    tape = _tape.get()
+    if tape is None:
+        return
+    response_id = getattr(response, "id", None)
+    for call in reversed(tape.llm):
+        if call.get("phase") is None and (call.get("response") or {}).get("id") == response_id:
+            call["phase"] = phase
+            return
+
+def log_query(record: Any) -> None:
+    """asyncpg query logger: time of every query run on behalf of a recorded execution."""
+    tape = _tape.get()
+    if tape is not None:
+        tape.queries.append({
+            "query": " ".join(record.query.split())[:200],
+            "elapsed_ms": round(record.elapsed * 1000, 2),
+            "at_ms": tape.at_ms(),
+            "error": None if record.exception is None else type(record.exception).__name__
+        })
+
+class _Completions:
+    def __init__(self, inner: Any):
+        self._inner = inner
+
+    async def create(self, **request) -> Any:
+        tape = _tape.get()
+        if tape is None:
+            return await self._inner.create(**request)
+
+        call = {"request": request, "key": request_key(request), "template": template_key(request),
+                "at_ms": tape.at_ms(), "phase": None}
+        started = time.perf_counter()
+        try:
+            response = await self._inner.create(**request)
+            call["response"] = response.model_dump(mode="json")
+            return response
+        except Exception as e:
+            call["error"] = str(e)
+            raise
+        finally:
+            call["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            tape.llm.append(call)
+
+class _Chat:
+    def __init__(self, completions: Any):
+        self.completions = completions
+
+class RecordingClient:
+    """Wraps an AsyncOpenAI client so chat completions made during a recorded execution land on its tape."""
+
+    def __init__(self, inner: Any):
+        self._inner = inner
+        self.chat = _Chat(_Completions(inner.chat.completions))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+class Replay:
+    """A recorded execution's LLM calls, handed out to the requests a replay makes."""
+
+    def __init__(self, recorded: Dict[str, Any]):
+        self.calls = recorded.get("llm") or []
+        self.used = set()
+
+    def take(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The recorded call answering `request`: same prompt, else same prompt template, else the next in order."""
+        key, template = request_key(request), template_key(request)
+        unused = [i for i in range(len(self.calls)) if i not in self.used]
+        for how, fits in (("exact", lambda c: c.get("key") == key),
+                          ("template", lambda c: c.get("template") == template),
+                          ("order", lambda c: True)):
+            for i in unused:
+                if fits(self.calls[i]):
+                    self.used.add(i)
+                    metrics.inc("replay_llm_match", how=how)
+                    return self.calls[i]
+        metrics.inc("replay_llm_match", how="missing")
+        return None
+
+    def start(self) -> None:
+        """Answer the LLM requests of the current task from this recording (call inside the task running it)."""
+        _replay.set(self)
+
+class _ReplayCompletions:
+    def __init__(self, latency_scale: float):
+        self.latency_scale = latency_scale
+
+    async def create(self, **request) -> Any:
+        replay = _replay.get()
+        call = replay.take(request) if replay is not None else None
+        if call is None:
+            raise RuntimeError("No recorded LLM response left for this request")
+        # Hold the call for as long as the recorded one took (scaled), then answer as it did
+        await asyncio.sleep(call.get("latency_ms", 0) * self.latency_scale / 1000)
+        if call.get("error"):
+            raise RuntimeError(call["error"])
+        return ChatCompletion.model_validate(call["response"])
+
+class ReplayClient:
+    """Stands in for AsyncOpenAI, answering from recorded calls at their recorded latency times `latency_scale`."""
+
+    def __init__(self, latency_scale: float = 1.0):
+        self.chat = _Chat(_ReplayCompletions(latency_scale))
+
+def load_cassette(path: Path) -> List[Dict[str, Any]]:
+    """Recorded executions in a cassette file."""
+    with open(path, "rb") as f:
+        return [loads(line) for line in f if line.strip()]
+
+# Shared recorder for the process
+recorder = Recorder()
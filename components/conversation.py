@@ -0,0 +1,183 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict, deque
+from datetime import datetime
+import asyncio
+import os
+import uuid
+import asyncpg
+
+# Number of recent turns sent to the generator
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", 5))
+
+# Number of active chats whose recent turns are kept in memory
+RECENT_CHATS_CACHE_SIZE = int(os.getenv("RECENT_CHATS_CACHE_SIZE", 1000))
+
+class ChatState:
+    """Cached view of one chat: recent turns plus its rolling summary."""
+    __slots__ = ("turns", "total", "summary", "summarized_count", "summarized_through")
+
+    def __init__(self, turns: deque, total: int, summary: str = "", summarized_count: int = 0,
+                 summarized_through: Optional[datetime] = None):
+        self.turns = turns
+        self.total = total
+        self.summary = summary
+        self.summarized_count = summarized_count
+        self.summarized_through = summarized_through
+
+    @property
+    def unsummarized(self) -> int:
+        """Turns that have left the recent window but are not folded into the summary yet."""
+        return max(0, self.total - len(self.turns) - self.summarized_count)
+
+class ConversationStore:
+    """Persists chat turns and serves the last N turns per chat from an in-memory cache.
+
+    Chats are scoped to the user who created them: state is cached per (user_id, chat_id), and loads and
+    writes for a chat owned by someone else see nothing and store nothing.
+    """
+
+    def __init__(self, db_pool: asyncpg.Pool, window: int = HISTORY_WINDOW, max_chats: int = RECENT_CHATS_CACHE_SIZE):
+        self.db = db_pool
+        self.window = window
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[Tuple[str, str], ChatState]" = OrderedDict()
+        self._pending = set()
+
+    async def load_recent(self, chat_id: str, user_id: str) -> List[Dict[str, str]]:
+        """Return the last `window` turns of a chat, oldest first."""
+        state = await self.load_state(chat_id, user_id)
+        return list(state.turns) if state else []
+
+    async def load_summary(self, chat_id: str, user_id: str) -> str:
+        """Return the rolling summary of turns older than the recent window."""
+        state = await self.load_state(chat_id, user_id)
+        return state.summary if state else ""
+
+    def cached_state(self, chat_id: str, user_id: str) -> Optional[ChatState]:
+        return self._chats.get((str(user_id), chat_id))
+
+    async def load_state(self, chat_id: str, user_id: str) -> Optional[ChatState]:
+        """Return the cached chat state, loading it from the database on a miss."""
+        key = (str(user_id), chat_id)
+        state = self._chats.get(key)
+        if state is not None:
+            self._chats.move_to_end(key)
+            return state
+
+        try:
+            async with self.db.acquire() as conn:
+                chat = await conn.fetchrow("""
+                    SELECT
+                        COALESCE(summary, '') AS summary,
+                        summarized_count,
+                        summarized_through,
+                        (SELECT count(*) FROM messages WHERE chat_id = $1) AS total
+                    FROM chats
+                    WHERE id = $1 AND user_id = $2
+                """, chat_id, user_id)
+                rows = await conn.fetch("""
+                    SELECT m.role, m.content
+                    FROM messages m
+                    JOIN chats c ON c.id = m.chat_id
+                    WHERE m.chat_id = $1 AND c.user_id = $2
+                    ORDER BY m.created_at DESC
+                    LIMIT $3
+                """, chat_id, user_id, self.window)
+        except Exception as e:
+            print(f"Error loading conversation {chat_id}: {str(e)}")
+            return None
+
+        turns = deque(
+            ({"role": r["role"], "content": r["content"]} for r in reversed(rows)),
+            maxlen=self.window
+        )
+        if chat:
+            state = ChatState(turns, chat["total"], chat["summary"], chat["summarized_count"], chat["summarized_through"])
+        else:
+            state = ChatState(turns, len(turns))
+        self._remember(key, state)
+        return state
+
+    def record_turns(self, chat_id: str, user_id: str, turns: List[Dict[str, Any]]) -> None:
+        """Add turns to the cache now and persist them in the background.
+
+        Each turn has `role` and `content`, and optionally `id` and `created_at`.
+        """
+        key = (str(user_id), chat_id)
+        state = self._chats.get(key)
+        if state is not None:
+            state.turns.extend({"role": t["role"], "content": t["content"]} for t in turns)
+            state.total += len(turns)
+            self._chats.move_to_end(key)
+
+        task = asyncio.create_task(self._persist(chat_id, user_id, turns))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def fetch_unsummarized(self, chat_id: str, state: ChatState) -> List[asyncpg.Record]:
+        """Fetch, oldest first, the turns that dropped out of the window since the last summary."""
+        async with self.db.acquire() as conn:
+            return await conn.fetch("""
+                SELECT role, content, created_at
+                FROM messages
+                WHERE chat_id = $1
+                  AND ($2::timestamp IS NULL OR created_at > $2)
+                ORDER BY created_at
+                LIMIT $3
+            """, chat_id, state.summarized_through, state.unsummarized)
+
+    async def save_summary(self, chat_id: str, user_id: str, summary: str, folded: int, through: datetime) -> None:
+        """Store an updated summary covering `folded` more turns up to `through`."""
+        async with self.db.acquire() as conn:
+            await conn.execute("""
+                UPDATE chats
+                SET summary = $2,
+                    summarized_count = summarized_count + $3,
+                    summarized_through = $4
+                WHERE id = $1 AND user_id = $5
+            """, chat_id, summary, folded, through, user_id)
+
+        state = self._chats.get((str(user_id), chat_id))
+        if state is not None:
+            state.summary = summary
+            state.summarized_count += folded
+            state.summarized_through = through
+
+    async def _persist(self, chat_id: str, user_id: str, turns: List[Dict[str, Any]]) -> None:
+        try:
+            async with self.db.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("""
+                        INSERT INTO chats (id, user_id)
+                        VALUES ($1, $2)
+                        ON CONFLICT (id) DO NOTHING
+                    """, chat_id, user_id)
+                    # The chat may already exist under another user; never add turns to it
+                    owned = await conn.fetchval("SELECT user_id = $2 FROM chats WHERE id = $1", chat_id, user_id)
+                    if not owned:
+                        self._chats.pop((str(user_id), chat_id), None)
+                        print(f"Error saving conversation {chat_id}: chat belongs to another user")
+                        return
+                    await conn.executemany("""
+                        INSERT INTO messages (id, chat_id, role, content, created_at)
+                        VALUES ($1, $2, $3, $4, $5)
+                    """, [
+                        (
+                            t.get("id") or str(uuid.uuid4()),
+                            chat_id,
+                            t["role"],
+                            t["content"],
+                            t.get("created_at") or datetime.now()
+                        )
+                        for t in turns
+                    ])
+        except Exception as e:
+            # Drop the cached state so the next load re-reads what was actually stored
+            self._chats.pop((str(user_id), chat_id), None)
+            print(f"Error saving conversation {chat_id}: {str(e)}")
+
+    def _remember(self, key: Tuple[str, str], state: ChatState) -> None:
+        self._chats[key] = state
+        self._chats.move_to_end(key)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
@@ -0,0 +1,232 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+import asyncio
+import os
+import time
+
+import asyncpg
+
+from .cassette import log_query, recorder
+from .metrics import metrics
+from .pool import DB_POOL_IDLE_SECONDS, AdaptivePool, application_name
+from .serialization import dumps_str, loads
+
+# Time every statement into db_statement_ms, labelled by the start of its SQL
+DB_STATEMENT_TIMINGS = os.getenv("DB_STATEMENT_TIMINGS", "true").lower() == "true"
+
+# Distinct statements given their own label; later ones are counted as "other"
+DB_STATEMENT_LABELS = int(os.getenv("DB_STATEMENT_LABELS", 200))
+
+_statement_labels: Dict[str, str] = {}
+
+def statement_label(query: str) -> str:
+    """Short, stable label for a statement: its first 60 characters with whitespace collapsed."""
+    label = _statement_labels.get(query)
+    if label is None:
+        if len(_statement_labels) >= DB_STATEMENT_LABELS:
+            return "other"
+        label = _statement_labels[query] = " ".join(query.split())[:60]
+    return label
+
+def log_statement(record: Any) -> None:
+    """asyncpg query logger: per-statement timings and errors."""
+    label = statement_label(record.query)
+    metrics.observe("db_statement_ms", record.elapsed * 1000, statement=label)
+    if record.exception is not None:
+        metrics.inc("db_statement_errors", statement=label, error=type(record.exception).__name__)
+
+
+async def register_json_codecs(conn: asyncpg.Connection) -> None:
+    """Decode json/jsonb columns straight into Python objects (and encode them back)."""
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(
+            type_name,
+            encoder=dumps_str,
+            decoder=loads,
+            schema="pg_catalog"
+        )
+
+
+async def init_connection(conn: asyncpg.Connection) -> None:
+    await register_json_codecs(conn)
+    if DB_STATEMENT_TIMINGS:
+        conn.add_query_logger(log_statement)
+    # Time queries into the cassette of the execution running them
+    if recorder.enabled:
+        conn.add_query_logger(log_query)
+
+
+async def create_pool(database_url: str, ssl: Optional[Any] = None, adaptive: bool = False, name: str = "main",
+                      **kwargs) -> asyncpg.Pool:
+    """Create an asyncpg pool with the shared JSON codecs registered on every connection.
+
+    With `adaptive`, max_size is the upper bound of an AdaptivePool sized by acquire waits (see components/pool.py).
+    """
+    if adaptive:
+        kwargs.setdefault("max_inactive_connection_lifetime", DB_POOL_IDLE_SECONDS)
+        kwargs["server_settings"] = {"application_name": application_name(name), **kwargs.get("server_settings", {})}
+    pool = await asyncpg.create_pool(
+        database_url,
+        ssl=ssl,
+        init=init_connection,
+        **kwargs
+    )
+    return AdaptivePool(pool, name).start() if adaptive else pool
+
+
+# Read replicas: comma-separated DSNs; reads use them when set, writes always go to the primary
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# After a user's write, their reads stay on the primary for this long, or until a replica has replayed it
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+# Seconds between replica health/LSN checks, and replay lag beyond which a replica is skipped
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", 1))
+REPLICA_MAX_LAG_BYTES = int(os.getenv("REPLICA_MAX_LAG_BYTES", 16 * 1024 * 1024))
+
+# Longest a read waits for a replica connection before falling back to the primary
+REPLICA_ACQUIRE_TIMEOUT = float(os.getenv("REPLICA_ACQUIRE_TIMEOUT", 0.5))
+
+# WAL positions as byte offsets, so they compare as plain integers
+PRIMARY_LSN_QUERY = "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')::bigint"
+REPLAY_LSN_QUERY = "SELECT pg_is_in_recovery() AS standby, pg_wal_lsn_diff(pg_last_wal_replay_lsn(), '0/0')::bigint AS lsn"
+
+# Errors that mean the replica itself is unusable (as opposed to a bad query)
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+                     asyncpg.CannotConnectNowError, asyncpg.TooManyConnectionsError)
+
+class Replica:
+    """One read replica's pool and its last observed health and replay position."""
+
+    def __init__(self, name: str, pool: asyncpg.Pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False
+        self.replay_lsn = 0
+        self.lag_bytes = 0
+
+class ReplicaRouter:
+    """Sends reads to healthy replicas and writes to the primary, with read-your-writes per user.
+
+    Without replicas every read simply uses the primary pool.
+    """
+
+    def __init__(self, primary: asyncpg.Pool, replicas: Sequence[Replica] = (),
+                 sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        # user_id -> (time of their last write, primary LSN right after it)
+        self._written: Dict[str, Tuple[float, int]] = {}
+        self._next = 0
+        self._task = None
+
+    async def start(self) -> None:
+        if not self.replicas:
+            return
+        await self.check()
+        self._task = asyncio.create_task(self._check_loop())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for replica in self.replicas:
+            await replica.pool.close()
+
+    def choose(self, user_id: Optional[str]) -> Optional[Replica]:
+        """Replica to read from for this user, or None for the primary."""
+        candidates = [r for r in self.replicas if r.healthy]
+        if not candidates:
+            return None
+
+        written = self._written.get(user_id) if user_id else None
+        if written is not None:
+            written_at, lsn = written
+            caught_up = [r for r in candidates if r.replay_lsn >= lsn]
+            if len(caught_up) == len(candidates) or time.monotonic() - written_at > self.sticky_seconds:
+                # Every replica has replayed the write, or the window has passed
+                self._written.pop(user_id, None)
+            elif caught_up:
+                candidates = caught_up
+            else:
+                return None
+
+        self._next = (self._next + 1) % len(candidates)
+        return candidates[self._next]
+
+    async def run_read(self, user_id: Optional[str], query: Callable[[asyncpg.Connection, bool], Awaitable[Any]]) -> Any:
+        """Run `query(conn, on_primary)` on a replica when one fits, else (or if it fails) on the primary."""
+        replica = self.choose(user_id)
+        if replica is not None:
+            try:
+                async with replica.pool.acquire(timeout=REPLICA_ACQUIRE_TIMEOUT) as conn:
+                    result = await query(conn, False)
+                metrics.inc("db_reads", source="replica")
+                return result
+            except CONNECTION_ERRORS as e:
+                print(f"Error reading from replica {replica.name}: {str(e)}")
+                replica.healthy = False
+                metrics.inc("db_reads_failover", reason="unavailable")
+            except asyncpg.SerializationError:
+                # Cancelled by a conflict with WAL replay; the primary has no such conflict
+                metrics.inc("db_reads_failover", reason="recovery_conflict")
+
+        async with self.primary.acquire() as conn:
+            result = await query(conn, True)
+        metrics.inc("db_reads", source="primary")
+        return result
+
+    async def mark_written(self, conn: asyncpg.Connection, user_id: str) -> None:
+        """Pin a user's reads to the primary until replicas replay their latest (committed) write."""
+        if not self.replicas:
+            return
+        lsn = await conn.fetchval(PRIMARY_LSN_QUERY)
+        self._written[user_id] = (time.monotonic(), lsn)
+        # Forget users whose window has passed
+        if len(self._written) > 10000:
+            cutoff = time.monotonic() - self.sticky_seconds
+            self._written = {k: v for k, v in self._written.items() if v[0] >= cutoff}
+
+    async def check(self) -> None:
+        """Refresh each replica's replay position and health."""
+        try:
+            async with self.primary.acquire() as conn:
+                primary_lsn = await conn.fetchval(PRIMARY_LSN_QUERY)
+        except Exception as e:
+            print(f"Error reading primary LSN: {str(e)}")
+            primary_lsn = None
+
+        for replica in self.replicas:
+            try:
+                async with replica.pool.acquire(timeout=REPLICA_ACQUIRE_TIMEOUT) as conn:
+                    row = await conn.fetchrow(REPLAY_LSN_QUERY)
+                replica.replay_lsn = row["lsn"] or 0
+                replica.lag_bytes = max(0, primary_lsn - replica.replay_lsn) if primary_lsn is not None else 0
+                # A promoted or lagging replica stops taking reads until it is a caught-up standby again
+                replica.healthy = row["standby"] and replica.lag_bytes <= REPLICA_MAX_LAG_BYTES
+            except Exception as e:
+                if replica.healthy:
+                    print(f"Error checking replica {replica.name}: {str(e)}")
+                replica.healthy = False
+            metrics.set("replica_healthy", int(replica.healthy), replica=replica.name)
+            metrics.set("replica_lag_bytes", replica.lag_bytes, replica=replica.name)
+
+    async def _check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(REPLICA_CHECK_SECONDS)
+            await self.check()
+
+async def create_replica_router(primary: asyncpg.Pool, urls: Sequence[str] = DATABASE_REPLICA_URLS,
+                                **kwargs) -> ReplicaRouter:
+    """Router over `primary` plus a pool per replica DSN (replicas unreachable at startup are left out)."""
+    replicas = []
+    for url in urls:
+        name = urlparse(url).hostname or url
+        try:
+            replicas.append(Replica(name, await create_pool(url, name=f"replica:{name}", **kwargs)))
+        except Exception as e:
+            print(f"Error connecting to replica {name}: {str(e)}")
+    router = ReplicaRouter(primary, replicas)
+    await router.start()
+    return router
@@ -0,0 +1,103 @@
+from typing import Dict, Any, Optional
+import math
+import os
+import time
+
+from .metrics import metrics
+from .routing import RouteDecision, model_registry
+
+# End-to-end budget per message in ms when the client doesn't send one (0 means no deadline)
+PIPELINE_DEADLINE_MS = float(os.getenv("PIPELINE_DEADLINE_MS", 0))
+
+# Latency percentile used to predict how long a phase will take
+DEADLINE_PERCENTILE = float(os.getenv("DEADLINE_PERCENTILE", 90))
+
+# Time kept back for database work, serialization and delivery
+DEADLINE_RESERVE_MS = float(os.getenv("DEADLINE_RESERVE_MS", 300))
+
+# Predictions used until a phase/model has latency samples
+DEFAULT_PHASE_MS = {"listener": 2500.0, "generator": 4000.0, "fused": 5000.0, "adjustor": 1500.0}
+
+def estimate_ms(phase: str, tier: str) -> float:
+    """Predicted latency of an LLM phase on a tier, from the recent latency histogram."""
+    recent = metrics.histogram("llm_latency_ms", phase=phase, model=model_registry.get(phase, tier), route=tier)
+    if recent.samples:
+        return recent.percentile(DEADLINE_PERCENTILE)
+    return DEFAULT_PHASE_MS.get(phase, DEFAULT_PHASE_MS["generator"])
+
+class PhasePlan:
+    """Whether an optional phase runs as routed, on the fast tier, or not at all."""
+    __slots__ = ("action", "route", "reason", "remaining_ms")
+
+    def __init__(self, action: str, route: RouteDecision, reason: str = "", remaining_ms: Optional[float] = None):
+        self.action = action
+        self.route = route
+        self.reason = reason
+        self.remaining_ms = remaining_ms
+
+    def details(self) -> Dict[str, Any]:
+        if self.remaining_ms is None:
+            return {}
+        details = {"deadline_remaining_ms": round(self.remaining_ms, 1)}
+        if self.action == "downgrade":
+            details["deadline_downgrade"] = self.reason
+        return details
+
+class Deadline:
+    """A message's end-to-end latency budget."""
+    __slots__ = ("expires_at",)
+
+    def __init__(self, expires_at: Optional[float] = None):
+        # time.monotonic() value, or None for no deadline
+        self.expires_at = expires_at
+
+    @classmethod
+    def within(cls, budget_ms: Optional[float]) -> "Deadline":
+        """Deadline `budget_ms` from now (PIPELINE_DEADLINE_MS when not given).
+
+        Raises ValueError if `budget_ms` is not a finite, non-negative number of milliseconds.
+        """
+        try:
+            budget_ms = float(budget_ms or PIPELINE_DEADLINE_MS)
+        except (TypeError, ValueError):
+            raise ValueError(f"deadline_ms must be a number of milliseconds, got {budget_ms!r}") from None
+        if not math.isfinite(budget_ms) or budget_ms < 0:
+            raise ValueError(f"deadline_ms must be a number of milliseconds, got {budget_ms!r}")
+        return cls(time.monotonic() + budget_ms / 1000 if budget_ms > 0 else None)
+
+    @classmethod
+    def for_message(cls, message_data: Dict[str, Any]) -> "Deadline":
+        """From the deadline the server set on arrival, else the client's `deadline_ms`, else the default."""
+        if message_data.get("deadline_at"):
+            return cls(message_data["deadline_at"])
+        return cls.within(message_data.get("deadline_ms"))
+
+    def remaining_ms(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return (self.expires_at - time.monotonic()) * 1000
+
+    def plan(self, phase: str, route: RouteDecision, after_ms: float = 0.0) -> PhasePlan:
+        """Decide how to run an optional phase so it and the `after_ms` of work still to come fit the budget."""
+        remaining = self.remaining_ms()
+        if remaining is None:
+            return PhasePlan("run", route)
+
+        available = remaining - after_ms - DEADLINE_RESERVE_MS
+        needed = estimate_ms(phase, route.tier)
+        if needed <= available:
+            plan = PhasePlan("run", route, remaining_ms=remaining)
+        elif route.tier != "fast" and estimate_ms(phase, "fast") <= available:
+            plan = PhasePlan("downgrade", RouteDecision("fast", f"deadline: {needed:.0f} ms on {route.tier} "
+                                                                f"exceeds {available:.0f} ms left"),
+                             f"{needed:.0f} ms expected on {route.tier}, {available:.0f} ms left", remaining)
+        else:
+            plan = PhasePlan("skip", route, f"{needed:.0f} ms expected, {max(available, 0):.0f} ms left", remaining)
+        metrics.inc("deadline_plan", phase=phase, action=plan.action)
+        return plan
+
+    def record_outcome(self) -> None:
+        """Count whether the message finished within its budget."""
+        remaining = self.remaining_ms()
+        if remaining is not None:
+            metrics.inc("deadline_outcome", met=remaining >= 0)
@@ -0,0 +1,191 @@
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+# Immutable, slotted models for insights and user context.
+#
+# Instances are built once (from query rows or parsed LLM output) and then shared as-is
+# between pipeline phases and caches; nothing copies them. They are turned into plain
+# JSON only at the API edge, where the serializers call `to_dict()`.
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else ""
+
+def _items(value: Any) -> list:
+    return value if isinstance(value, list) else []
+
+@dataclass(frozen=True, slots=True)
+class Person:
+    name: str
+    relationship: str = ""
+    notes: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "relationship": self.relationship, "notes": self.notes}
+
+@dataclass(frozen=True, slots=True)
+class Interest:
+    name: str
+    summary: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "summary": self.summary}
+
+@dataclass(frozen=True, slots=True)
+class Story:
+    title: str
+    description: str = ""
+    location: str = ""
+    timestamp: Optional[datetime] = None
+    people: Tuple[str, ...] = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "description": self.description,
+            "location": self.location,
+            "timestamp": self.timestamp,
+            "people": self.people
+        }
+
+@dataclass(frozen=True, slots=True)
+class Profile:
+    name: str
+    personality_traits: Any = field(default_factory=dict)
+    communication_style: Any = field(default_factory=dict)
+    demographic: Any = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "personality_traits": self.personality_traits,
+            "communication_style": self.communication_style,
+            "demographic": self.demographic
+        }
+
+@dataclass(frozen=True, slots=True)
+class Insights:
+    """What the listener (or fused call) extracted from one message."""
+    people: Tuple[Person, ...] = ()
+    interests: Tuple[Interest, ...] = ()
+    personality_traits: Tuple[str, ...] = ()
+    communication_style: Dict[str, Any] = field(default_factory=dict)
+    stories: Tuple[Story, ...] = ()
+
+    @classmethod
+    def from_llm(cls, data: Any) -> "Insights":
+        """Build from the model's JSON, skipping malformed entries instead of failing the turn."""
+        if not isinstance(data, dict):
+            return EMPTY_INSIGHTS
+        style = data.get("communication_style")
+        return cls(
+            # The extraction prompt asks for {"name", "context"}; context is stored as notes
+            people=tuple(
+                Person(p["name"], _text(p.get("relationship")), _text(p.get("notes") or p.get("context")))
+                for p in _items(data.get("people")) if isinstance(p, dict) and isinstance(p.get("name"), str)
+            ),
+            interests=tuple(
+                Interest(i["name"], _text(i.get("summary")))
+                for i in _items(data.get("interests")) if isinstance(i, dict) and isinstance(i.get("name"), str)
+            ),
+            personality_traits=tuple(t for t in _items(data.get("personality_traits")) if isinstance(t, str)),
+            communication_style=style if isinstance(style, dict) else {},
+            stories=tuple(
+                Story(s["title"], _text(s.get("description")), _text(s.get("location")),
+                      people=tuple(n for n in _items(s.get("people")) if isinstance(n, str)))
+                for s in _items(data.get("stories")) if isinstance(s, dict) and isinstance(s.get("title"), str)
+            )
+        )
+
+    @property
+    def has_content(self) -> bool:
+        """Whether anything worth saving was found (style aspects alone don't count)."""
+        return bool(self.people or self.interests or self.stories or self.personality_traits)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "people": self.people,
+            "interests": self.interests,
+            "personality_traits": self.personality_traits,
+            "communication_style": self.communication_style,
+            "stories": self.stories
+        }
+
+@dataclass(frozen=True, slots=True)
+class Neighbourhood:
+    """Graph neighbours of the entities mentioned in the current message, best first."""
+    people: Tuple[Person, ...] = ()
+    interests: Tuple[Interest, ...] = ()
+    stories: Tuple[Story, ...] = ()
+
+    def __bool__(self) -> bool:
+        return bool(self.people or self.interests or self.stories)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"people": self.people, "interests": self.interests, "stories": self.stories}
+
+@dataclass(frozen=True, slots=True)
+class UserContext:
+    """A user's profile and recent interests, people and stories, plus the chat's rolling summary."""
+    profile: Optional[Profile] = None
+    interests: Tuple[Interest, ...] = ()
+    people: Tuple[Person, ...] = ()
+    stories: Tuple[Story, ...] = ()
+    conversation_summary: str = ""
+    neighbourhood: Optional[Neighbourhood] = None
+    version: Optional[str] = None
+
+    @classmethod
+    def from_records(cls, user, interests, people, stories, version: Optional[str] = None) -> "UserContext":
+        """Build straight from the fetcher's asyncpg rows."""
+        if user is None:
+            return EMPTY_CONTEXT
+        return cls(
+            profile=Profile(user["name"], user["personality_traits"], user["communication_style"], user["demographic"]),
+            interests=tuple(Interest(row["name"], row["summary"] or "") for row in interests),
+            people=tuple(Person(row["name"], row["relationship"] or "", row["notes"] or "") for row in people),
+            stories=tuple(Story(row["title"], row["description"] or "", row["location"] or "", row["timestamp"])
+                          for row in stories),
+            version=version
+        )
+
+    @classmethod
+    def from_snapshot(cls, document: Dict[str, Any], version: Optional[int] = None) -> "UserContext":
+        """Build from a `user_context_snapshot` document (the same fields, as JSON)."""
+        profile = document.get("profile")
+        if not profile:
+            return EMPTY_CONTEXT
+        return cls(
+            profile=Profile(profile["name"], profile.get("personality_traits") or {},
+                            profile.get("communication_style") or {}, profile.get("demographic") or {}),
+            interests=tuple(Interest(i["name"], i.get("summary") or "") for i in document.get("interests", ())),
+            people=tuple(Person(p["name"], p.get("relationship") or "", p.get("notes") or "")
+                         for p in document.get("people", ())),
+            stories=tuple(Story(s["title"], s.get("description") or "", s.get("location") or "",
+                                datetime.fromisoformat(s["timestamp"]) if s.get("timestamp") else None)
+                          for s in document.get("stories", ())),
+            version=None if version is None else str(version)
+        )
+
+    @property
+    def communication_style(self) -> Any:
+        return self.profile.communication_style if self.profile else {}
+
+    def with_summary(self, summary: str) -> "UserContext":
+        """Same context with a chat summary attached; the entity tuples are shared, not copied."""
+        return replace(self, conversation_summary=summary)
+
+    def with_neighbourhood(self, neighbourhood: Neighbourhood) -> "UserContext":
+        return replace(self, neighbourhood=neighbourhood)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """User-level context only, as the API and the prompt cache key see it (no per-message parts)."""
+        return {
+            "profile": self.profile,
+            "interests": self.interests,
+            "people": self.people,
+            "stories": self.stories
+        }
+
+EMPTY_INSIGHTS = Insights()
+EMPTY_CONTEXT = UserContext()
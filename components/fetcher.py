@@ -1,131 +1,428 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence
 import asyncpg
+import os
 from datetime import datetime
-import json
+
+from .database import ReplicaRouter
+from .entities import EMPTY_CONTEXT, Insights, Interest, Neighbourhood, Person, Story, UserContext
+from .metrics import metrics
+from .resolver import EntityResolver
+from .sharding import SHARD_MAIN, Shard, ShardRouter, UserMoved
+
+# Graph expansion around the entities mentioned in a message: hops to walk (0 disables it),
+# neighbours followed per node and per edge type, and nodes returned
+GRAPH_MAX_HOPS = int(os.getenv("GRAPH_MAX_HOPS", 2))
+GRAPH_FANOUT = int(os.getenv("GRAPH_FANOUT", 5))
+GRAPH_MAX_NODES = int(os.getenv("GRAPH_MAX_NODES", 12))
+
+# Read context from the per-user snapshot table (one primary-key lookup) instead of the base tables
+CONTEXT_SNAPSHOTS = os.getenv("CONTEXT_SNAPSHOTS", "true").lower() == "true"
+
+# Read queries on the hot path, shared with the startup warm-up
+PROFILE_QUERY = """
+    SELECT 
+        name,
+        COALESCE(personality_traits, '{}'::jsonb) as personality_traits,
+        COALESCE(communication_style, '{}'::jsonb) as communication_style,
+        COALESCE(demographic, '{}'::jsonb) as demographic
+    FROM users 
+    WHERE id = $1
+"""
+
+INTERESTS_QUERY = """
+    SELECT name, summary
+    FROM interests
+    WHERE user_id = $1
+"""
+
+PEOPLE_QUERY = """
+    SELECT name, relationship, notes
+    FROM people
+    WHERE user_id = $1
+"""
+
+STORIES_QUERY = """
+    SELECT title, description, location, timestamp
+    FROM stories
+    WHERE user_id = $1
+    ORDER BY timestamp DESC, title
+    LIMIT 5
+"""
+
+PERSON_ID_QUERY = "SELECT id FROM people WHERE user_id = $1 AND name = $2"
+
+SNAPSHOT_QUERY = "SELECT version, document FROM user_context_snapshot WHERE user_id = $1"
+
+# Serializes writers per user, so each snapshot rebuild sees every earlier committed write
+# (and makes writers wait out a shard move of the user)
+LOCK_USER_QUERY = "SELECT id FROM users WHERE id = $1 FOR UPDATE"
+
+# Sections of a snapshot document, shared by the full rebuild and the per-save patch below;
+# `u` is the users row and $1 the user id
+SNAPSHOT_PROFILE = """jsonb_build_object(
+                'name', u.name,
+                'personality_traits', COALESCE(u.personality_traits, '{}'::jsonb),
+                'communication_style', COALESCE(u.communication_style, '{}'::jsonb),
+                'demographic', COALESCE(u.demographic, '{}'::jsonb)
+            )"""
+SNAPSHOT_INTEREST = "jsonb_build_object('name', i.name, 'summary', i.summary)"
+SNAPSHOT_PERSON = "jsonb_build_object('name', p.name, 'relationship', p.relationship, 'notes', p.notes)"
+SNAPSHOT_STORIES = """COALESCE((
+                SELECT jsonb_agg(jsonb_build_object('title', s.title, 'description', s.description,
+                                                    'location', s.location, 'timestamp', s.timestamp)
+                                 ORDER BY s.timestamp DESC, s.title)
+                FROM (
+                    SELECT title, description, location, timestamp
+                    FROM stories
+                    WHERE user_id = $1
+                    ORDER BY timestamp DESC, title
+                    LIMIT 5
+                ) s
+            ), '[]'::jsonb)"""
+
+# Rebuilds a user's snapshot from the base tables in one statement, with the same rows the
+# read queries above return (interests and people ordered by name, the 5 latest stories)
+SNAPSHOT_REFRESH_QUERY = f"""
+    INSERT INTO user_context_snapshot (user_id, version, document, updated_at)
+    SELECT
+        u.id,
+        1,
+        jsonb_build_object(
+            'profile', {SNAPSHOT_PROFILE},
+            'interests', COALESCE((
+                SELECT jsonb_agg({SNAPSHOT_INTEREST} ORDER BY i.name)
+                FROM interests i
+                WHERE i.user_id = u.id
+            ), '[]'::jsonb),
+            'people', COALESCE((
+                SELECT jsonb_agg({SNAPSHOT_PERSON} ORDER BY p.name)
+                FROM people p
+                WHERE p.user_id = u.id
+            ), '[]'::jsonb),
+            'stories', {SNAPSHOT_STORIES}
+        ),
+        NOW()
+    FROM users u
+    WHERE u.id = $1
+    ON CONFLICT (user_id) DO UPDATE
+    SET version = user_context_snapshot.version + 1,
+        document = EXCLUDED.document,
+        updated_at = EXCLUDED.updated_at
+    RETURNING version, document
+"""
+
+# Applies one save to an existing snapshot without re-aggregating the user's whole graph: the profile
+# ($2) and the 5 latest stories ($5) are re-read when the save touched them, and only the interests ($3)
+# and people ($4) saved by name are replaced in their lists. Returns no row if the user has no snapshot yet.
+SNAPSHOT_PATCH_QUERY = f"""
+    UPDATE user_context_snapshot snap
+    SET version = snap.version + 1,
+        updated_at = NOW(),
+        document = snap.document
+            || CASE WHEN $2 THEN (
+                SELECT jsonb_build_object('profile', {SNAPSHOT_PROFILE}) FROM users u WHERE u.id = $1
+            ) ELSE '{{}}'::jsonb END
+            || CASE WHEN cardinality($3::text[]) > 0 THEN jsonb_build_object('interests', (
+                SELECT COALESCE(jsonb_agg(merged.entry ORDER BY merged.entry->>'name'), '[]'::jsonb)
+                FROM (
+                    SELECT kept.entry
+                    FROM jsonb_array_elements(snap.document->'interests') AS kept(entry)
+                    WHERE NOT (kept.entry->>'name' = ANY($3::text[]))
+                    UNION ALL
+                    SELECT {SNAPSHOT_INTEREST} FROM interests i WHERE i.user_id = $1 AND i.name = ANY($3::text[])
+                ) merged(entry)
+            )) ELSE '{{}}'::jsonb END
+            || CASE WHEN cardinality($4::text[]) > 0 THEN jsonb_build_object('people', (
+                SELECT COALESCE(jsonb_agg(merged.entry ORDER BY merged.entry->>'name'), '[]'::jsonb)
+                FROM (
+                    SELECT kept.entry
+                    FROM jsonb_array_elements(snap.document->'people') AS kept(entry)
+                    WHERE NOT (kept.entry->>'name' = ANY($4::text[]))
+                    UNION ALL
+                    SELECT {SNAPSHOT_PERSON} FROM people p WHERE p.user_id = $1 AND p.name = ANY($4::text[])
+                ) merged(entry)
+            )) ELSE '{{}}'::jsonb END
+            || CASE WHEN $5 THEN jsonb_build_object('stories', {SNAPSHOT_STORIES}) ELSE '{{}}'::jsonb END
+    WHERE snap.user_id = $1
+    RETURNING version
+"""
+
+# Walks story_people and person_interests from the seed people/interests in one recursive query.
+# Each hop follows at most $5 edges per node and edge type (most recent stories first); a node's
+# score is the sum of 0.5^depth over every path reaching it, so entities tied to several seeds rank first.
+NEIGHBOURHOOD_QUERY = """
+    WITH RECURSIVE seeds AS (
+        SELECT 'person'::text AS kind, id FROM people WHERE user_id = $1 AND name = ANY($2::text[])
+        UNION ALL
+        SELECT 'interest'::text, id FROM interests WHERE user_id = $1 AND name = ANY($3::text[])
+    ),
+    walk(kind, id, depth, score) AS (
+        SELECT kind, id, 0, 1.0::float8 FROM seeds
+        UNION ALL
+        SELECT n.kind, n.id, w.depth + 1, w.score * 0.5
+        FROM walk w
+        CROSS JOIN LATERAL (
+            (SELECT 'story'::text, sp.story_id
+             FROM story_people sp JOIN stories s ON s.id = sp.story_id
+             WHERE w.kind = 'person' AND sp.person_id = w.id
+             ORDER BY s.timestamp DESC NULLS LAST LIMIT $5)
+            UNION ALL
+            (SELECT 'interest'::text, pi.interest_id
+             FROM person_interests pi
+             WHERE w.kind = 'person' AND pi.person_id = w.id LIMIT $5)
+            UNION ALL
+            (SELECT 'person'::text, sp.person_id
+             FROM story_people sp
+             WHERE w.kind = 'story' AND sp.story_id = w.id LIMIT $5)
+            UNION ALL
+            (SELECT 'person'::text, pi.person_id
+             FROM person_interests pi
+             WHERE w.kind = 'interest' AND pi.interest_id = w.id LIMIT $5)
+        ) AS n(kind, id)
+        WHERE w.depth < $4
+    ),
+    ranked AS (
+        SELECT kind, id, min(depth) AS depth, sum(score) AS score
+        FROM walk
+        GROUP BY kind, id
+        HAVING min(depth) > 0
+        ORDER BY sum(score) DESC, min(depth)
+        LIMIT $6
+    )
+    SELECT r.kind, r.depth, r.score,
+           COALESCE(p.name, i.name, s.title) AS name,
+           p.relationship, p.notes, i.summary, s.description, s.location, s.timestamp
+    FROM ranked r
+    LEFT JOIN people p ON r.kind = 'person' AND p.id = r.id
+    LEFT JOIN interests i ON r.kind = 'interest' AND i.id = r.id
+    LEFT JOIN stories s ON r.kind = 'story' AND s.id = r.id
+    ORDER BY r.score DESC, r.depth, name
+"""
+
+# (query, placeholder args) run once per pooled connection at startup so the
+# statements are parsed and cached before real traffic arrives
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+HOT_READ_QUERIES = [
+    (PROFILE_QUERY, (NIL_UUID,)),
+    (INTERESTS_QUERY, (NIL_UUID,)),
+    (PEOPLE_QUERY, (NIL_UUID,)),
+    (STORIES_QUERY, (NIL_UUID,)),
+    (PERSON_ID_QUERY, (NIL_UUID, "")),
+    (SNAPSHOT_QUERY, (NIL_UUID,)),
+    (NEIGHBOURHOOD_QUERY, (NIL_UUID, [], [], GRAPH_MAX_HOPS, GRAPH_FANOUT, GRAPH_MAX_NODES))
+]
 
 class FetcherAndSaver:
-    def __init__(self, db_pool: asyncpg.Pool):
+    def __init__(self, db_pool: asyncpg.Pool, router: Optional[ReplicaRouter] = None,
+                 shards: Optional[ShardRouter] = None):
         self.db = db_pool
+        # Each user's rows live on one shard (main, i.e. db_pool, unless sharding is configured); on it,
+        # reads go through the shard's router (replicas when configured) and writes use its primary pool
+        self.shards = shards or ShardRouter(Shard(SHARD_MAIN, db_pool, router))
+        self.resolver = EntityResolver(db_pool, self.shards)
         
-    async def process(self, message_data: Dict[str, Any], insights: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, message_data: Dict[str, Any], insights: Insights) -> UserContext:
         """Process insights and manage user context."""
         
         # Save new insights
-        await self.save_insights(message_data["user_id"], insights)
+        insights = await self.save_insights(message_data["user_id"], insights)
         
-        # Fetch relevant context
-        context = await self.fetch_context(message_data["user_id"])
+        # Fetch relevant context, expanded around the entities this message mentions
+        context = await self.fetch_context(
+            message_data["user_id"],
+            people=[p.name for p in insights.people] + [n for s in insights.stories for n in s.people],
+            interests=[i.name for i in insights.interests]
+        )
         
         return context
         
-    async def save_insights(self, user_id: str, insights: Dict[str, Any]) -> None:
-        """Save new insights to the database."""
-        async with self.db.acquire() as conn:
-            # Save personality traits and communication style
-            if insights["personality_traits"] or insights["communication_style"]:
-                await conn.execute("""
-                    UPDATE users 
-                    SET personality_traits = COALESCE(personality_traits, '{}'::jsonb) || $1::jsonb,
-                        communication_style = COALESCE(communication_style, '{}'::jsonb) || $2::jsonb
-                    WHERE id = $3
-                """, json.dumps(insights["personality_traits"]), 
-                     json.dumps(insights.get("communication_style", {})),
-                     user_id)
-            
-            # Save interests
-            for interest in insights.get("interests", []):
-                await conn.execute("""
-                    INSERT INTO interests (user_id, name, summary)
-                    VALUES ($1, $2, $3)
-                    ON CONFLICT (user_id, name) DO UPDATE
-                    SET summary = EXCLUDED.summary
-                """, user_id, interest["name"], interest.get("summary", ""))
-            
-            # Save people
-            for person in insights.get("people", []):
-                await conn.execute("""
-                    INSERT INTO people (user_id, name, relationship, notes)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT (user_id, name) DO UPDATE
-                    SET relationship = EXCLUDED.relationship,
-                        notes = COALESCE(people.notes, '') || ' ' || EXCLUDED.notes
-                """, user_id, person["name"], 
-                     person.get("relationship", ""),
-                     person.get("notes", ""))
+    async def save_insights(self, user_id: str, insights: Insights) -> Insights:
+        """Save new insights to the database; returns them with names resolved to the stored rows."""
+        shard = await self.shards.locate(user_id)
+        try:
+            return await self._save_on(shard, user_id, insights)
+        except UserMoved:
+            # Moved to another shard since its placement was cached
+            metrics.inc("shard_retries", op="save")
+            return await self._save_on(await self.shards.locate(user_id, fresh=True), user_id, insights)
+    
+    async def _save_on(self, shard: Shard, user_id: str, insights: Insights) -> Insights:
+        async with shard.pool.acquire() as conn:
+            # Map "sarah", "Sarah Lee" etc. onto existing rows so upserts update instead of inserting
+            insights = await self.resolver.resolve(conn, user_id, insights)
+            if not (insights.has_content or insights.communication_style):
+                return insights
             
-            # Save stories
-            for story in insights.get("stories", []):
-                story_id = await conn.fetchval("""
-                    INSERT INTO stories (user_id, title, description, location, timestamp)
-                    VALUES ($1, $2, $3, $4, $5)
-                    RETURNING id
-                """, user_id, story["title"], 
-                     story["description"],
-                     story.get("location", ""),
-                     datetime.now())
+            async with conn.transaction():
+                locked = await conn.fetchval(LOCK_USER_QUERY, user_id)
+                await self.shards.check_owner(conn, shard, user_id, locked is not None)
+                
+                # Save personality traits and communication style
+                if insights.personality_traits or insights.communication_style:
+                    await conn.execute("""
+                        UPDATE users 
+                        SET personality_traits = COALESCE(personality_traits, '{}'::jsonb) || $1::jsonb,
+                            communication_style = COALESCE(communication_style, '{}'::jsonb) || $2::jsonb
+                        WHERE id = $3
+                    """, insights.personality_traits, 
+                         insights.communication_style,
+                         user_id)
+                
+                # Save interests
+                for interest in insights.interests:
+                    await conn.execute("""
+                        INSERT INTO interests (user_id, name, summary)
+                        VALUES ($1, $2, $3)
+                        ON CONFLICT (user_id, name) DO UPDATE
+                        SET summary = EXCLUDED.summary
+                    """, user_id, interest.name, interest.summary)
                 
-                # Link people to story if mentioned
-                if "people" in story:
-                    for person in story["people"]:
-                        person_id = await conn.fetchval(
-                            "SELECT id FROM people WHERE user_id = $1 AND name = $2",
-                            user_id, person
-                        )
+                # Save people
+                for person in insights.people:
+                    await conn.execute("""
+                        INSERT INTO people (user_id, name, relationship, notes)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (user_id, name) DO UPDATE
+                        SET relationship = COALESCE(NULLIF(EXCLUDED.relationship, ''), people.relationship),
+                            notes = COALESCE(people.notes, '') || ' ' || EXCLUDED.notes
+                    """, user_id, person.name, 
+                         person.relationship,
+                         person.notes)
+                
+                # Save stories
+                for story in insights.stories:
+                    story_id = await conn.fetchval("""
+                        INSERT INTO stories (user_id, title, description, location, timestamp)
+                        VALUES ($1, $2, $3, $4, $5)
+                        RETURNING id
+                    """, user_id, story.title, 
+                         story.description,
+                         story.location,
+                         datetime.now())
+                    
+                    # Link people to story if mentioned
+                    for person in story.people:
+                        person_id = await conn.fetchval(PERSON_ID_QUERY, user_id, person)
                         if person_id:
                             await conn.execute("""
                                 INSERT INTO story_people (story_id, person_id)
                                 VALUES ($1, $2)
                                 ON CONFLICT DO NOTHING
                             """, story_id, person_id)
-    
-    async def fetch_context(self, user_id: str) -> Dict[str, Any]:
-        """Fetch user context including profile, interests, people, and stories."""
-        async with self.db.acquire() as conn:
-            # Fetch user profile
-            user = await conn.fetchrow("""
-                SELECT 
-                    name,
-                    COALESCE(personality_traits, '{}'::jsonb) as personality_traits,
-                    COALESCE(communication_style, '{}'::jsonb) as communication_style,
-                    COALESCE(demographic, '{}'::jsonb) as demographic
-                FROM users 
-                WHERE id = $1
-            """, user_id)
+                
+                # Update the snapshot in the same transaction, so readers never see it lag the base tables;
+                # only the sections this save touched are rebuilt, so the lock isn't held for the whole graph
+                if CONTEXT_SNAPSHOTS:
+                    patched = await conn.fetchval(
+                        SNAPSHOT_PATCH_QUERY, user_id,
+                        bool(insights.personality_traits or insights.communication_style),
+                        [interest.name for interest in insights.interests],
+                        [person.name for person in insights.people],
+                        bool(insights.stories)
+                    )
+                    if patched is None:
+                        # No snapshot yet for this user: build it whole
+                        await conn.execute(SNAPSHOT_REFRESH_QUERY, user_id)
             
-            if not user:
-                return {}
-
-            # Fetch interests
-            interests = await conn.fetch("""
-                SELECT name, summary
-                FROM interests
-                WHERE user_id = $1
-            """, user_id)
-
-            # Fetch people
-            people = await conn.fetch("""
-                SELECT name, relationship, notes
-                FROM people
-                WHERE user_id = $1
-            """, user_id)
-
-            # Fetch stories
-            stories = await conn.fetch("""
-                SELECT title, description, location, timestamp
-                FROM stories
-                WHERE user_id = $1
-                ORDER BY timestamp DESC
-                LIMIT 5
-            """, user_id)
-
-            return {
-                "profile": {
-                    "name": user["name"],
-                    "personality_traits": user["personality_traits"],
-                    "communication_style": user["communication_style"],
-                    "demographic": user["demographic"]
-                },
-                "interests": [dict(i) for i in interests],
-                "people": [dict(p) for p in people],
-                "stories": [dict(s) for s in stories]
-            } 
\ No newline at end of file
+            # Keep this user's reads on the primary until replicas have the write
+            await shard.reads.mark_written(conn, user_id)
+            self.resolver.remember(user_id, insights)
+            return insights
+    
+    async def fetch_context(self, user_id: str, people: Sequence[str] = (), interests: Sequence[str] = ()) -> UserContext:
+        """Fetch user context including profile, interests, people, and stories.
+
+        When `people` or `interests` are given, the graph neighbourhood around them is attached too.
+        Runs on the user's shard, on a read replica when one is configured and has their latest write.
+        """
+        def reader(shard: Shard):
+            async def read(conn: asyncpg.Connection, on_primary: bool) -> UserContext:
+                if CONTEXT_SNAPSHOTS:
+                    context = await self._snapshot_context(conn, shard, user_id, on_primary)
+                else:
+                    context = await self._base_context(conn, user_id)
+                    if await self.shards.placed_elsewhere(conn, shard, user_id):
+                        return EMPTY_CONTEXT
+                if context is EMPTY_CONTEXT:
+                    return context
+                
+                # Expand the knowledge graph around the mentioned entities
+                if (people or interests) and GRAPH_MAX_HOPS > 0:
+                    rows = await conn.fetch(NEIGHBOURHOOD_QUERY, user_id, list(people), list(interests),
+                                            GRAPH_MAX_HOPS, GRAPH_FANOUT, GRAPH_MAX_NODES)
+                    context = context.with_neighbourhood(self._neighbourhood(rows))
+                
+                return context
+            return read
+        
+        shard = await self.shards.locate(user_id)
+        context = await shard.reads.run_read(user_id, reader(shard))
+        if context is EMPTY_CONTEXT and self.shards.enabled:
+            # A cached placement can point at the shard the user just moved off
+            moved_to = await self.shards.locate(user_id, fresh=True)
+            if moved_to is not shard:
+                metrics.inc("shard_retries", op="fetch")
+                context = await moved_to.reads.run_read(user_id, reader(moved_to))
+        return context
+    
+    async def refresh_snapshot(self, conn: asyncpg.Connection, user_id: str) -> UserContext:
+        """Rebuild a user's snapshot from the base tables (for users written outside save_insights).
+
+        Holds the user's row lock like save_insights, so a rebuild can't overwrite a snapshot it committed meanwhile.
+        """
+        async with conn.transaction():
+            await conn.fetchval(LOCK_USER_QUERY, user_id)
+            row = await conn.fetchrow(SNAPSHOT_REFRESH_QUERY, user_id)
+        if not row:
+            return EMPTY_CONTEXT
+        return UserContext.from_snapshot(row["document"], row["version"])
+    
+    async def _snapshot_context(self, conn: asyncpg.Connection, shard: Shard, user_id: str,
+                                on_primary: bool = True) -> UserContext:
+        """Context from the snapshot table; users without one yet get it built on first read."""
+        row = await conn.fetchrow(SNAPSHOT_QUERY, user_id)
+        if row:
+            return UserContext.from_snapshot(row["document"], row["version"])
+        # Moving a user off main drops their snapshot there; don't build a profile-only one in its place
+        if await self.shards.placed_elsewhere(conn, shard, user_id):
+            return EMPTY_CONTEXT
+        # Replicas are read-only, so there the base tables stand in until the primary builds one
+        if not on_primary:
+            return await self._base_context(conn, user_id)
+        return await self.refresh_snapshot(conn, user_id)
+    
+    async def _base_context(self, conn: asyncpg.Connection, user_id: str) -> UserContext:
+        """Context aggregated from the base tables."""
+        # Fetch user profile
+        user = await conn.fetchrow(PROFILE_QUERY, user_id)
+        
+        if not user:
+            return EMPTY_CONTEXT
+
+        # Fetch interests
+        interest_rows = await conn.fetch(INTERESTS_QUERY, user_id)
+
+        # Fetch people
+        people_rows = await conn.fetch(PEOPLE_QUERY, user_id)
+
+        # Fetch stories
+        story_rows = await conn.fetch(STORIES_QUERY, user_id)
+
+        return UserContext.from_records(user, interest_rows, people_rows, story_rows)
+    
+    def mentions_in(self, user_id: str, text: str):
+        """Known people and interests named in `text`, for when no insights are extracted up front."""
+        return self.resolver.find_mentions(user_id, text)
+    
+    @staticmethod
+    def _neighbourhood(rows: List[asyncpg.Record]) -> Neighbourhood:
+        """Group the ranked graph rows (seeds already excluded) by kind, keeping their order."""
+        related = {"person": [], "interest": [], "story": []}
+        for row in rows:
+            if row["kind"] == "person":
+                related["person"].append(Person(row["name"], row["relationship"] or "", row["notes"] or ""))
+            elif row["kind"] == "interest":
+                related["interest"].append(Interest(row["name"], row["summary"] or ""))
+            else:
+                related["story"].append(Story(row["name"], row["description"] or "", row["location"] or "", row["timestamp"]))
+        return Neighbourhood(tuple(related["person"]), tuple(related["interest"]), tuple(related["story"]))
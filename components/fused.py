@@ -0,0 +1,87 @@
+from typing import Dict, Any, Optional, Tuple
+import json
+import re
+import time
+
+from .entities import EMPTY_INSIGHTS, Insights, UserContext
+from .llm import get_client
+from .generator import FALLBACK_REPLY, ResponseGenerator
+from .listener import INSIGHTS_INSTRUCTIONS, INSIGHTS_FORMAT
+from .metrics import metrics
+from .routing import RouteDecision, model_registry, record_completion, supports_json_mode
+from .style import StyleSpec
+
+FUSED_INSTRUCTIONS = f"""Reply to the user's latest message, and in the same answer extract insights from that message.
+
+{INSIGHTS_INSTRUCTIONS}
+
+Return a JSON object with exactly two keys:
+{{
+    "reply": "your reply to the user",
+    "insights": {INSIGHTS_FORMAT}
+}}
+
+Extract only what is explicitly present or strongly implied in the latest message. Do not invent or assume details."""
+
+# Models without JSON mode often wrap the object in a ```json fence
+_FENCE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL | re.IGNORECASE)
+
+def parse_fused(content: str) -> Optional[Tuple[str, Insights]]:
+    """(reply, insights) from a fused completion, or None if it isn't an object with a non-empty reply."""
+    fenced = _FENCE.match(content.strip())
+    try:
+        result = json.loads(fenced.group(1) if fenced else content)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(result, dict):
+        return None
+    reply = result.get("reply")
+    if not isinstance(reply, str) or not reply.strip():
+        return None
+    return reply, Insights.from_llm(result.get("insights"))
+
+class FusedResponder:
+    """Generates the reply and extracts insights with a single structured completion."""
+
+    def __init__(self, api_key: str, generator: ResponseGenerator):
+        self.model = get_client(api_key)
+        self.generator = generator
+
+    async def process(self, message_data: Dict[str, Any], context: UserContext,
+                      route: Optional[RouteDecision] = None,
+                      style: Optional[StyleSpec] = None) -> Tuple[str, Insights, bool]:
+        """Return (reply, insights, parsed) where `parsed` is False if the JSON could not be read.
+
+        An unreadable answer is replaced by a plain generator reply, with no insights for this message.
+        """
+        model = model_registry.get("generator", route.tier if route else "strong")
+
+        # Reuse the generator's cache-friendly system prompt and history window
+        system_prompt = self.generator._create_system_prompt(context, message_data.get("user_id"), style)
+        messages = self.generator._format_conversation_history(message_data)
+        messages.insert(0, {"role": "system", "content": f"{system_prompt}\n\n{FUSED_INSTRUCTIONS}"})
+
+        try:
+            started = time.perf_counter()
+            response = await self.model.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.7,
+                **({"response_format": {"type": "json_object"}} if supports_json_mode(model) else {})
+            )
+            record_completion("fused", model, started, response, route, message_data.get("user_id"))
+            content = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            print(f"Error in FusedResponder: {str(e)}")
+            metrics.inc("insights_parsed", mode="fused", ok=False)
+            return FALLBACK_REPLY, EMPTY_INSIGHTS, False
+
+        parsed = parse_fused(content)
+        metrics.inc("insights_parsed", mode="fused", ok=parsed is not None)
+        if parsed:
+            return parsed[0], parsed[1], True
+
+        # Never show the raw output (it may be JSON carrying the insights); answer with a plain completion
+        print(f"Error parsing fused response: {content[:200]!r}")
+        reply = await self.generator.process(message_data, context, route, style=style)
+        return reply, EMPTY_INSIGHTS, False
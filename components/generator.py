@@ -1,16 +1,62 @@
 from typing import Dict, Any, Optional
-from openai import AsyncOpenAI
-import json
+from collections import OrderedDict
+import hashlib
+import os
+import time
+
+from .entities import UserContext
+from .llm import get_client
+from .conversation import HISTORY_WINDOW
+from .serialization import dumps_canonical
+from .routing import RouteDecision, model_registry, record_completion
+from .style import StyleSpec
+
+# Number of rendered user-context prompts kept in memory
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", 1000))
+
+# Instructions shared by every user, kept first so they form a common cached prefix
+STATIC_INSTRUCTIONS = "\n".join([
+    "You are a friendly and helpful AI assistant with access to context about the user.",
+    "Use this context to provide more personalized and relevant responses.",
+    "Maintain a consistent tone matching their communication style.",
+    "Reference relevant past interactions when appropriate.",
+    "Be empathetic and understanding of their perspective."
+])
+
+# Sent in place of a reply when the completion fails
+FALLBACK_REPLY = "I apologize, but I encountered an error while processing your message. Could you please try again?"
+
+def context_version(context: UserContext) -> str:
+    """Version of a user context: its snapshot version if known, else a digest of its canonical form."""
+    if context.version is not None:
+        return str(context.version)
+    return hashlib.blake2b(dumps_canonical(context), digest_size=16).hexdigest()
+
+def _canonical(value: Any) -> str:
+    """Render a profile value the same way for equal inputs."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return ", ".join(value)
+    return dumps_canonical(value).decode("utf-8")
 
 class ResponseGenerator:
     def __init__(self, api_key: str):
-        self.model = AsyncOpenAI(api_key=api_key)
+        self.model = get_client(api_key)
+        self._prompt_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self.usage_stats = {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0}
         
-    async def process(self, message_data: Dict[str, Any], context: Dict[str, Any]) -> str:
-        """Generate a response using the message and context."""
+    async def process(self, message_data: Dict[str, Any], context: UserContext,
+                      route: Optional[RouteDecision] = None, phase: str = "generator",
+                      style: Optional[StyleSpec] = None, system_prompt: Optional[str] = None) -> str:
+        """Generate a response using the message and context, optionally conditioned on a style spec.
+
+        A `system_prompt` replaces the context-aware one (titles use it).
+        """
+        model = model_registry.get(phase, route.tier if route else "strong")
         
         # Create a context-aware system prompt
-        system_prompt = self._create_system_prompt(context)
+        system_prompt = system_prompt or self._create_system_prompt(context, message_data.get("user_id"), style)
         
         # Format the conversation history
         messages = self._format_conversation_history(message_data)
@@ -19,57 +65,133 @@ class ResponseGenerator:
         messages.insert(0, {"role": "system", "content": system_prompt})
         
         try:
+            started = time.perf_counter()
             response = await self.model.chat.completions.create(
-                model="gpt-4",
+                model=model,
                 messages=messages,
-                temperature=0.8
+                temperature=0.8,
+                **({"max_tokens": style.max_tokens} if style and style.max_tokens else {})
             )
+            record_completion(phase, model, started, response, route, message_data.get("user_id"))
+            
+            if getattr(response, "usage", None):
+                self._record_usage(response.usage)
             
             return response.choices[0].message.content
             
         except Exception as e:
             print(f"Error in ResponseGenerator: {str(e)}")
-            return "I apologize, but I encountered an error while processing your message. Could you please try again?"
+            return FALLBACK_REPLY
     
-    def _create_system_prompt(self, context: Dict[str, Any]) -> str:
-        """Create a system prompt that incorporates user context."""
+    def _create_system_prompt(self, context: UserContext, user_id: Optional[str] = None,
+                              style: Optional[StyleSpec] = None) -> str:
+        """Create a system prompt that incorporates user context.
+
+        Static instructions come first and the per-chat summary last, so unchanged users
+        produce a byte-identical prefix that provider-side prompt caching can reuse.
+        """
+        prompt = self._render_user_context(context, user_id)
+        
+        # Add style constraints (stable per user, so they stay inside the cached prefix)
+        if style:
+            instructions = style.instructions()
+            if instructions:
+                prompt += f"\n\n{instructions}"
+        
+        # Add what the knowledge graph links to the entities in this message
+        related = self._render_neighbourhood(context)
+        if related:
+            prompt += f"\n\n{related}"
+        
+        # Add the rolling summary of earlier turns in this chat
+        summary = context.conversation_summary
+        if summary:
+            prompt += f"\n\nEarlier in this conversation: {summary}"
+        return prompt
+    
+    def _render_neighbourhood(self, context: UserContext) -> str:
+        """Render the per-message graph neighbourhood (kept after the cached prefix)."""
+        neighbourhood = context.neighbourhood
+        if not neighbourhood:
+            return ""
+        
+        people = [f"{p.name} ({p.relationship})" if p.relationship else p.name for p in neighbourhood.people]
+        sections = [
+            "Related people: " + ", ".join(people) if people else "",
+            "Related interests: " + ", ".join(i.name for i in neighbourhood.interests) if neighbourhood.interests else "",
+            "Related stories: " + "; ".join(
+                f"{s.title}: {s.description}" if s.description else s.title for s in neighbourhood.stories
+            ) if neighbourhood.stories else ""
+        ]
+        sections = [section for section in sections if section]
+        return "\n".join(["Connected to what the user just mentioned:", *sections]) if sections else ""
+    
+    def _render_user_context(self, context: UserContext, user_id: Optional[str]) -> str:
+        """Render the instructions and user context, memoized per (user_id, context version)."""
+        if not user_id:
+            return self._render(context)
+        
+        key = (str(user_id), context_version(context))
+        prompt = self._prompt_cache.get(key)
+        if prompt is not None:
+            self._prompt_cache.move_to_end(key)
+            return prompt
+        
+        prompt = self._render(context)
+        self._prompt_cache[key] = prompt
+        while len(self._prompt_cache) > PROMPT_CACHE_SIZE:
+            self._prompt_cache.popitem(last=False)
+        return prompt
+    
+    def _render(self, context: UserContext) -> str:
+        """Render user context in a fixed section order with sorted items."""
         
         # Get user profile information
-        profile = context.get("profile", {})
-        personality = profile.get("personality_traits", [])
-        communication_style = profile.get("communication_style", "")
+        profile = context.profile
+        personality = profile.personality_traits if profile else None
+        communication_style = context.communication_style
         
         # Get recent context
-        interests = context.get("interests", [])
-        people = context.get("people", [])
-        stories = context.get("stories", [])
+        interests = sorted(i.name for i in context.interests)
+        people = sorted(
+            f"{p.name} ({p.relationship})" if p.relationship else p.name
+            for p in context.people
+        )
+        stories = sorted(s.title for s in context.stories)
         
-        # Build the context-aware prompt
-        prompt_parts = [
-            "You are a friendly and helpful AI assistant with access to the following context about the user:",
-            
+        # Build the context sections in a fixed order
+        sections = [
             # Add personality context if available
-            f"Personality traits: {', '.join(personality)}" if personality else "",
-            f"Communication style: {communication_style}" if communication_style else "",
+            f"Personality traits: {_canonical(personality)}" if personality else "",
+            f"Communication style: {_canonical(communication_style)}" if communication_style else "",
             
             # Add interests
-            "Recent interests: " + ", ".join(i["name"] for i in interests) if interests else "",
+            "Recent interests: " + ", ".join(interests) if interests else "",
             
             # Add people context
-            "Known people: " + ", ".join(f"{p['name']} ({p['relationship']})" for p in people) if people else "",
+            "Known people: " + ", ".join(people) if people else "",
             
             # Add recent stories
-            "Recent stories: " + ", ".join(s["title"] for s in stories) if stories else "",
-            
-            # Add behavioral instructions
-            "Use this context to provide more personalized and relevant responses.",
-            "Maintain a consistent tone matching their communication style.",
-            "Reference relevant past interactions when appropriate.",
-            "Be empathetic and understanding of their perspective."
+            "Recent stories: " + ", ".join(stories) if stories else ""
         ]
+        sections = [section for section in sections if section]
+        if not sections:
+            return STATIC_INSTRUCTIONS
         
-        # Combine all parts, filtering out empty strings
-        return "\n".join(part for part in prompt_parts if part)
+        # Combine the static instructions with the non-empty sections
+        return "\n".join([STATIC_INSTRUCTIONS, "Context about the user:", *sections])
+    
+    def cached_prefix_share(self) -> float:
+        """Share of prompt tokens served from the provider's prompt prefix cache."""
+        if not self.usage_stats["prompt_tokens"]:
+            return 0.0
+        return round(self.usage_stats["cached_prompt_tokens"] / self.usage_stats["prompt_tokens"], 3)
+    
+    def _record_usage(self, usage: Any) -> None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.usage_stats["calls"] += 1
+        self.usage_stats["prompt_tokens"] += usage.prompt_tokens or 0
+        self.usage_stats["cached_prompt_tokens"] += getattr(details, "cached_tokens", 0) or 0
     
     def _format_conversation_history(self, message_data: Dict[str, Any]) -> list:
         """Format the conversation history for the API call."""
@@ -80,4 +202,4 @@ class ResponseGenerator:
         }
         
         # Ensure we don't exceed token limits by taking recent messages
-        return history[-5:] + [current_message]  # Keep last 5 messages + current 
\ No newline at end of file
+        return history[-HISTORY_WINDOW:] + [current_message]  # Keep last N messages + current 
\ No newline at end of file
@@ -0,0 +1,95 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import time
+
+from .metrics import metrics
+from .serialization import dumps_canonical
+
+# How long completed results are replayed for requests sent with an Idempotency-Key header
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 600))
+
+# Window for requests without the header, keyed by a hash of their payload; kept short so a user
+# deliberately sending the same text again later still gets a fresh reply
+IDEMPOTENCY_FALLBACK_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_FALLBACK_TTL_SECONDS", 30))
+
+# Completed results kept in memory (least recently stored are dropped first)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 5000))
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of a request payload."""
+    return hashlib.blake2b(dumps_canonical(parts), digest_size=16).hexdigest()
+
+class IdempotencyConflict(Exception):
+    """Raised when an Idempotency-Key is reused with a different payload."""
+
+class IdempotencyCache:
+    """Runs each distinct request once: duplicates in flight share its result, later ones get it replayed."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        # key -> (payload fingerprint, task running the request)
+        self._in_flight: Dict[str, Tuple[str, asyncio.Task]] = {}
+        # key -> (payload fingerprint, expiry, result)
+        self._completed: "OrderedDict[str, Tuple[str, float, Any]]" = OrderedDict()
+
+    async def run(self, scope: str, user_id: Optional[str], idempotency_key: Optional[str], payload: str,
+                  work: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Return (result, outcome) where outcome is "executed", "coalesced" or "replayed".
+
+        `payload` is the request's fingerprint; without an idempotency key it is the key itself.
+        """
+        if idempotency_key:
+            key, ttl = f"{scope}:{user_id or ''}:{idempotency_key}", IDEMPOTENCY_TTL_SECONDS
+        else:
+            key, ttl = f"{scope}:{payload}", IDEMPOTENCY_FALLBACK_TTL_SECONDS
+
+        completed = self._completed.get(key)
+        if completed is not None:
+            stored_payload, expires, result = completed
+            if expires > time.monotonic():
+                self._check_payload(scope, stored_payload, payload)
+                return self._finish(scope, "replayed", result)
+            del self._completed[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            stored_payload, task = in_flight
+            self._check_payload(scope, stored_payload, payload)
+            # Shielded, so a duplicate giving up (client disconnect) doesn't cancel the shared run
+            return self._finish(scope, "coalesced", await asyncio.shield(task))
+
+        # Runs as its own task: the first caller disconnecting doesn't cancel it for the others,
+        # and a late retry can still pick up the result
+        task = asyncio.create_task(work())
+        self._in_flight[key] = (payload, task)
+        metrics.set("idempotency_in_flight", len(self._in_flight))
+        task.add_done_callback(lambda done: self._store(key, payload, ttl, done))
+        return self._finish(scope, "executed", await asyncio.shield(task))
+
+    def _store(self, key: str, payload: str, ttl: float, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        metrics.set("idempotency_in_flight", len(self._in_flight))
+        # Failures aren't cached, so a retry runs again (reading the exception also marks it retrieved)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._completed[key] = (payload, time.monotonic() + ttl, task.result())
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+
+    @staticmethod
+    def _check_payload(scope: str, stored: str, payload: str) -> None:
+        if stored != payload:
+            metrics.inc("idempotency", scope=scope, outcome="conflict")
+            raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+
+    @staticmethod
+    def _finish(scope: str, outcome: str, result: Any) -> Tuple[Any, str]:
+        metrics.inc("idempotency", scope=scope, outcome=outcome)
+        return result, outcome
+
+# Shared cache for the process
+idempotency = IdempotencyCache()
@@ -0,0 +1,171 @@
+from typing import Dict, Any, List, Optional
+from datetime import date
+import asyncio
+import os
+
+import asyncpg
+
+from .metrics import metrics
+
+# Seconds between flushes of buffered usage to Postgres, and buffered rows that trigger an early flush
+LEDGER_FLUSH_SECONDS = float(os.getenv("LEDGER_FLUSH_SECONDS", 10))
+LEDGER_MAX_PENDING = int(os.getenv("LEDGER_MAX_PENDING", 500))
+
+# Default daily budget per user in USD (0 disables budgets; rows in llm_budgets override it per user)
+USER_DAILY_BUDGET_USD = float(os.getenv("USER_DAILY_BUDGET_USD", 0))
+
+# Share of the budget after which a user's messages are routed to fast models
+BUDGET_DOWNGRADE_AT = float(os.getenv("BUDGET_DOWNGRADE_AT", 0.8))
+
+FLUSH_QUERY = """
+    INSERT INTO llm_usage_daily (user_id, day, phase, model, calls, prompt_tokens, completion_tokens,
+                                 cached_prompt_tokens, cost_usd)
+    SELECT * FROM unnest($1::text[], $2::date[], $3::text[], $4::text[], $5::int[], $6::bigint[], $7::bigint[],
+                         $8::bigint[], $9::float8[])
+    ON CONFLICT (user_id, day, phase, model) DO UPDATE SET
+        calls = llm_usage_daily.calls + EXCLUDED.calls,
+        prompt_tokens = llm_usage_daily.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = llm_usage_daily.completion_tokens + EXCLUDED.completion_tokens,
+        cached_prompt_tokens = llm_usage_daily.cached_prompt_tokens + EXCLUDED.cached_prompt_tokens,
+        cost_usd = llm_usage_daily.cost_usd + EXCLUDED.cost_usd
+"""
+
+SPENT_TODAY_QUERY = """
+    SELECT user_id, SUM(cost_usd) AS cost_usd
+    FROM llm_usage_daily
+    WHERE day = CURRENT_DATE AND user_id <> ''
+    GROUP BY user_id
+"""
+
+BUDGETS_QUERY = "SELECT user_id, daily_usd FROM llm_budgets"
+
+USAGE_QUERY = """
+    SELECT user_id, day, phase, model, calls, prompt_tokens, completion_tokens, cached_prompt_tokens, cost_usd
+    FROM llm_usage_daily
+    WHERE day > CURRENT_DATE - $1::int AND ($2::text IS NULL OR user_id = $2)
+    ORDER BY day DESC, cost_usd DESC
+    LIMIT $3
+"""
+
+# calls, prompt tokens, completion tokens, cached prompt tokens, cost
+_EMPTY_ROW = (0, 0, 0, 0, 0.0)
+
+def _user_key(user_id: Any) -> str:
+    """Ledger and budget key for a user id passed as str or uuid.UUID ('' for calls without a user)."""
+    return str(user_id) if user_id else ""
+
+class UsageLedger:
+    """Token and cost totals per user, phase, model and day, buffered in memory and flushed in batches."""
+
+    def __init__(self):
+        self.db = None
+        self._pending: Dict[tuple, list] = {}
+        self._spent: Dict[str, float] = {}
+        self._spent_day = date.today()
+        self._budgets: Dict[str, float] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    async def start(self, db_pool: asyncpg.Pool) -> None:
+        """Load today's spend and the budget overrides, then flush periodically."""
+        self.db = db_pool
+        try:
+            async with db_pool.acquire() as conn:
+                for row in await conn.fetch(SPENT_TODAY_QUERY):
+                    self._spent[row["user_id"]] = self._spent.get(row["user_id"], 0.0) + float(row["cost_usd"])
+                await self._load_budgets(conn)
+        except Exception as e:
+            print(f"Error loading usage ledger: {str(e)}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def record(self, user_id: Optional[str], phase: str, model: str, usage: Any, cost: float) -> None:
+        """Add one completion's usage; calls without a user (titles, summaries) are kept under ''."""
+        user_id = _user_key(user_id)
+        today = date.today()
+        details = getattr(usage, "prompt_tokens_details", None)
+        row = self._pending.setdefault((user_id, today, phase, model), list(_EMPTY_ROW))
+        row[0] += 1
+        row[1] += getattr(usage, "prompt_tokens", 0) or 0
+        row[2] += getattr(usage, "completion_tokens", 0) or 0
+        row[3] += getattr(details, "cached_tokens", 0) or 0
+        row[4] += cost
+
+        if today != self._spent_day:
+            self._spent, self._spent_day = {}, today
+        if user_id:
+            self._spent[user_id] = self._spent.get(user_id, 0.0) + cost
+
+        if len(self._pending) >= LEDGER_MAX_PENDING and self.db and not self._flush_lock.locked():
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def budget(self, user_id: Optional[str]) -> Dict[str, Any]:
+        """Today's spend and daily limit (None when unlimited) for a user."""
+        user_id = _user_key(user_id)
+        limit = self._budgets.get(user_id, USER_DAILY_BUDGET_USD) if user_id else 0
+        spent = self._spent.get(user_id, 0.0) if self._spent_day == date.today() else 0.0
+        return {"spent_usd": round(spent, 6), "daily_usd": limit or None}
+
+    def budget_action(self, user_id: Optional[str]) -> str:
+        """"ok", "downgrade" (fast models only) or "restrict" (also skip optional phases)."""
+        budget = self.budget(user_id)
+        if not budget["daily_usd"]:
+            return "ok"
+        share = budget["spent_usd"] / budget["daily_usd"]
+        if share >= 1:
+            return "restrict"
+        if share >= BUDGET_DOWNGRADE_AT:
+            return "downgrade"
+        return "ok"
+
+    async def flush(self) -> int:
+        """Write buffered usage in one statement; rows are kept for the next flush if it fails."""
+        if not self._pending or not self.db:
+            return 0
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            columns = list(zip(*(key + tuple(values) for key, values in batch.items())))
+            try:
+                async with self.db.acquire() as conn:
+                    await conn.execute(FLUSH_QUERY, *columns)
+                metrics.inc("ledger_flush", ok=True)
+                metrics.inc("ledger_rows", len(batch))
+                return len(batch)
+            except Exception as e:
+                print(f"Error flushing usage ledger: {str(e)}")
+                metrics.inc("ledger_flush", ok=False)
+                for key, values in batch.items():
+                    row = self._pending.setdefault(key, list(_EMPTY_ROW))
+                    for i, value in enumerate(values):
+                        row[i] += value
+                return 0
+
+    async def query(self, user_id: Optional[str] = None, days: int = 7, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Daily rows for the last `days` days, newest and costliest first."""
+        await self.flush()
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch(USAGE_QUERY, days, _user_key(user_id) or None, limit)
+        return [{**dict(row), "day": row["day"].isoformat()} for row in rows]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(LEDGER_FLUSH_SECONDS)
+            await self.flush()
+            try:
+                async with self.db.acquire() as conn:
+                    await self._load_budgets(conn)
+            except Exception as e:
+                print(f"Error loading usage budgets: {str(e)}")
+
+    async def _load_budgets(self, conn) -> None:
+        self._budgets = {row["user_id"]: float(row["daily_usd"]) for row in await conn.fetch(BUDGETS_QUERY)}
+
+# Shared ledger for the process
+ledger = UsageLedger()
@@ -0,0 +1,20 @@
+from openai import AsyncOpenAI
+
+from .cassette import RecordingClient, recorder
+
+_clients = {}
+
+def get_client(api_key: str) -> AsyncOpenAI:
+    """Shared AsyncOpenAI client per API key, so all phases reuse one keep-alive connection pool."""
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncOpenAI(api_key=api_key)
+        # Capture requests and responses into cassettes when recording is on
+        if recorder.enabled:
+            client = RecordingClient(client)
+        _clients[api_key] = client
+    return client
+
+def set_client(api_key: str, client) -> None:
+    """Use `client` for `api_key` from now on (replays answer from recorded calls this way)."""
+    _clients[api_key] = client
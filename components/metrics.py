@@ -0,0 +1,74 @@
+from typing import Dict, Any, Tuple
+from collections import defaultdict, deque
+import os
+
+# Recent samples kept per histogram for percentile estimates
+HISTOGRAM_SAMPLES = int(os.getenv("METRICS_HISTOGRAM_SAMPLES", 1024))
+
+class Histogram:
+    """Count/sum plus a window of recent samples for percentiles."""
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self, size: int = HISTOGRAM_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=size)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> float:
+        """Percentile (0-100) over the recent samples."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3)
+        }
+
+def _key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Metrics:
+    """Process-local counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.histograms = defaultdict(Histogram)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        self.counters[(name, _key(labels))] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges[(name, _key(labels))] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self.histograms[(name, _key(labels))].observe(value)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self.histograms[(name, _key(labels))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All metrics as {name: [{labels, value}]}, ready to serialize."""
+        result = defaultdict(list)
+        for (name, labels), value in self.counters.items():
+            result[name].append({"labels": dict(labels), "value": value})
+        for (name, labels), value in self.gauges.items():
+            result[name].append({"labels": dict(labels), "value": value})
+        for (name, labels), histogram in list(self.histograms.items()):
+            result[name].append({"labels": dict(labels), **histogram.snapshot()})
+        return dict(result)
+
+# Shared registry for the process
+metrics = Metrics()
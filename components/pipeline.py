@@ -1,127 +1,127 @@
-from typing import Dict, Any, AsyncGenerator
+from typing import Dict, Any, AsyncGenerator, Optional, Tuple
+import asyncio
 import asyncpg
+import os
+import uuid
 from datetime import datetime
 
 from .listener import ListeningIdentifier
 from .fetcher import FetcherAndSaver
-from .generator import ResponseGenerator
+from .database import ReplicaRouter
+from .sharding import ShardRouter
+from .generator import FALLBACK_REPLY, ResponseGenerator
 from .adjustor import ResponseAdjustor
+from .response_adjustor import StepwiseAdjustor
+from .conversation import ConversationStore
+from .summarizer import ConversationSummarizer
+from .fused import FusedResponder
+from .entities import EMPTY_CONTEXT, EMPTY_INSIGHTS, Insights, UserContext
+from .routing import ModelRouter, RouteDecision, model_registry
+from .style import STYLE_MODE, StyleSpec, compile_style, check_draft
+from .metrics import metrics
+from .prefilter import InsightGate
+from .ledger import ledger
+from .deadline import Deadline, estimate_ms
+from .cassette import note_context, recorder
+from .stages import Stage, StagePipeline
+
+# Modes a chat message can run in: "staged" (separate extraction and generation calls) or "fused" (one call for both)
+PIPELINE_MODES = ("staged", "fused")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
+
+# Stages each mode runs; PIPELINE_STAGES_<MODE>_<TIER> overrides a list for one route tier
+PIPELINE_STAGES = {
+    "staged": ("history", "extract", "save", "fetch", "generate", "adjust"),
+    "fused": ("history", "fetch_mentions", "fused", "adjust"),
+    "title": ("title",)
+}
+
+# Instructions for chat titles, sent instead of the user-context system prompt
+TITLE_PROMPT = ("Generate a short, descriptive title (2-6 words) for a chat that starts with this message. "
+                "Reply with the title only.")
+
+# Values every message starts with
+STAGE_INPUTS = ("message", "route", "deadline", "restricted")
+
+# "rewrite" (one call rewriting the draft) or "stepwise" (analyse the draft, then rewrite it)
+ADJUSTOR_IMPL = os.getenv("ADJUSTOR_IMPL", "rewrite")
+ADJUSTORS = {"rewrite": ResponseAdjustor, "stepwise": StepwiseAdjustor}
 
 class MessageProcessingPipeline:
-    def __init__(self, db_pool: asyncpg.Pool, api_key: str):
+    def __init__(self, db_pool: asyncpg.Pool, api_key: str, router: Optional[ReplicaRouter] = None,
+                 shards: Optional[ShardRouter] = None):
         self.db = db_pool
         self.listener = ListeningIdentifier(api_key)
-        self.fetcher = FetcherAndSaver(db_pool)
+        self.fetcher = FetcherAndSaver(db_pool, router, shards)
         self.generator = ResponseGenerator(api_key)
-        self.adjustor = ResponseAdjustor(api_key)
+        self.adjustor = ADJUSTORS[ADJUSTOR_IMPL](api_key)
+        self.conversations = ConversationStore(db_pool)
+        self.summarizer = ConversationSummarizer(api_key, self.conversations)
+        self.router = ModelRouter()
+        self.fused = FusedResponder(api_key, self.generator)
+        self.prefilter = InsightGate(self.fetcher.resolver)
+        self._background = set()
+        self.stages = self._define_stages()
+        # (mode, tier) -> StagePipeline, built on first use
+        self._compositions: Dict[Tuple[str, str], StagePipeline] = {}
         
     async def process_message(self, message_data: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
         """Process a message through the complete pipeline, yielding thinking steps."""
+        # Recorded to a cassette when PIPELINE_RECORD_DIR is set (or a replay collects it)
+        tape = recorder.start(message_data)
         try:
-            # Phase 1: Understanding the Input
-            yield {
-                "phase": "understanding",
-                "thinking": "Understanding the message and extracting key insights...",
-                "status": "in_progress"
-            }
-            
-            # 1. Extract insights from the message
-            insights = await self.listener.process(message_data)
-            
-            yield {
-                "phase": "understanding",
-                "thinking": "Extracted key insights about people, topics, and context",
-                "status": "complete",
-                "details": {
-                    "insights": insights
-                }
-            }
-
-            # Phase 2: Building Context
-            yield {
-                "phase": "context",
-                "thinking": "Building comprehensive context from past interactions...",
-                "status": "in_progress"
-            }
-            
-            # 2. Save insights and fetch context
-            context = await self.fetcher.process(message_data, insights)
+            async for step in self._process_message(message_data):
+                if tape is not None:
+                    tape.step(step)
+                yield step
+        finally:
+            recorder.finish(tape)
+    
+    async def _process_message(self, message_data: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        received_at = datetime.now()
+        deadline = Deadline.for_message(message_data)
+        try:
+            # Route simple turns to fast models and complex ones to strong models
+            route = self.router.classify(message_data.get("content", ""), self._history_depth(message_data))
             
-            yield {
-                "phase": "context",
-                "thinking": "Retrieved user profile, interests, and relevant history",
-                "status": "complete",
-                "details": {
-                    "context_elements": [
-                        "User profile",
-                        "Communication preferences",
-                        "Past interactions",
-                        "Shared interests"
-                    ]
-                }
-            }
-
-            # Phase 3: Generating Response
-            yield {
-                "phase": "generation",
-                "thinking": "Crafting initial response based on context...",
-                "status": "in_progress"
-            }
+            # Users near their daily budget get fast models; past it, optional phases are skipped too
+            budget = ledger.budget_action(message_data.get("user_id"))
+            if budget != "ok":
+                metrics.inc("llm_budget", action=budget)
+                route = RouteDecision("fast", f"daily budget {'exceeded' if budget == 'restrict' else 'nearly spent'}")
             
-            # 3. Generate initial response
-            initial_response = await self.generator.process(message_data, context)
+            # The stages for this mode and route tier fill in `values`, reporting each phase as it goes
+            values: Dict[str, Any] = {"message": message_data, "route": route, "deadline": deadline,
+                                      "restricted": budget == "restrict"}
+            mode = message_data.get("pipeline_mode") or PIPELINE_MODE
+            if mode not in PIPELINE_MODES:
+                raise ValueError(f"Unknown pipeline mode: {mode}")
+            async for event in self.compose(mode, route.tier).run(values):
+                yield event
             
-            yield {
-                "phase": "generation",
-                "thinking": "Generated contextually-aware response",
-                "status": "complete",
-                "details": {
-                    "response_length": len(initial_response),
-                    "includes_context": True
-                }
-            }
+            message_data, context = self._turn(values)
+            note_context(context)
+            insights = values.get("insights", EMPTY_INSIGHTS)
+            # Compositions without an adjust stage send the draft
+            reply = values.get("reply", values["draft"])
 
-            # Phase 4: Style Adjustment
-            yield {
-                "phase": "adjustment",
-                "thinking": "Adjusting response style to match user preferences...",
-                "status": "in_progress"
-            }
-            
-            # 4. Adjust response style
-            adjustment_data = {
-                "content": initial_response,
-                "chat_id": message_data.get("chat_id", ""),
-                "user_id": message_data.get("user_id", ""),
-                "message_history": message_data.get("message_history", []),
-                "system_prompt": message_data.get("system_prompt")
+            # Create final response object
+            assistant_message = {
+                # Always ours: a client-chosen id could collide with (or not be) a UUID and lose both turns
+                "id": str(uuid.uuid4()),
+                "role": "assistant",
+                "content": reply,
+                "created_at": datetime.now(),
+                "chat_id": message_data.get("chat_id", "")
             }
+            self._record_turns(message_data, received_at, assistant_message)
+            deadline.record_outcome()
             
-            # Stream adjustment thinking steps
-            adjusted_response = await self.adjustor.process(adjustment_data, context)
-            
-            yield {
-                "phase": "adjustment",
-                "thinking": "Completed style adjustment",
-                "status": "complete",
-                "details": {
-                    "preserved_elements": [
-                        "Core message",
-                        "Context relevance",
-                        "Engagement aspects"
-                    ]
-                }
-            }
-
-            # Create final response object
             response = {
                 "status": "success",
                 "assistant_message": {
-                    "id": message_data.get("message_id", ""),
-                    "role": "assistant",
-                    "content": adjusted_response,
-                    "created_at": datetime.now().isoformat(),
-                    "chat_id": message_data.get("chat_id", "")
+                    **assistant_message,
+                    "created_at": assistant_message["created_at"].isoformat()
                 },
                 "insights": insights
             }
@@ -142,4 +142,288 @@ class MessageProcessingPipeline:
                     "error": str(e),
                     "phase": "message_processing"
                 }
-            } 
\ No newline at end of file
+            }
+
+    def compose(self, mode: str, tier: str = "default") -> StagePipeline:
+        """The stage pipeline for a mode ("staged", "fused" or "title") and route tier.
+
+        PIPELINE_STAGES_<MODE>_<TIER> (e.g. PIPELINE_STAGES_STAGED_FAST=history,extract,save,fetch,generate)
+        replaces the mode's stage list for one tier.
+        """
+        pipeline = self._compositions.get((mode, tier))
+        if pipeline is None:
+            override = os.getenv(f"PIPELINE_STAGES_{mode.upper()}_{tier.upper()}", "")
+            names = [name.strip() for name in override.split(",") if name.strip()] or PIPELINE_STAGES[mode]
+            unknown = [name for name in names if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Unknown pipeline stages: {', '.join(unknown)}")
+            pipeline = self._compositions[(mode, tier)] = StagePipeline([self.stages[name] for name in names], STAGE_INPUTS)
+        return pipeline
+
+    async def generate_title(self, message_data: Dict[str, Any]) -> str:
+        """Short chat title for the first message of a chat."""
+        values: Dict[str, Any] = {"message": message_data}
+        async for _ in self.compose("title").run(values):
+            pass
+        return values["title"]
+
+    def _define_stages(self) -> Dict[str, Stage]:
+        """Every stage a composition can use, by name."""
+        stages = [
+            Stage("history", self._history_stage, needs=["message"], provides=["message_history", "summary"],
+                  fallback=lambda values, e: {"message_history": values["message"].get("message_history") or [],
+                                              "summary": ""}),
+            # A timed-out extraction is finished in the background, like one the deadline leaves no time for
+            Stage("extract", self._extract_stage, needs=["message", "route", "deadline", "restricted"],
+                  provides=["insights", "deferred"], phase="understanding",
+                  thinking=("Understanding the message and extracting key insights...",
+                            "Extracted key insights about people, topics, and context"),
+                  fallback=self._extract_fallback),
+            # A failed save is retried in the background rather than failing the reply
+            Stage("save", self._save_stage, needs=["message", "insights", "deferred"], provides=["saved_insights"],
+                  phase="context", thinking=("Building comprehensive context from past interactions...", ""),
+                  fallback=self._save_fallback),
+            Stage("fetch", self._fetch_stage, needs=["message", "saved_insights", "deferred"], provides=["user_context"],
+                  phase="context", thinking=("Building comprehensive context from past interactions...",
+                                             "Retrieved user profile, interests, and relevant history")),
+            Stage("fetch_mentions", self._fetch_stage, needs=["message"], provides=["user_context"], phase="context",
+                  thinking=("Building comprehensive context from past interactions...",
+                            "Retrieved user profile, interests, and relevant history")),
+            Stage("generate", self._generate_stage,
+                  needs=["message", "route", "user_context", "message_history", "summary"],
+                  provides=["draft", "style"], phase="generation",
+                  thinking=("Crafting initial response based on context...", "Generated contextually-aware response")),
+            Stage("fused", self._fused_stage, needs=["message", "route", "user_context", "message_history", "summary"],
+                  provides=["draft", "style", "insights"], phase="generation",
+                  thinking=("Crafting a response and extracting key insights...",
+                            "Generated response and extracted insights in a single pass"),
+                  fallback=lambda values, e: {"draft": FALLBACK_REPLY, "style": None, "insights": EMPTY_INSIGHTS,
+                                              "details": {"insights_parsed": False, "error": str(e)}}),
+            Stage("adjust", self._adjust_stage,
+                  needs=["message", "route", "deadline", "restricted", "user_context", "message_history", "summary",
+                         "draft", "style"],
+                  provides=["reply"], phase="adjustment",
+                  thinking=("Adjusting response style to match user preferences...", "Completed style adjustment"),
+                  fallback=lambda values, e: {"reply": values["draft"],
+                                              "details": {"skipped": True, "skip_reason": str(e) or "timeout"}}),
+            Stage("title", self._title_stage, needs=["message"], provides=["title"])
+        ]
+        return {stage.name: stage for stage in stages}
+
+    def _turn(self, values: Dict[str, Any]) -> Tuple[Dict[str, Any], UserContext]:
+        """The message with its chat history, and the user context with the chat summary."""
+        message_data = {**values["message"], "message_history": values["message_history"]}
+        context = values["user_context"]
+        if values["summary"]:
+            context = context.with_summary(values["summary"])
+        return message_data, context
+
+    async def _history_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat history and rolling summary, loaded while the other stages run."""
+        message_history, summary = await asyncio.gather(
+            self._load_history(values["message"]),
+            self._load_summary(values["message"])
+        )
+        return {"message_history": message_history, "summary": summary}
+
+    async def _extract_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract insights from the message, unless the local gate finds nothing worth extracting."""
+        message_data, route = values["message"], values["route"]
+        if values["restricted"]:
+            return {"insights": EMPTY_INSIGHTS, "deferred": False,
+                    "details": {"insights": EMPTY_INSIGHTS, "skipped": True, "skip_reason": "daily budget exceeded"}}
+        
+        # Extraction must leave time for generation; if it can't, it runs after the reply instead
+        plan = values["deadline"].plan("listener", route, after_ms=estimate_ms("generator", route.tier))
+        if plan.action == "skip":
+            self._extract_later(message_data, route)
+            return {"insights": EMPTY_INSIGHTS, "deferred": True,
+                    "details": {"insights": EMPTY_INSIGHTS, "deferred": True,
+                                "defer_reason": f"deadline: {plan.reason}", **plan.details()}}
+        
+        insights, gate = await self.prefilter.extract(
+            message_data, lambda: self.listener.process(message_data, plan.route)
+        )
+        return {"insights": insights, "deferred": False, "details": {
+            "insights": insights,
+            **gate.details(),
+            **({} if self.prefilter.mode == "on" and gate.skip else plan.route.details("listener")),
+            **plan.details()
+        }}
+
+    def _extract_fallback(self, values: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        self._extract_later(values["message"], values["route"])
+        return {"insights": EMPTY_INSIGHTS, "deferred": True, "details": {"insights": EMPTY_INSIGHTS, "deferred": True}}
+
+    async def _save_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Save the insights; returns them with names resolved to the stored rows."""
+        if values["deferred"]:
+            return {"saved_insights": values["insights"]}
+        return {"saved_insights": await self.fetcher.save_insights(values["message"]["user_id"], values["insights"])}
+
+    def _save_fallback(self, values: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        self._save_insights_later(values["message"]["user_id"], values["insights"])
+        return {"saved_insights": values["insights"]}
+
+    async def _fetch_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """User context, expanded around the entities the message mentions."""
+        user_id = values["message"]["user_id"]
+        insights = values.get("saved_insights")
+        if insights is None or values.get("deferred"):
+            # Nothing extracted (yet), so expand the graph around known names found in the text
+            people, interests = self.fetcher.mentions_in(user_id, values["message"].get("content", ""))
+        else:
+            people = [p.name for p in insights.people] + [n for s in insights.stories for n in s.people]
+            interests = [i.name for i in insights.interests]
+        context = await self.fetcher.fetch_context(user_id, people, interests)
+        return {"user_context": context, "details": {"context_elements": [
+            "User profile",
+            "Communication preferences",
+            "Past interactions",
+            "Shared interests"
+        ]}}
+
+    async def _generate_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        message_data, context = self._turn(values)
+        route = values["route"]
+        style = self._style_spec(context)
+        draft = await self.generator.process(message_data, context, route, style=style)
+        return {"draft": draft, "style": style, "details": {
+            "response_length": len(draft),
+            "includes_context": True,
+            "cached_prefix_share": self.generator.cached_prefix_share(),
+            "style_conditioned": style is not None,
+            **route.details("generator")
+        }}
+
+    async def _fused_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Reply and extract insights in one call; insights are saved in the background."""
+        message_data, context = self._turn(values)
+        route = values["route"]
+        style = self._style_spec(context)
+        draft, insights, parsed = await self.fused.process(message_data, context, route, style)
+        
+        # Persist insights without holding up the reply
+        self._save_insights_later(message_data["user_id"], insights)
+        
+        return {"draft": draft, "style": style, "insights": insights, "details": {
+            "insights": insights,
+            "insights_parsed": parsed,
+            "response_length": len(draft),
+            "cached_prefix_share": self.generator.cached_prefix_share(),
+            "style_conditioned": style is not None,
+            **route.details("generator")
+        }}
+
+    async def _adjust_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Adjust the draft to the user's style, unless it already fits, the budget is spent or time is short."""
+        message_data, context = self._turn(values)
+        route, draft, style = values["route"], values["draft"], values["style"]
+        preserved = {"preserved_elements": ["Core message", "Context relevance", "Engagement aspects"]}
+        
+        # Style-conditioned drafts only go through the adjustor when they are out of spec
+        violations = check_draft(draft, style) if style else None
+        if violations == []:
+            self._record_adjustment_skipped(route)
+            return {"reply": draft, "details": {**preserved, "skipped": True, "skip_reason": "draft within style spec"}}
+        if values["restricted"]:
+            return {"reply": draft, "details": {**preserved, "skipped": True, "skip_reason": "daily budget exceeded"}}
+        
+        # Send the unadjusted draft rather than miss the deadline
+        plan = values["deadline"].plan("adjustor", route)
+        if plan.action == "skip":
+            return {"reply": draft, "details": {**preserved, "skipped": True,
+                                                "skip_reason": f"deadline: {plan.reason}", **plan.details()}}
+        
+        adjustment_data = {
+            "content": draft,
+            "chat_id": message_data.get("chat_id", ""),
+            "user_id": message_data.get("user_id", ""),
+            "message_history": message_data.get("message_history", []),
+            "system_prompt": message_data.get("system_prompt")
+        }
+        reply = await self.adjustor.process(adjustment_data, context, plan.route)
+        details = {**preserved, **plan.route.details("adjustor"), **plan.details()}
+        if violations:
+            metrics.inc("style_fallback", fired=True)
+            details["fallback_reason"] = "; ".join(violations)
+        return {"reply": reply, "details": details}
+
+    async def _title_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        message_data = {
+            "content": values["message"]["content"],
+            "user_id": values["message"].get("user_id")
+        }
+        title = await self.generator.process(message_data, EMPTY_CONTEXT, phase="title", system_prompt=TITLE_PROMPT)
+        return {"title": title.strip('"').strip()}
+
+    def _style_spec(self, context: UserContext) -> Optional[StyleSpec]:
+        """Compile the user's style into generation constraints when running style-conditioned."""
+        if STYLE_MODE != "conditioned":
+            return None
+        return compile_style(context.communication_style)
+
+    def _record_adjustment_skipped(self, route: RouteDecision) -> None:
+        """Count a skipped adjustment and estimate the time saved from recent adjustor latency."""
+        metrics.inc("style_fallback", fired=False)
+        recent = metrics.histogram("llm_latency_ms", phase="adjustor",
+                                   model=model_registry.get("adjustor", route.tier), route=route.tier)
+        if recent.samples:
+            metrics.observe("style_adjustment_saved_ms", recent.percentile(50))
+
+    def _extract_later(self, message_data: Dict[str, Any], route: RouteDecision) -> None:
+        """Extract and save insights in the background, for messages whose deadline left no time for it."""
+        async def extract():
+            try:
+                insights, _ = await self.prefilter.extract(message_data, lambda: self.listener.process(message_data, route))
+            except Exception as e:
+                print(f"Error extracting insights in background: {str(e)}")
+                return
+            await self._save_insights(message_data["user_id"], insights)
+        
+        task = asyncio.create_task(extract())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _save_insights_later(self, user_id: str, insights: Insights) -> None:
+        task = asyncio.create_task(self._save_insights(user_id, insights))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _save_insights(self, user_id: str, insights: Insights) -> None:
+        try:
+            await self.fetcher.save_insights(user_id, insights)
+        except Exception as e:
+            print(f"Error saving insights in background: {str(e)}")
+
+    def _history_depth(self, message_data: Dict[str, Any]) -> int:
+        """Number of prior turns in the chat, from client history or the cached chat state."""
+        if message_data.get("message_history"):
+            return len(message_data["message_history"])
+        state = self.conversations.cached_state(message_data.get("chat_id", ""), message_data.get("user_id", ""))
+        return state.total if state else 0
+
+    async def _load_history(self, message_data: Dict[str, Any]) -> list:
+        """Use client-sent history if present (older clients), otherwise load it server-side."""
+        if message_data.get("message_history"):
+            return message_data["message_history"]
+        if not message_data.get("chat_id") or not message_data.get("user_id"):
+            return []
+        return await self.conversations.load_recent(message_data["chat_id"], message_data["user_id"])
+
+    async def _load_summary(self, message_data: Dict[str, Any]) -> str:
+        """Load the rolling summary of turns older than the history window."""
+        if not message_data.get("chat_id") or not message_data.get("user_id"):
+            return ""
+        return await self.conversations.load_summary(message_data["chat_id"], message_data["user_id"])
+
+    def _record_turns(self, message_data: Dict[str, Any], received_at: datetime, assistant_message: Dict[str, Any]) -> None:
+        """Store the user turn and the assistant reply for this chat."""
+        if not message_data.get("chat_id") or not message_data.get("user_id"):
+            return
+        self.conversations.record_turns(message_data["chat_id"], message_data["user_id"], [
+            {"role": "user", "content": message_data["content"], "created_at": received_at},
+            assistant_message
+        ])
+        # Fold older turns into the rolling summary without blocking the reply
+        self.summarizer.maybe_schedule(message_data["chat_id"], message_data["user_id"])
@@ -0,0 +1,260 @@
+from typing import Any, Deque, List, Optional, Tuple
+from collections import deque
+import asyncio
+import math
+import os
+import socket
+import time
+
+import asyncpg
+
+from .metrics import metrics
+
+# Limit on connections in use that an adaptive pool starts at (kept within DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE)
+DB_POOL_START_SIZE = int(os.getenv("DB_POOL_START_SIZE", 5))
+
+# p95 acquire wait above which the pool grows; it shrinks once waits stay under a quarter of it
+DB_POOL_WAIT_TARGET_MS = float(os.getenv("DB_POOL_WAIT_TARGET_MS", 10))
+
+# Seconds between sizing decisions
+DB_POOL_ADJUST_SECONDS = float(os.getenv("DB_POOL_ADJUST_SECONDS", 5))
+
+# Server connections left free for other workers, migrations and admin sessions
+DB_POOL_RESERVED_CONNECTIONS = int(os.getenv("DB_POOL_RESERVED_CONNECTIONS", 10))
+
+# Idle connections above the limit are closed after this long
+DB_POOL_IDLE_SECONDS = float(os.getenv("DB_POOL_IDLE_SECONDS", 30))
+
+# Prefix of the application_name adaptive pools connect with, so pools sharing a server can count each other
+DB_POOL_APPLICATION_NAME = os.getenv("DB_POOL_APPLICATION_NAME", "persona-ai")
+
+# The server's client connection slots and who holds them; $1 matches the adaptive pools' application_name
+HEADROOM_QUERY = """
+    SELECT current_setting('max_connections')::int - current_setting('superuser_reserved_connections')::int AS capacity,
+           COUNT(*) FILTER (WHERE backend_type = 'client backend')::int AS connections,
+           COUNT(*) FILTER (WHERE application_name LIKE $1)::int AS pooled,
+           COUNT(DISTINCT application_name) FILTER (WHERE application_name LIKE $1)::int AS pools
+    FROM pg_stat_activity
+"""
+
+def application_name(name: str) -> str:
+    """application_name for one adaptive pool of this process (Postgres keeps 63 characters)."""
+    return f"{DB_POOL_APPLICATION_NAME}:{socket.gethostname()}:{os.getpid()}:{name}"[:63]
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+class _Acquire:
+    """`await pool.acquire()` or `async with pool.acquire() as conn`, like asyncpg's."""
+    __slots__ = ("pool", "timeout", "conn")
+
+    def __init__(self, pool: "AdaptivePool", timeout: Optional[float]):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        self.conn = await self.pool._acquire(self.timeout)
+        return self.conn
+
+    async def __aexit__(self, *exc) -> None:
+        conn, self.conn = self.conn, None
+        await self.pool.release(conn)
+
+class AdaptivePool:
+    """An asyncpg pool whose limit on connections in use follows demand.
+
+    The asyncpg pool is created with the upper bound as its max_size; this wrapper admits at most `limit`
+    acquirers at a time, and every `adjust_seconds` raises the limit while the p95 acquire wait is above
+    `wait_target_ms` or lowers it while connections sit unused. Growth only takes half of the server's free
+    connection slots (past `reserved`); once the server runs short, pools above their fair share (the slots
+    left to adaptive pools, split by how many are connected) give connections back, so workers sharing a
+    database converge instead of starving each other. Connections idle past `max_inactive_connection_lifetime`
+    are closed by asyncpg, so a lower limit also means fewer open connections.
+
+    Reports db_pool_acquire_wait_ms, db_pool_in_use, db_pool_waiting, db_pool_size, db_pool_idle,
+    db_pool_limit, db_pool_headroom, db_pool_fair_share and db_pool_resize, labelled by pool name.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, name: str = "main", start_size: int = DB_POOL_START_SIZE,
+                 wait_target_ms: float = DB_POOL_WAIT_TARGET_MS, adjust_seconds: float = DB_POOL_ADJUST_SECONDS,
+                 reserved: int = DB_POOL_RESERVED_CONNECTIONS):
+        self._pool = pool
+        self.name = name
+        self.min_size = pool.get_min_size()
+        self.max_size = pool.get_max_size()
+        self.limit = min(self.max_size, max(self.min_size, start_size, 1))
+        self.wait_target_ms = wait_target_ms
+        self.adjust_seconds = adjust_seconds
+        self.reserved = reserved
+        self.in_use = 0
+        # Server connection slots left, and this pool's share of those adaptive pools may use
+        self.headroom: Optional[int] = None
+        self.fair_share: Optional[int] = None
+        # Acquire waits and the most connections in use since the last sizing decision
+        self._waits: List[float] = []
+        self._peak = 0
+        # Acquirers waiting for a slot, first come first served: (future, perf_counter() when they started)
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self._task = None
+
+    def __getattr__(self, name: str) -> Any:
+        # get_size(), get_min_size(), expire_connections() etc. come from the asyncpg pool
+        return getattr(self._pool, name)
+
+    def start(self) -> "AdaptivePool":
+        self._publish()
+        self._task = asyncio.create_task(self._adjust_loop())
+        return self
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _Acquire:
+        return _Acquire(self, timeout)
+
+    async def _acquire(self, timeout: Optional[float]) -> asyncpg.Connection:
+        started = time.perf_counter()
+        await self._take_slot(started, timeout)
+        try:
+            remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - started))
+            conn = await self._pool.acquire(timeout=remaining)
+        except BaseException:
+            self._free()
+            raise
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        self._waits.append(wait_ms)
+        self._peak = max(self._peak, self.in_use)
+        metrics.observe("db_pool_acquire_wait_ms", wait_ms, pool=self.name)
+        metrics.set("db_pool_in_use", self.in_use, pool=self.name)
+        return conn
+
+    async def _take_slot(self, started: float, timeout: Optional[float]) -> None:
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return
+        # Freed slots are handed to waiters in order, so a task releasing and re-acquiring can't jump the queue
+        waiter = (asyncio.get_running_loop().create_future(), started)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[0], timeout)
+        except BaseException:
+            if waiter[0].done() and not waiter[0].cancelled():
+                self._free()  # handed a slot just as the wait ended
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    async def release(self, conn: asyncpg.Connection, *, timeout: Optional[float] = None) -> None:
+        try:
+            await self._pool.release(conn, timeout=timeout)
+        finally:
+            self._free()
+
+    def _free(self) -> None:
+        self.in_use -= 1
+        self._hand_over()
+        metrics.set("db_pool_in_use", self.in_use, pool=self.name)
+
+    def _hand_over(self) -> None:
+        while self._waiters and self.in_use < self.limit:
+            future, _ = self._waiters.popleft()
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+    def resize(self, limit: int) -> None:
+        """Set the limit on connections in use (within the pool's bounds)."""
+        self.limit = min(self.max_size, max(self.min_size, 1, limit))
+        self._hand_over()
+        self._publish()
+
+    async def adjust(self) -> None:
+        """One sizing decision from the waits and peak use since the last one."""
+        now = time.perf_counter()
+        # Acquirers still queued count with how long they have waited so far
+        waits = self._waits + [(now - started) * 1000 for _, started in self._waiters]
+        self._waits = []
+        peak, self._peak = self._peak, self.in_use
+        p95 = _percentile(waits, 95)
+        await self._read_headroom()
+        # Free slots this pool may take: half of what is left past the reserve (unknown means unbounded).
+        # Its own connections above the limit are about to be closed, so they count as free here.
+        surplus = max(0, self._pool.get_size() - max(self.limit, self.min_size))
+        spare = None if self.headroom is None else (self.headroom + surplus - self.reserved) // 2
+        fair = self.fair_share or self.max_size
+
+        if spare is not None and spare < 0 and self.limit > max(self.min_size, fair):
+            # The server is nearly out of connections: pools over their fair share give back towards it,
+            # even if their requests wait longer
+            direction, limit = "shrink", max(fair, self.limit - max(1, self.limit // 4))
+        elif p95 > self.wait_target_ms and self.limit < self.max_size:
+            step = max(1, self.limit // 2)
+            if spare is not None:
+                # At most half the free slots, and only one at a time past the fair share
+                step = min(step, spare, spare if self.limit < fair else 1)
+            direction, limit = ("grow", self.limit + step) if step > 0 else ("blocked", self.limit)
+        elif p95 <= self.wait_target_ms / 4 and peak < self.limit - 1 and self.limit > self.min_size:
+            # Halve the unused part
+            direction, limit = "shrink", self.limit - max(1, (self.limit - peak) // 2)
+        else:
+            direction, limit = None, self.limit
+
+        if direction:
+            metrics.inc("db_pool_resize", pool=self.name, direction=direction)
+        if limit != self.limit:
+            self.resize(limit)
+        else:
+            self._publish()
+
+    async def _read_headroom(self) -> None:
+        """Refresh the server's free connection slots and this pool's fair share of them (None if unknown)."""
+        try:
+            # Straight from asyncpg: the controller must not queue behind the requests it is sizing for
+            async with self._pool.acquire(timeout=1) as conn:
+                row = await conn.fetchrow(HEADROOM_QUERY, f"{DB_POOL_APPLICATION_NAME}:%")
+        except Exception as e:
+            print(f"Error reading connection headroom for pool {self.name}: {str(e)}")
+            self.headroom = self.fair_share = None
+            return
+        self.headroom = row["capacity"] - row["connections"]
+        # What other clients hold is theirs; the rest (past the reserve) is split between the adaptive pools
+        available = row["capacity"] - self.reserved - (row["connections"] - row["pooled"])
+        self.fair_share = max(1, available // max(1, row["pools"]))
+
+    def _publish(self) -> None:
+        metrics.set("db_pool_limit", self.limit, pool=self.name)
+        metrics.set("db_pool_size", self._pool.get_size(), pool=self.name)
+        metrics.set("db_pool_idle", self._pool.get_idle_size(), pool=self.name)
+        metrics.set("db_pool_waiting", self.waiting, pool=self.name)
+        if self.headroom is not None:
+            metrics.set("db_pool_headroom", self.headroom, pool=self.name)
+            metrics.set("db_pool_fair_share", self.fair_share, pool=self.name)
+
+    async def _adjust_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.adjust_seconds)
+            try:
+                await self.adjust()
+            except Exception as e:
+                print(f"Error sizing pool {self.name}: {str(e)}")
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self._pool.close()
+
+    def terminate(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._pool.terminate()
@@ -0,0 +1,163 @@
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import random
+import re
+
+from .entities import EMPTY_INSIGHTS, Insights
+from .metrics import metrics
+from .resolver import EntityResolver, normalize
+
+# "off" always extracts, "shadow" always extracts but records what the gate would have done,
+# "on" skips extraction for messages scored below the threshold
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "shadow")
+
+# Messages scoring below this are treated as content-free
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", 0.3))
+
+# Share of skipped messages still extracted in the background (mode "on") to keep measuring misses
+PREFILTER_AUDIT_RATE = float(os.getenv("PREFILTER_AUDIT_RATE", 0.05))
+
+# Optional logistic model over the gate's features: {"bias": b, "weights": {feature: w}}
+PREFILTER_MODEL_PATH = os.getenv("PREFILTER_MODEL_PATH")
+
+# Weights used when no model is configured; the score is their sum, capped at 1
+HEURISTIC_WEIGHTS = {
+    "known_entity": 0.6,
+    "proper_noun": 0.3,
+    "relationship_word": 0.3,
+    "first_person": 0.2,
+    "narrative": 0.2,
+    "preference": 0.2,
+    "long": 0.2
+}
+
+ACKNOWLEDGEMENTS = {
+    "ok", "okay", "k", "kk", "thanks", "thank", "you", "thx", "ty", "yes", "yeah", "yep", "no", "nope", "sure",
+    "cool", "nice", "great", "awesome", "got", "it", "lol", "haha", "hi", "hey", "hello", "bye", "good", "night",
+    "morning", "sounds", "perfect", "right", "makes", "sense", "alright", "that", "helps", "wow", "oh", "ah", "hmm"
+}
+FIRST_PERSON = {"i", "im", "ive", "id", "ill", "me", "my", "mine", "myself", "we", "our", "us"}
+RELATIONSHIP_WORDS = {
+    "friend", "friends", "mom", "mum", "dad", "mother", "father", "sister", "brother", "wife", "husband", "partner",
+    "boyfriend", "girlfriend", "son", "daughter", "boss", "manager", "coworker", "colleague", "roommate", "cousin",
+    "aunt", "uncle", "grandma", "grandpa", "neighbor", "neighbour", "teacher", "mentor", "team"
+}
+NARRATIVE_WORDS = {
+    "yesterday", "today", "tonight", "weekend", "last", "ago", "went", "met", "told", "said", "visited", "moved",
+    "started", "finished", "happened", "remember", "when", "trip", "birthday", "wedding"
+}
+PREFERENCE_WORDS = {"love", "like", "enjoy", "into", "hobby", "passionate", "hate", "favorite", "favourite", "learning"}
+
+_WORD = re.compile(r"[A-Za-z][\w']*")
+
+class GateDecision:
+    """The gate's verdict on one message."""
+    __slots__ = ("score", "features", "skip")
+
+    def __init__(self, score: float, features: Dict[str, float], skip: bool):
+        self.score = score
+        self.features = features
+        self.skip = skip
+
+    def details(self) -> Dict[str, Any]:
+        return {"prefilter_score": round(self.score, 3), "prefilter_skip": self.skip,
+                "prefilter_signals": sorted(k for k, v in self.features.items() if v)}
+
+def _load_model(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading prefilter model: {str(e)}")
+        return None
+
+class InsightGate:
+    """Local check of whether a message is worth an insight-extraction call."""
+
+    def __init__(self, resolver: EntityResolver, mode: str = PREFILTER_MODE, threshold: float = PREFILTER_THRESHOLD):
+        self.resolver = resolver
+        self.mode = mode
+        self.threshold = threshold
+        self.model = _load_model(PREFILTER_MODEL_PATH)
+        self._audits = set()
+        # Totals behind the skip-rate and missed-insight-rate gauges
+        self.checked = 0
+        self.skipped = 0
+        self.evaluated_skips = 0
+        self.missed = 0
+
+    def features(self, user_id: str, text: str) -> Dict[str, float]:
+        matches = list(_WORD.finditer(text))
+        words = [m.group() for m in matches]
+        lowered = [normalize(w).replace(" ", "") for w in words]
+        # Capitalized words that don't start a sentence and aren't "I"
+        proper = [
+            m.group() for m in matches
+            if m.group()[0].isupper() and m.group() != "I" and text[:m.start()].rstrip()[-1:] not in ("", ".", "!", "?")
+        ]
+        people, interests = self.resolver.find_mentions(user_id, text) if user_id else ([], [])
+        return {
+            "known_entity": float(bool(people or interests)),
+            "proper_noun": float(bool(proper)),
+            "relationship_word": float(any(w in RELATIONSHIP_WORDS for w in lowered)),
+            "first_person": float(any(w in FIRST_PERSON for w in lowered)),
+            "narrative": float(any(w in NARRATIVE_WORDS for w in lowered)),
+            "preference": float(any(w in PREFERENCE_WORDS for w in lowered)),
+            "long": float(len(words) >= 12),
+            "acknowledgement": float(bool(lowered) and all(w in ACKNOWLEDGEMENTS for w in lowered))
+        }
+
+    def check(self, user_id: str, text: str) -> GateDecision:
+        features = self.features(user_id, text)
+        if features["acknowledgement"] or not text.strip():
+            score = 0.0
+        elif self.model:
+            z = self.model.get("bias", 0.0) + sum(self.model.get("weights", {}).get(k, 0.0) * v for k, v in features.items())
+            score = 1 / (1 + math.exp(-z))
+        else:
+            score = min(1.0, sum(HEURISTIC_WEIGHTS.get(k, 0.0) * v for k, v in features.items()))
+        return GateDecision(score, features, score < self.threshold)
+
+    async def extract(self, message_data: Dict[str, Any],
+                      extractor: Callable[[], Awaitable[Insights]]) -> Tuple[Insights, GateDecision]:
+        """Run the extractor unless the gate (in mode "on") decides the message is content-free."""
+        decision = self.check(message_data.get("user_id", ""), message_data.get("content", ""))
+        metrics.inc("prefilter", mode=self.mode, decision="skip" if decision.skip else "extract")
+        self.checked += 1
+        self.skipped += decision.skip
+        metrics.set("prefilter_skip_rate", self.skipped / self.checked, mode=self.mode)
+
+        if self.mode == "on" and decision.skip:
+            if random.random() < PREFILTER_AUDIT_RATE:
+                self._audit_later(decision, extractor)
+            return EMPTY_INSIGHTS, decision
+
+        insights = await extractor()
+        if self.mode == "shadow":
+            self._evaluate(decision, insights)
+        return insights, decision
+
+    def _evaluate(self, decision: GateDecision, insights: Insights) -> None:
+        """Compare the gate's verdict with what the extractor actually found."""
+        found = insights.has_content
+        metrics.inc("prefilter_eval", skip=decision.skip, found=found)
+        if decision.skip:
+            self.evaluated_skips += 1
+            self.missed += found
+            metrics.set("prefilter_missed_rate", self.missed / self.evaluated_skips, mode=self.mode)
+
+    def _audit_later(self, decision: GateDecision, extractor: Callable[[], Awaitable[Insights]]) -> None:
+        async def audit():
+            try:
+                self._evaluate(decision, await extractor())
+            except Exception as e:
+                print(f"Error in prefilter audit: {str(e)}")
+
+        task = asyncio.create_task(audit())
+        self._audits.add(task)
+        task.add_done_callback(self._audits.discard)
@@ -0,0 +1,150 @@
+from typing import Dict, Any, Optional, Union
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .serialization import dumps_str, loads, json_default
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, only needed for the binary protocol
+    msgpack = None
+
+# WebSocket subprotocols, in order of preference
+PROTOCOL_JSON = "persona.v1.json"
+PROTOCOL_MSGPACK = "persona.v2.msgpack"
+
+# Short codes used by the binary protocol
+PHASE_CODES = {
+    "understanding": 1,
+    "context": 2,
+    "generation": 3,
+    "adjustment": 4,
+    "complete": 5,
+    "error": 9
+}
+STATUS_CODES = {
+    "in_progress": 0,
+    "complete": 1,
+    "error": 2
+}
+
+# Fixed descriptive details that carry no per-request data
+COSMETIC_DETAILS = {"context_elements", "preserved_elements", "includes_context"}
+
+
+class FrameError(ValueError):
+    """Raised when a client frame can't be decoded with the connection's protocol."""
+
+
+class FrameEncoder:
+    """Encodes pipeline steps for one WebSocket connection.
+
+    The JSON protocol (default) keeps the original frame shape for old clients.
+    The msgpack protocol sends binary frames keyed by short codes:
+    p=phase, s=status, t=thinking, d=details, r=response, e=error.
+    In quiet mode in-progress frames, thinking text and cosmetic details are dropped.
+    """
+
+    def __init__(self, protocol: str = PROTOCOL_JSON, quiet: bool = False, offered: Optional[list] = None):
+        self.protocol = protocol
+        self.quiet = quiet
+        self.offered = offered or []
+
+    @classmethod
+    def negotiate(cls, websocket: WebSocket) -> "FrameEncoder":
+        """Pick the protocol from the offered subprotocols and the `quiet` query parameter."""
+        offered = websocket.scope.get("subprotocols", [])
+        protocol = PROTOCOL_JSON
+        if PROTOCOL_MSGPACK in offered and msgpack is not None:
+            protocol = PROTOCOL_MSGPACK
+        quiet = websocket.query_params.get("quiet", "").lower() in ("1", "true", "yes")
+        return cls(protocol, quiet, offered)
+
+    @property
+    def subprotocol(self) -> Optional[str]:
+        """Subprotocol to echo back on accept (None for clients that offered none)."""
+        return self.protocol if self.protocol in self.offered else None
+
+    @property
+    def binary(self) -> bool:
+        return self.protocol == PROTOCOL_MSGPACK
+
+    def encode(self, step: Dict[str, Any]) -> Optional[Union[str, bytes]]:
+        """Encode a pipeline step, or return None if it should not be sent."""
+        if self.quiet and step.get("status") == "in_progress":
+            return None
+
+        details = step.get("details", {})
+        if self.quiet:
+            details = {k: v for k, v in details.items() if k not in COSMETIC_DETAILS}
+
+        if not self.binary:
+            frame = {
+                "phase": step["phase"],
+                "status": step["status"],
+                "details": details,
+                **({"response": step["response"]} if "response" in step else {})
+            }
+            if not self.quiet:
+                frame["thinking"] = step["thinking"]
+            return dumps_str(frame)
+
+        frame = {
+            "p": PHASE_CODES.get(step["phase"], 0),
+            "s": STATUS_CODES.get(step["status"], 0)
+        }
+        if details:
+            frame["d"] = details
+        if "response" in step:
+            frame["r"] = step["response"]
+        if not self.quiet:
+            frame["t"] = step["thinking"]
+        return self._pack(frame)
+
+    def encode_error(self, message: str, **extra) -> Union[str, bytes]:
+        """Encode a connection-level error frame, with optional extra fields (e.g. retry_after)."""
+        if self.binary:
+            return self._pack({"e": message, **extra})
+        return dumps_str({"error": message, **extra})
+
+    def decode(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Decode an incoming ASGI websocket.receive message with the negotiated protocol.
+
+        Text frames are always JSON; binary frames are msgpack on the msgpack protocol and UTF-8 JSON
+        otherwise. Raises FrameError for frames that don't decode to an object.
+        """
+        try:
+            if message.get("bytes") is not None:
+                data = msgpack.unpackb(message["bytes"], raw=False) if self.binary else loads(message["bytes"])
+            else:
+                data = loads(message["text"])
+        except Exception as e:
+            raise FrameError(f"Could not decode {self.protocol} frame: {str(e)}") from None
+        if not isinstance(data, dict):
+            raise FrameError(f"Expected a {self.protocol} object, got {type(data).__name__}")
+        return data
+
+    async def send(self, websocket: WebSocket, step: Dict[str, Any]) -> None:
+        """Encode and send a pipeline step, skipping frames filtered out by quiet mode."""
+        await self._send(websocket, self.encode(step))
+
+    async def send_error(self, websocket: WebSocket, message: str, **extra) -> None:
+        await self._send(websocket, self.encode_error(message, **extra))
+
+    async def receive(self, websocket: WebSocket) -> Dict[str, Any]:
+        """Receive the next client message (see decode)."""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        return self.decode(message)
+
+    async def _send(self, websocket: WebSocket, frame: Optional[Union[str, bytes]]) -> None:
+        if frame is None:
+            return
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+    @staticmethod
+    def _pack(frame: Dict[str, Any]) -> bytes:
+        return msgpack.packb(frame, default=json_default, use_bin_type=True)
@@ -0,0 +1,259 @@
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from collections import OrderedDict
+from dataclasses import replace
+import asyncio
+import os
+import re
+import unicodedata
+
+import asyncpg
+
+from .entities import Insights
+from .metrics import metrics
+from .sharding import SHARD_MAIN, Shard, ShardRouter
+
+# Minimum trigram similarity for two names to be treated as the same entity
+RESOLVER_THRESHOLD = float(os.getenv("RESOLVER_THRESHOLD", 0.6))
+
+# Number of users whose name index is kept in memory
+RESOLVER_CACHE_SIZE = int(os.getenv("RESOLVER_CACHE_SIZE", 1000))
+
+# Candidates per mentioned name returned by the trigram lookup for cold users
+RESOLVER_CANDIDATES = 3
+
+KINDS = ("people", "interests")
+
+NAMES_QUERY = """
+    SELECT 'people' AS kind, name FROM people WHERE user_id = $1
+    UNION ALL
+    SELECT 'interests' AS kind, name FROM interests WHERE user_id = $1
+"""
+
+# One round trip for all mentions; each LATERAL lookup uses the trigram index on lower(name).
+# Keys are normalized (no backslashes) but may contain "_", which LIKE would treat as a wildcard.
+CANDIDATES_QUERY = """
+    SELECT 'people' AS kind, c.name
+    FROM unnest($2::text[]) AS m(key)
+    CROSS JOIN LATERAL (
+        SELECT name
+        FROM people
+        WHERE user_id = $1
+          AND (lower(name) % m.key OR lower(name) LIKE replace(replace(m.key, '_', '\\_'), '%', '\\%') || ' %')
+        ORDER BY similarity(lower(name), m.key) DESC
+        LIMIT $4
+    ) c
+    UNION ALL
+    SELECT 'interests' AS kind, c.name
+    FROM unnest($3::text[]) AS m(key)
+    CROSS JOIN LATERAL (
+        SELECT name
+        FROM interests
+        WHERE user_id = $1
+          AND lower(name) % m.key
+        ORDER BY similarity(lower(name), m.key) DESC
+        LIMIT $4
+    ) c
+"""
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize(name: str) -> str:
+    """Case-, accent- and punctuation-insensitive key for a name."""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = _PUNCTUATION.sub(" ", name.casefold())
+    return _SPACES.sub(" ", name).strip()
+
+def trigrams(key: str) -> Set[str]:
+    """Trigrams of a normalized key, padded per word the way pg_trgm does."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class NameIndex:
+    """In-memory index of one user's people or interest names."""
+    __slots__ = ("names", "grams", "by_token")
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: Dict[str, str] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        self.by_token: Dict[str, Set[str]] = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str) -> None:
+        key = normalize(name)
+        if not key or key in self.names:
+            return
+        self.names[key] = name
+        self.grams[key] = trigrams(key)
+        for token in key.split():
+            self.by_token.setdefault(token, set()).add(key)
+
+    def match(self, name: str, tokens: bool = True) -> Optional[str]:
+        """Return the stored name `name` refers to, or None if it looks new."""
+        key = normalize(name)
+        if not key:
+            return None
+        if key in self.names:
+            return self.names[key]
+
+        # "Sarah" <-> "Sarah Lee": same first token and one name's tokens contain the other's,
+        # accepted only when a single stored name fits
+        if tokens:
+            parts = key.split()
+            fits = [
+                other for other in self.by_token.get(parts[0], ())
+                if other.split()[0] == parts[0] and (set(parts) <= set(other.split()) or set(other.split()) <= set(parts))
+            ]
+            if len(fits) == 1:
+                return self.names[fits[0]]
+            if len(fits) > 1:
+                return None  # "Sarah" with both "Sarah Lee" and "Sarah Kim" known is ambiguous
+
+        # Typos and spelling variants
+        grams = trigrams(key)
+        best, best_score = None, 0.0
+        for other, other_grams in self.grams.items():
+            score = similarity(grams, other_grams)
+            if score >= RESOLVER_THRESHOLD and score > best_score:
+                best, best_score = other, score
+        return self.names[best] if best else None
+
+class EntityResolver:
+    """Maps the people and interests mentioned in a message onto the user's existing rows.
+
+    Warm users resolve against an in-memory name index; cold users are resolved with one
+    trigram-indexed query for all mentions while their index loads in the background.
+    """
+
+    def __init__(self, db_pool: asyncpg.Pool, shards: Optional[ShardRouter] = None,
+                 max_users: int = RESOLVER_CACHE_SIZE):
+        self.db = db_pool
+        self.shards = shards or ShardRouter(Shard(SHARD_MAIN, db_pool))
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, Dict[str, NameIndex]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    async def resolve(self, conn: asyncpg.Connection, user_id: str, insights: Insights) -> Insights:
+        """Return `insights` with every mentioned name replaced by the stored name it refers to."""
+        # Ordered and de-duplicated, so the first spelling in a message wins
+        mentions = {
+            "people": list(dict.fromkeys([p.name for p in insights.people] + [n for s in insights.stories for n in s.people])),
+            "interests": list(dict.fromkeys(i.name for i in insights.interests))
+        }
+        if not any(mentions.values()):
+            return insights
+
+        indexes = self._indexes.get(user_id)
+        if indexes is not None:
+            self._indexes.move_to_end(user_id)
+        else:
+            indexes = await self._candidates(conn, user_id, mentions)
+            self._load_later(user_id)
+
+        mapping = {kind: {} for kind in KINDS}
+        for kind in KINDS:
+            # Names new to the user are also merged with each other ("Sarah" and "sarah" in one message)
+            new = NameIndex()
+            for name in mentions[kind]:
+                tokens = kind == "people"
+                stored = indexes[kind].match(name, tokens) or new.match(name, tokens)
+                if stored is None:
+                    new.add(name)
+                elif stored != name:
+                    mapping[kind][name] = stored
+                metrics.inc("entities_resolved", kind=kind, merged=stored is not None)
+
+        return self._apply(insights, mapping) if any(mapping.values()) else insights
+
+    def find_mentions(self, user_id: str, text: str) -> Tuple[List[str], List[str]]:
+        """Stored people and interest names that appear in `text` (warm users only, no queries)."""
+        indexes = self._indexes.get(user_id)
+        if indexes is None:
+            return [], []
+
+        words = normalize(text).split()
+        phrases = {" ".join(words[i:i + n]) for n in (1, 2, 3) for i in range(len(words) - n + 1)}
+        people = indexes["people"]
+        found = {
+            "people": [people.names[p] for p in phrases if p in people.names],
+            "interests": [indexes["interests"].names[p] for p in phrases if p in indexes["interests"].names]
+        }
+        # A bare first name counts when it points at exactly one stored person
+        for word in set(words):
+            fits = [k for k in people.by_token.get(word, ()) if k.split()[0] == word]
+            if len(fits) == 1 and people.names[fits[0]] not in found["people"]:
+                found["people"].append(people.names[fits[0]])
+        return sorted(found["people"]), sorted(found["interests"])
+
+    def remember(self, user_id: str, insights: Insights) -> None:
+        """Add names saved for a warm user to its index."""
+        indexes = self._indexes.get(user_id)
+        if indexes is None:
+            return
+        for person in insights.people:
+            indexes["people"].add(person.name)
+        for interest in insights.interests:
+            indexes["interests"].add(interest.name)
+
+    async def _candidates(self, conn: asyncpg.Connection, user_id: str,
+                          mentions: Dict[str, List[str]]) -> Dict[str, NameIndex]:
+        """Small per-message index of stored names similar to the mentions."""
+        keys = {kind: [k for k in dict.fromkeys(normalize(name) for name in mentions[kind]) if k] for kind in KINDS}
+        rows = await conn.fetch(CANDIDATES_QUERY, user_id, keys["people"], keys["interests"], RESOLVER_CANDIDATES)
+        indexes = {kind: NameIndex() for kind in KINDS}
+        for row in rows:
+            indexes[row["kind"]].add(row["name"])
+        return indexes
+
+    def _load_later(self, user_id: str) -> None:
+        """Load the user's full name index in the background so their next message resolves in memory."""
+        if user_id in self._loading:
+            return
+        task = asyncio.create_task(self._load(user_id))
+        self._loading[user_id] = task
+        task.add_done_callback(lambda _: self._loading.pop(user_id, None))
+
+    async def _load(self, user_id: str) -> None:
+        try:
+            shard = await self.shards.locate(user_id)
+            rows = await shard.reads.run_read(user_id, lambda conn, _: conn.fetch(NAMES_QUERY, user_id))
+        except Exception as e:
+            print(f"Error loading name index: {str(e)}")
+            return
+
+        indexes = {kind: NameIndex() for kind in KINDS}
+        for row in rows:
+            indexes[row["kind"]].add(row["name"])
+        self._indexes[user_id] = indexes
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+
+    @staticmethod
+    def _apply(insights: Insights, mapping: Dict[str, Dict[str, str]]) -> Insights:
+        people, interests = mapping["people"], mapping["interests"]
+        return replace(
+            insights,
+            people=_dedupe(replace(p, name=people.get(p.name, p.name)) for p in insights.people),
+            interests=_dedupe(replace(i, name=interests.get(i.name, i.name)) for i in insights.interests),
+            stories=tuple(
+                replace(s, people=tuple(dict.fromkeys(people.get(n, n) for n in s.people)))
+                for s in insights.stories
+            )
+        )
+
+def _dedupe(items: Iterable[Any]) -> Tuple[Any, ...]:
+    """Keep the first entry per name, so two mentions of one entity become a single upsert."""
+    seen: Dict[str, Any] = {}
+    for item in items:
+        seen.setdefault(item.name, item)
+    return tuple(seen.values())
@@ -1,11 +1,33 @@
-from openai import AsyncOpenAI
-from typing import Dict, Any, AsyncGenerator
+from typing import Dict, Any, AsyncGenerator, Optional
+import time
 
-class ResponseAdjustor:
-    def __init__(self, api_key):
-        self.model = AsyncOpenAI(api_key=api_key)
+from .entities import UserContext
+from .llm import get_client
+from .routing import RouteDecision, model_registry, record_completion
 
-    async def process(self, message, context) -> AsyncGenerator[Dict[str, Any], None]:
+class StepwiseAdjustor:
+    """Adjustor that reports each step it takes; selected with ADJUSTOR_IMPL=stepwise."""
+
+    def __init__(self, api_key: str):
+        self.model = get_client(api_key)
+
+    async def process(self, message_data: Dict[str, Any], context: UserContext,
+                      route: Optional[RouteDecision] = None) -> str:
+        """Adjust the response to match the user's communication style."""
+        adjusted_response = message_data["content"]
+        async for step in self.steps(message_data, context, route):
+            if step["step"] == "result":
+                adjusted_response = step["content"]
+        return adjusted_response
+
+    async def steps(self, message: Dict[str, Any], context: UserContext,
+                    route: Optional[RouteDecision] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield each adjustment step; the last one is {"step": "result", "content": ...}."""
+        message_content = message.get("content", "") if isinstance(message, dict) else message
+        model = model_registry.get("adjustor", route.tier if route else "strong")
+        if not context.communication_style:
+            yield {"step": "result", "content": message_content}  # No adjustment needed
+            return
         try:
             # Step 1: Analyze current response
             yield {
@@ -23,7 +45,7 @@ class ResponseAdjustor:
             }
 
             # Step 2: Understand user's style
-            style = context.get('profile', {}).get('communication_style', {})
+            style = context.communication_style
             yield {
                 "step": "analyze_style",
                 "thinking": "Understanding user's communication preferences...",
@@ -53,7 +75,6 @@ class ResponseAdjustor:
             }
 
             # Step 4: Generate adjusted response
-            message_content = message.get("content", "") if isinstance(message, dict) else message
             prompt = f"""Adjust this AI response to match the user's communication style while maintaining the AI's perspective.
 
 AI Response to Adjust: {message_content}
@@ -73,20 +94,23 @@ Adjust the response now."""
                 "step": "generate_response",
                 "thinking": "Generating adjusted response...",
                 "details": {
-                    "model": "gpt-4",
+                    "model": model,
                     "temperature": 0.4,
                     "focus": "Style adjustment while preserving meaning"
                 }
             }
 
+            started = time.perf_counter()
             response = await self.model.chat.completions.create(
-                model="gpt-4",
+                model=model,
                 messages=[
                     {"role": "system", "content": "You adjust AI responses to match user communication styles while preserving content and the AI's perspective."},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.4
             )
+            record_completion("adjustor", model, started, response, route,
+                              message.get("user_id") if isinstance(message, dict) else None)
             
             adjusted_response = response.choices[0].message.content.strip()
             
@@ -102,9 +126,10 @@ Adjust the response now."""
                 }
             }
 
-            return adjusted_response
+            yield {"step": "result", "content": adjusted_response}
             
         except Exception as e:
+            print(f"Error in StepwiseAdjustor: {str(e)}")
             yield {
                 "step": "error",
                 "thinking": "Encountered an error during adjustment...",
@@ -113,4 +138,4 @@ Adjust the response now."""
                     "fallback": "Using original response"
                 }
             }
-            return message_content  # Return original if adjustment fails 
\ No newline at end of file
+            yield {"step": "result", "content": message_content}  # Return original if adjustment fails
@@ -0,0 +1,136 @@
+from typing import Dict, Any, Optional
+import os
+import re
+import time
+
+from .metrics import metrics
+from .ledger import ledger
+from .cassette import note_phase
+
+# Default strong/fast models, overridable per phase with MODEL_<PHASE>_<TIER>
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gpt-4")
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "gpt-3.5-turbo")
+
+# Router thresholds
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+SIMPLE_MAX_WORDS = int(os.getenv("ROUTER_SIMPLE_MAX_WORDS", 12))
+COMPLEX_MIN_WORDS = int(os.getenv("ROUTER_COMPLEX_MIN_WORDS", 80))
+DEEP_HISTORY_TURNS = int(os.getenv("ROUTER_DEEP_HISTORY_TURNS", 20))
+
+# USD per 1K tokens (input, output) for cost reporting
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+# Words that usually introduce people or events worth a stronger model
+ENTITY_HINT_WORDS = {
+    "mom", "dad", "mother", "father", "sister", "brother", "wife", "husband", "partner",
+    "boyfriend", "girlfriend", "friend", "boss", "coworker", "colleague", "son", "daughter",
+    "yesterday", "remember", "happened", "told", "trip"
+}
+_WORD = re.compile(r"[A-Za-z']+")
+_SENTENCE_START = re.compile(r"(?:^|[.!?]\s+)([A-Z][a-z']*)")
+
+class ModelRegistry:
+    """Fast and strong model per pipeline phase."""
+
+    PHASE_DEFAULTS = {
+        "listener": {"fast": FALLBACK_MODEL, "strong": DEFAULT_MODEL},
+        "generator": {"fast": FALLBACK_MODEL, "strong": DEFAULT_MODEL},
+        "adjustor": {"fast": FALLBACK_MODEL, "strong": FALLBACK_MODEL},
+        "title": {"fast": FALLBACK_MODEL, "strong": FALLBACK_MODEL}
+    }
+
+    def __init__(self):
+        self.models = {
+            phase: {
+                tier: os.getenv(f"MODEL_{phase.upper()}_{tier.upper()}", default)
+                for tier, default in tiers.items()
+            }
+            for phase, tiers in self.PHASE_DEFAULTS.items()
+        }
+
+    def get(self, phase: str, tier: str = "strong") -> str:
+        return self.models.get(phase, {}).get(tier, DEFAULT_MODEL)
+
+class RouteDecision:
+    """Tier chosen for one message and why."""
+    __slots__ = ("tier", "reason")
+
+    def __init__(self, tier: str, reason: str):
+        self.tier = tier
+        self.reason = reason
+
+    def details(self, phase: str) -> Dict[str, str]:
+        """Model and routing reason for a phase's `details`."""
+        return {
+            "model": model_registry.get(phase, self.tier),
+            "route": self.tier,
+            "routing_reason": self.reason
+        }
+
+class ModelRouter:
+    """Classifies messages from cheap local features to pick a model tier."""
+
+    def __init__(self, enabled: bool = MODEL_ROUTING):
+        self.enabled = enabled
+
+    def classify(self, content: str, history_depth: int = 0) -> RouteDecision:
+        if not self.enabled:
+            return RouteDecision("strong", "routing disabled")
+
+        words = _WORD.findall(content)
+        lowered = {w.lower() for w in words}
+        sentence_starts = set(_SENTENCE_START.findall(content))
+        names = {w for w in words if w[0].isupper() and w not in sentence_starts and w.split("'")[0] != "I"}
+        entity_hints = len(names) + len(lowered & ENTITY_HINT_WORDS)
+
+        if len(words) >= COMPLEX_MIN_WORDS:
+            return RouteDecision("strong", f"long message ({len(words)} words)")
+        if entity_hints:
+            return RouteDecision("strong", f"{entity_hints} entity hints")
+        if history_depth >= DEEP_HISTORY_TURNS:
+            return RouteDecision("strong", f"deep conversation ({history_depth} turns)")
+        if len(words) <= SIMPLE_MAX_WORDS:
+            return RouteDecision("fast", f"short message ({len(words)} words), no entity hints")
+        if content.count("?") >= 2:
+            return RouteDecision("strong", "multiple questions")
+        return RouteDecision("fast", "no complexity signals")
+
+# Model name prefixes that accept response_format={"type": "json_object"}
+JSON_MODE_PREFIXES = ("gpt-4o", "gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+
+def supports_json_mode(model: str) -> bool:
+    return model.startswith(JSON_MODE_PREFIXES)
+
+def estimate_cost(model: str, usage: Any) -> float:
+    """Estimated USD cost of a completion from its usage block."""
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES.get(DEFAULT_MODEL, (0.0, 0.0)))
+    return (
+        (getattr(usage, "prompt_tokens", 0) or 0) * prompt_price
+        + (getattr(usage, "completion_tokens", 0) or 0) * completion_price
+    ) / 1000
+
+def record_completion(phase: str, model: str, started: float, response: Any, route: Optional[RouteDecision] = None,
+                      user_id: Optional[str] = None) -> None:
+    """Record latency, tokens and cost of one LLM call, labelled by phase, model and route, in metrics and the ledger."""
+    tier = route.tier if route else "default"
+    metrics.observe("llm_latency_ms", (time.perf_counter() - started) * 1000, phase=phase, model=model, route=tier)
+    note_phase(response, phase)
+
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    metrics.inc("llm_prompt_tokens", usage.prompt_tokens or 0, phase=phase, model=model, route=tier)
+    metrics.inc("llm_completion_tokens", usage.completion_tokens or 0, phase=phase, model=model, route=tier)
+    cost = estimate_cost(model, usage)
+    metrics.inc("llm_cost_usd", cost, phase=phase, model=model, route=tier)
+    ledger.record(user_id, phase, model, usage, cost)
+
+# Shared registry for the process
+model_registry = ModelRegistry()
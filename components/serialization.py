@@ -0,0 +1,101 @@
+from typing import Any, Callable, Dict
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+import json
+import os
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, stdlib json is the fallback
+    orjson = None
+
+
+def json_default(obj: Any) -> Any:
+    """Encode the types that show up in pipeline payloads but aren't plain JSON."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if hasattr(obj, "items"):
+        # asyncpg Records and other mappings
+        return dict(obj.items())
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _stdlib_dumps_canonical(obj: Any) -> bytes:
+    return json.dumps(obj, default=json_default, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+# Dataclasses go through json_default too, so to_dict() decides their JSON shape
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS if orjson is not None else 0
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=json_default, option=_ORJSON_OPTIONS)
+
+
+def _orjson_dumps_canonical(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=json_default, option=_ORJSON_OPTIONS | orjson.OPT_SORT_KEYS)
+
+
+SERIALIZERS: Dict[str, Dict[str, Callable]] = {
+    "json": {"dumps": _stdlib_dumps, "dumps_canonical": _stdlib_dumps_canonical, "loads": json.loads},
+}
+if orjson is not None:
+    SERIALIZERS["orjson"] = {"dumps": _orjson_dumps, "dumps_canonical": _orjson_dumps_canonical, "loads": orjson.loads}
+
+_active = SERIALIZERS["orjson" if orjson is not None else "json"]
+
+
+def set_serializer(name: str) -> None:
+    """Select the serializer backend ("orjson" or "json")."""
+    global _active
+    if name not in SERIALIZERS:
+        print(f"Serializer '{name}' is not available, keeping the current one")
+        return
+    _active = SERIALIZERS[name]
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to UTF-8 encoded JSON bytes."""
+    return _active["dumps"](obj)
+
+
+def dumps_str(obj: Any) -> str:
+    """Serialize to a JSON string."""
+    return _active["dumps"](obj).decode("utf-8")
+
+
+def dumps_canonical(obj: Any) -> bytes:
+    """Serialize with sorted keys and no whitespace, byte-identical for equal inputs."""
+    return _active["dumps_canonical"](obj)
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from str or bytes."""
+    return _active["loads"](data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the active serializer, skipping jsonable_encoder."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Allow the backend to be picked per deployment
+if os.getenv("JSON_SERIALIZER"):
+    set_serializer(os.getenv("JSON_SERIALIZER"))
@@ -0,0 +1,249 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import bisect
+import hashlib
+import os
+import tempfile
+import time
+
+import asyncpg
+
+from .database import ReplicaRouter, create_pool
+from .metrics import metrics
+
+# Extra shards next to DATABASE_URL: comma-separated name=DSN pairs. The DATABASE_URL database is
+# always the "main" shard and holds the shard map, users' identity rows, chats and usage.
+SHARD_MAIN = "main"
+DATABASE_SHARD_URLS = dict(
+    part.strip().split("=", 1) for part in os.getenv("DATABASE_SHARD_URLS", "").split(",") if "=" in part
+)
+
+# Points per shard on the hash ring; more points spread users more evenly
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", 256))
+
+# Users whose placement is cached, and how long a cached placement is trusted
+SHARD_CACHE_SIZE = int(os.getenv("SHARD_CACHE_SIZE", 100000))
+SHARD_CACHE_TTL_SECONDS = float(os.getenv("SHARD_CACHE_TTL_SECONDS", 10))
+
+# Rows of a moving user kept in memory before spilling to a temp file
+SHARD_MOVE_SPOOL_BYTES = int(os.getenv("SHARD_MOVE_SPOOL_BYTES", 16 * 1024 * 1024))
+
+PLACEMENT_QUERY = "SELECT shard FROM shard_map WHERE user_id = $1"
+
+SET_PLACEMENT_QUERY = """
+    INSERT INTO shard_map (user_id, shard, moved_at)
+    VALUES ($1, $2, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+    SET shard = EXCLUDED.shard, moved_at = NOW()
+"""
+
+# The user's knowledge graph in foreign-key order: what moves between shards
+GRAPH_TABLES: List[Tuple[str, Sequence[str], str]] = [
+    ("interests", ["id", "user_id", "name", "summary", "created_at"], "user_id = $1"),
+    ("people", ["id", "user_id", "name", "relationship", "demographic", "notes", "created_at"], "user_id = $1"),
+    ("stories", ["id", "user_id", "title", "description", "location", "timestamp", "tags", "created_at"], "user_id = $1"),
+    ("story_people", ["story_id", "person_id"], "story_id IN (SELECT id FROM stories WHERE user_id = $1)"),
+    ("person_interests", ["person_id", "interest_id"], "person_id IN (SELECT id FROM people WHERE user_id = $1)"),
+    # Copied rather than rebuilt, so snapshot versions keep increasing across moves (prompts are memoized
+    # per user and version)
+    ("user_context_snapshot", ["user_id", "version", "document", "updated_at"], "user_id = $1")
+]
+
+# Deleting these cascades to the join tables
+GRAPH_DELETES = [
+    "DELETE FROM user_context_snapshot WHERE user_id = $1",
+    "DELETE FROM stories WHERE user_id = $1",
+    "DELETE FROM people WHERE user_id = $1",
+    "DELETE FROM interests WHERE user_id = $1"
+]
+
+USER_ROW_QUERY = """
+    SELECT id, email, name, password, personality_traits, communication_style, demographic, created_at
+    FROM users
+    WHERE id = $1
+    FOR UPDATE
+"""
+
+# The profile lives with the graph; on main the identity row already exists and only the profile is copied
+UPSERT_USER_QUERY = """
+    INSERT INTO users (id, email, name, password, personality_traits, communication_style, demographic, created_at)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+    ON CONFLICT (id) DO UPDATE
+    SET name = EXCLUDED.name,
+        personality_traits = EXCLUDED.personality_traits,
+        communication_style = EXCLUDED.communication_style,
+        demographic = EXCLUDED.demographic
+"""
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hashing: adding or removing a shard only changes the home of ~1/N of the users."""
+
+    def __init__(self, names: Iterable[str], vnodes: int = SHARD_VNODES):
+        self._ring = sorted((_point(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        self._points = [point for point, _ in self._ring]
+
+    def lookup(self, key: str) -> str:
+        index = bisect.bisect(self._points, _point(key)) % len(self._ring)
+        return self._ring[index][1]
+
+class UserMoved(Exception):
+    """Raised when a user's rows are no longer on the shard a write was sent to."""
+
+class Shard:
+    """One database holding a slice of the users: its primary pool and read router."""
+
+    def __init__(self, name: str, pool: asyncpg.Pool, reads: Optional[ReplicaRouter] = None):
+        self.name = name
+        self.pool = pool
+        self.reads = reads or ReplicaRouter(pool)
+
+class ShardRouter:
+    """Finds the shard holding a user's profile and knowledge graph.
+
+    A user's placement is their row in shard_map (on main), or main when they have none. The hash
+    ring gives each user's target shard, which rebalance_shards.py moves them to. With no extra
+    shards every lookup is main and nothing is queried.
+    """
+
+    def __init__(self, main: Shard, shards: Sequence[Shard] = (), vnodes: int = SHARD_VNODES,
+                 max_users: int = SHARD_CACHE_SIZE):
+        self.main = main
+        self.shards: Dict[str, Shard] = {main.name: main, **{shard.name: shard for shard in shards}}
+        self.ring = HashRing(self.shards, vnodes)
+        self.max_users = max_users
+        # user_id -> (shard name, time cached)
+        self._placements: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.shards) > 1
+
+    def target(self, user_id: str) -> str:
+        """Shard the user belongs on according to the hash ring."""
+        return self.ring.lookup(str(user_id))
+
+    async def locate(self, user_id: str, fresh: bool = False) -> Shard:
+        """Shard currently holding the user's rows."""
+        if not self.enabled:
+            return self.main
+        user_id = str(user_id)
+        cached = self._placements.get(user_id)
+        if cached is not None and not fresh and time.monotonic() - cached[1] < SHARD_CACHE_TTL_SECONDS:
+            self._placements.move_to_end(user_id)
+            metrics.inc("shard_lookups", source="cache")
+            return self.shards[cached[0]]
+
+        async with self.main.pool.acquire() as conn:
+            name = await conn.fetchval(PLACEMENT_QUERY, user_id) or SHARD_MAIN
+        metrics.inc("shard_lookups", source="directory")
+        if name not in self.shards:
+            raise ValueError(f"User {user_id} is placed on unknown shard {name!r}; add it to DATABASE_SHARD_URLS")
+
+        self._placements[user_id] = (name, time.monotonic())
+        self._placements.move_to_end(user_id)
+        while len(self._placements) > self.max_users:
+            self._placements.popitem(last=False)
+        return self.shards[name]
+
+    def forget(self, user_id: str) -> None:
+        self._placements.pop(str(user_id), None)
+
+    async def check_owner(self, conn: asyncpg.Connection, shard: Shard, user_id: str, locked: bool) -> None:
+        """Raise UserMoved when `shard` no longer holds the user; `locked` is whether their row was found.
+
+        Called right after locking the user's row, which a move holds until it commits, so a writer
+        that waited on a move always sees where the user went.
+        """
+        if not self.enabled:
+            return
+        if shard is not self.main:
+            if not locked:
+                raise UserMoved(user_id)
+            return
+        if await self.placed_elsewhere(conn, shard, user_id):
+            raise UserMoved(user_id)
+
+    async def placed_elsewhere(self, conn: asyncpg.Connection, shard: Shard, user_id: str) -> bool:
+        """Whether `shard` is main and only keeps the identity row of a user placed on another shard."""
+        if not self.enabled or shard is not self.main:
+            return False
+        # Main keeps the identity row of users moved away, so ask the shard map
+        placed = await conn.fetchval(PLACEMENT_QUERY, user_id)
+        return bool(placed) and placed != SHARD_MAIN
+
+    async def close(self) -> None:
+        for shard in self.shards.values():
+            if shard is not self.main:
+                await shard.reads.close()
+                await shard.pool.close()
+
+async def create_shard_router(main_pool: asyncpg.Pool, main_reads: Optional[ReplicaRouter] = None,
+                              urls: Dict[str, str] = DATABASE_SHARD_URLS, **kwargs) -> ShardRouter:
+    """Router over main plus a pool per shard DSN; a shard that can't be reached fails startup,
+    since its users would otherwise be invisible."""
+    shards = []
+    for name, url in urls.items():
+        name = name.strip()
+        if name == SHARD_MAIN:
+            raise ValueError(f"Shard name {SHARD_MAIN!r} is reserved for DATABASE_URL")
+        shards.append(Shard(name, await create_pool(url.strip(), name=f"shard:{name}", **kwargs)))
+    return ShardRouter(Shard(SHARD_MAIN, main_pool, main_reads), shards)
+
+async def _copy_rows(source: asyncpg.Connection, target: asyncpg.Connection, table: str,
+                     columns: Sequence[str], where: str, user_id: str) -> int:
+    """Copy one table's rows for a user with binary COPY, spooled through memory or a temp file."""
+    with tempfile.SpooledTemporaryFile(max_size=SHARD_MOVE_SPOOL_BYTES) as buffer:
+        await source.copy_from_query(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", user_id,
+                                     output=buffer, format="binary")
+        buffer.seek(0)
+        status = await target.copy_to_table(table, source=buffer, columns=list(columns), format="binary")
+    return int(status.split()[-1])
+
+async def move_user(router: ShardRouter, user_id: str, target: str) -> Dict[str, int]:
+    """Move a user's profile and knowledge graph to another shard while the service keeps running.
+
+    The user's row stays locked on the source for the whole copy, so their writes wait and then
+    retry on the new shard; reads keep using the source until the shard map points at the target.
+    Rows are copied before anything is deleted, so an interrupted move can simply be run again.
+    Returns the rows copied per table.
+    """
+    user_id = str(user_id)
+    source = await router.locate(user_id, fresh=True)
+    destination = router.shards[target]
+    if source is destination:
+        return {}
+
+    counts = {}
+    started = time.perf_counter()
+    async with source.pool.acquire() as src, destination.pool.acquire() as dst:
+        async with src.transaction():
+            user = await src.fetchrow(USER_ROW_QUERY, user_id)
+            if user is None:
+                raise ValueError(f"User {user_id} not found on shard {source.name}")
+
+            async with dst.transaction():
+                # Leftovers of an earlier interrupted move would collide with the copied ids
+                for query in GRAPH_DELETES:
+                    await dst.execute(query, user_id)
+                await dst.execute(UPSERT_USER_QUERY, *user.values())
+                for table, columns, where in GRAPH_TABLES:
+                    counts[table] = await _copy_rows(src, dst, table, columns, where, user_id)
+
+            # The target has committed: point the shard map at it, then drop the source copy. Main
+            # keeps the identity row (chats reference it); other shards drop the user entirely.
+            if source is router.main:
+                await src.execute(SET_PLACEMENT_QUERY, user_id, target)
+                for query in GRAPH_DELETES:
+                    await src.execute(query, user_id)
+            else:
+                async with router.main.pool.acquire() as directory:
+                    await directory.execute(SET_PLACEMENT_QUERY, user_id, target)
+                await src.execute("DELETE FROM users WHERE id = $1", user_id)
+
+    router.forget(user_id)
+    metrics.inc("shard_moves", source=source.name, target=target)
+    metrics.observe("shard_move_ms", (time.perf_counter() - started) * 1000)
+    return counts
@@ -0,0 +1,164 @@
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+import asyncio
+import os
+import time
+
+from .metrics import metrics
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+class Stage:
+    """One step of a pipeline: reads the values named in `needs`, returns those named in `provides`.
+
+    `run(values)` returns a dict of its outputs, plus optionally "details" for the progress event.
+    Stages sharing a `phase` are reported as one phase; stages without one run silently. When the
+    stage fails or runs past its timeout, `fallback(values, error)` supplies the outputs instead
+    (without one the error ends the pipeline). STAGE_<NAME>_TIMEOUT_MS and STAGE_<NAME>_CONCURRENCY
+    override the timeout and the cap on executions of the stage running at once (0 means none).
+    """
+
+    def __init__(self, name: str, run: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 needs: Sequence[str] = (), provides: Sequence[str] = (), phase: Optional[str] = None,
+                 thinking: Tuple[str, str] = ("", ""), timeout_ms: float = 0, max_concurrency: int = 0,
+                 fallback: Optional[Callable[[Dict[str, Any], Exception], Dict[str, Any]]] = None):
+        self.name = name
+        self.run = run
+        self.needs = tuple(needs)
+        self.provides = tuple(provides)
+        self.phase = phase
+        self.thinking = thinking
+        self.timeout_ms = float(os.getenv(f"STAGE_{name.upper()}_TIMEOUT_MS", timeout_ms))
+        self.max_concurrency = int(os.getenv(f"STAGE_{name.upper()}_CONCURRENCY", max_concurrency))
+        self.fallback = fallback
+        # Shared by every pipeline the stage is part of
+        self._slots = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+
+    async def execute(self, values: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Run the stage under its cap, timeout and fallback; returns (outputs, details)."""
+        try:
+            if self._slots is None:
+                outputs = await self._run(values)
+            else:
+                queued = time.perf_counter()
+                async with self._slots:
+                    metrics.observe("stage_queue_ms", _elapsed_ms(queued), stage=self.name)
+                    outputs = await self._run(values)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            if reason == "error":
+                print(f"Error in stage {self.name}: {str(e)}")
+            metrics.inc("stage_fallback", stage=self.name, reason=reason)
+            outputs = dict(self.fallback(values, e))
+            outputs["details"] = {**outputs.get("details", {}), "fallback": reason}
+
+        details = outputs.pop("details", {})
+        missing = [name for name in self.provides if name not in outputs]
+        if missing:
+            raise ValueError(f"Stage {self.name} did not provide {', '.join(missing)}")
+        return outputs, details
+
+    async def _run(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        if self.timeout_ms > 0:
+            return dict(await asyncio.wait_for(self.run(values), self.timeout_ms / 1000))
+        return dict(await self.run(values))
+
+class StagePipeline:
+    """Runs stages as soon as their inputs exist, concurrently when independent, yielding progress events.
+
+    Events keep the pipeline's shape: {"phase", "thinking", "status": "in_progress"} when a phase's first
+    stage starts, and "complete" with the phase's details and `duration_ms` once all its stages are done.
+    """
+
+    def __init__(self, stages: Sequence[Stage], inputs: Sequence[str] = ()):
+        self.stages = list(stages)
+        self.inputs = tuple(inputs)
+
+        # Every need must come from an input or an earlier-finishing stage, and every output from one stage
+        provided_by: Dict[str, str] = {}
+        for stage in self.stages:
+            for name in stage.provides:
+                if name in provided_by or name in self.inputs:
+                    raise ValueError(f"{name!r} is provided by both {provided_by.get(name, 'the input')} and {stage.name}")
+                provided_by[name] = stage.name
+        available, pending = set(self.inputs), list(self.stages)
+        while pending:
+            ready = [stage for stage in pending if set(stage.needs) <= available]
+            if not ready:
+                missing = {need for stage in pending for need in stage.needs} - available - set(provided_by)
+                raise ValueError(f"Stages {', '.join(s.name for s in pending)} can't run: "
+                                 + (f"nothing provides {', '.join(sorted(missing))}" if missing else "they depend on each other"))
+            for stage in ready:
+                available.update(stage.provides)
+                pending.remove(stage)
+
+        self.phases: Dict[str, List[Stage]] = {}
+        for stage in self.stages:
+            if stage.phase:
+                self.phases.setdefault(stage.phase, []).append(stage)
+
+    @property
+    def names(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+    async def run(self, values: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Run every stage, adding their outputs to `values`."""
+        available: Set[str] = {name for name in self.inputs if name in values}
+        started: Set[str] = set()
+        running: Dict[asyncio.Task, Tuple[Stage, float]] = {}
+        phase_started: Dict[str, float] = {}
+        phase_done: Dict[str, Dict[str, Tuple[Dict[str, Any], float]]] = {}
+
+        try:
+            while len(started) < len(self.stages) or running:
+                for stage in self.stages:
+                    if stage.name in started or not set(stage.needs) <= available:
+                        continue
+                    started.add(stage.name)
+                    if stage.phase and stage.phase not in phase_started:
+                        phase_started[stage.phase] = time.perf_counter()
+                        yield {"phase": stage.phase, "thinking": self.phases[stage.phase][0].thinking[0],
+                               "status": "in_progress"}
+                    running[asyncio.create_task(stage.execute(values))] = (stage, time.perf_counter())
+
+                if not running:
+                    raise ValueError(f"Stages {', '.join(s.name for s in self.stages if s.name not in started)} "
+                                     f"are missing inputs")
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+                # Report in declaration order when several finish together
+                for task in sorted(finished, key=lambda t: self.stages.index(running[t][0])):
+                    stage, stage_started = running.pop(task)
+                    outputs, details = task.result()
+                    duration_ms = _elapsed_ms(stage_started)
+                    metrics.observe("stage_ms", duration_ms, stage=stage.name)
+                    values.update(outputs)
+                    available.update(outputs)
+                    if stage.phase:
+                        event = self._phase_done(stage, details, duration_ms, phase_started, phase_done)
+                        if event:
+                            yield event
+        finally:
+            # A failed stage (or a client going away) stops the rest
+            for task in running:
+                task.cancel()
+
+    def _phase_done(self, stage: Stage, details: Dict[str, Any], duration_ms: float,
+                    phase_started: Dict[str, float], phase_done: Dict[str, Dict[str, Tuple[Dict[str, Any], float]]]
+                    ) -> Optional[Dict[str, Any]]:
+        """Complete event for the stage's phase once its last stage has finished."""
+        done = phase_done.setdefault(stage.phase, {})
+        done[stage.name] = (details, duration_ms)
+        members = self.phases[stage.phase]
+        if len(done) < len(members):
+            return None
+
+        merged: Dict[str, Any] = {}
+        for member in members:
+            merged.update(done[member.name][0])
+        if len(members) > 1:
+            merged["stage_ms"] = {member.name: done[member.name][1] for member in members}
+        merged["duration_ms"] = _elapsed_ms(phase_started[stage.phase])
+        return {"phase": stage.phase, "thinking": members[-1].thinking[1], "status": "complete", "details": merged}
@@ -0,0 +1,128 @@
+from typing import Dict, Any, List, Optional
+import os
+import re
+
+# "adjust" runs the separate adjustment pass; "conditioned" compiles the style into generation
+# constraints and only falls back to the adjustor when the draft is out of spec
+STYLE_MODE = os.getenv("STYLE_MODE", "adjust")
+
+# Rough tokens per English word, used to size max_tokens from a word target
+TOKENS_PER_WORD = 1.4
+
+# How far past the tolerance a draft may drift before the adjustor is used
+LENGTH_SLACK = float(os.getenv("STYLE_LENGTH_SLACK", 1.5))
+
+_WORD = re.compile(r"\b\w+\b")
+_CONTRACTION = re.compile(r"\b\w+'(?:s|re|ve|ll|d|t|m)\b", re.IGNORECASE)
+_EMOJI = re.compile("[\U0001F300-\U0001FAFF☀-➿]")
+
+def _level(value: Any) -> Optional[float]:
+    """Read a 1-5 level stored either as a number or as {"level": n}."""
+    if isinstance(value, dict):
+        value = value.get("level")
+    return float(value) if isinstance(value, (int, float)) else None
+
+class StyleSpec:
+    """Generation constraints compiled from a user's communication_style."""
+    __slots__ = ("target_words", "tolerance", "formality", "structure", "questions", "notes")
+
+    def __init__(self, target_words: Optional[int] = None, tolerance: int = 0, formality: Optional[float] = None,
+                 structure: Optional[List[str]] = None, questions: Optional[int] = None, notes: Optional[List[str]] = None):
+        self.target_words = target_words
+        self.tolerance = tolerance
+        self.formality = formality
+        self.structure = structure or []
+        self.questions = questions
+        self.notes = notes or []
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        """Token cap with headroom above the longest acceptable reply."""
+        if not self.target_words:
+            return None
+        return int((self.target_words + self.tolerance) * LENGTH_SLACK * TOKENS_PER_WORD)
+
+    def instructions(self) -> str:
+        """Render the constraints as system prompt lines."""
+        lines = []
+        if self.target_words:
+            lines.append(f"Aim for about {self.target_words} words (acceptable range {max(1, self.target_words - self.tolerance)}-{self.target_words + self.tolerance}).")
+        if self.formality is not None:
+            if self.formality >= 4:
+                lines.append("Use a formal, professional tone without slang, emojis or contractions.")
+            elif self.formality <= 2:
+                lines.append("Use a casual, relaxed tone.")
+            else:
+                lines.append("Use a friendly, moderately informal tone.")
+        if self.structure:
+            lines.append("Structure the reply as: " + ", ".join(self.structure) + ".")
+        if self.questions is not None:
+            lines.append(f"Ask at most {self.questions} question{'s' if self.questions != 1 else ''}.")
+        lines.extend(self.notes)
+        return "\n".join(["Match the user's communication style:", *lines]) if lines else ""
+
+def compile_style(style: Any) -> Optional[StyleSpec]:
+    """Compile the communication_style JSONB (any of the stored shapes) into a StyleSpec."""
+    if not isinstance(style, dict) or not style:
+        return None
+
+    spec = StyleSpec()
+
+    # Target length: {"word_count": {"target", "tolerance"}} or {"message_length": {"preferred_word_count", "range_tolerance"}}
+    length = style.get("word_count") or style.get("message_length") or {}
+    if isinstance(length, dict):
+        target = length.get("target") or length.get("preferred_word_count")
+        if isinstance(target, (int, float)):
+            spec.target_words = int(target)
+            spec.tolerance = int(length.get("tolerance") or length.get("range_tolerance") or target * 0.3)
+
+    spec.formality = _level(style.get("formality_level"))
+
+    structure = style.get("response_structure")
+    if isinstance(structure, dict):
+        structure = structure.get("elements")
+    if isinstance(structure, list):
+        spec.structure = [str(s) for s in structure]
+
+    questions = style.get("questions_per_response")
+    if isinstance(style.get("question_frequency"), dict):
+        questions = style["question_frequency"].get("questions_per_response")
+    if isinstance(questions, (int, float)):
+        spec.questions = int(questions)
+
+    # Free-form guidance: remaining descriptions and extracted key aspects, in a stable order
+    handled = {"word_count", "message_length", "formality_level", "response_structure", "questions_per_response", "question_frequency"}
+    for key in sorted(style):
+        value = style[key]
+        if key in handled:
+            continue
+        if isinstance(value, dict) and isinstance(value.get("description"), str):
+            spec.notes.append(f"{key.replace('_', ' ').capitalize()}: {value['description']}")
+        elif key == "key_aspects" and isinstance(value, list) and value:
+            spec.notes.append("Style traits: " + ", ".join(str(v) for v in value) + ".")
+
+    return spec
+
+def check_draft(draft: str, spec: StyleSpec) -> List[str]:
+    """Cheap local check of a draft against the spec; returns the violations found."""
+    violations = []
+
+    if spec.target_words:
+        words = len(_WORD.findall(draft))
+        low = (spec.target_words - spec.tolerance * LENGTH_SLACK)
+        high = (spec.target_words + spec.tolerance * LENGTH_SLACK)
+        if words < low or words > high:
+            violations.append(f"length {words} words outside {max(0, int(low))}-{int(high)}")
+
+    if spec.questions is not None:
+        questions = draft.count("?")
+        if questions > spec.questions:
+            violations.append(f"{questions} questions, expected at most {spec.questions}")
+
+    if spec.formality is not None and spec.formality >= 4:
+        if _EMOJI.search(draft):
+            violations.append("emoji in a formal reply")
+        elif len(_CONTRACTION.findall(draft)) > 3:
+            violations.append("too many contractions for a formal reply")
+
+    return violations
@@ -0,0 +1,82 @@
+from typing import Dict, Any, List, Optional
+import asyncio
+import os
+import time
+
+from .llm import get_client
+from .conversation import ConversationStore
+from .routing import record_completion
+
+# Fold turns into the summary once this many have left the recent window
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", 10))
+
+# Cheap model used for summarization
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+
+# Upper bound on summary length, keeps prompt size flat as chats grow
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", 150))
+
+class ConversationSummarizer:
+    """Maintains a per-chat rolling summary of turns older than the recent window."""
+
+    def __init__(self, api_key: str, conversations: ConversationStore, every: int = SUMMARY_EVERY_TURNS):
+        self.model = get_client(api_key)
+        self.conversations = conversations
+        self.every = every
+        self._running = {}
+
+    def maybe_schedule(self, chat_id: str, user_id: str) -> None:
+        """Start a background fold if enough turns have dropped out of the window."""
+        state = self.conversations.cached_state(chat_id, user_id)
+        if state is None or chat_id in self._running:
+            return
+        if state.unsummarized < self.every:
+            return
+
+        task = asyncio.create_task(self._fold(chat_id, user_id))
+        self._running[chat_id] = task
+        task.add_done_callback(lambda _: self._running.pop(chat_id, None))
+
+    async def _fold(self, chat_id: str, user_id: str) -> None:
+        try:
+            state = self.conversations.cached_state(chat_id, user_id)
+            if state is None:
+                return
+            turns = await self.conversations.fetch_unsummarized(chat_id, state)
+            if not turns:
+                return
+
+            summary = await self.summarize(state.summary, turns, user_id)
+            await self.conversations.save_summary(chat_id, user_id, summary, len(turns), turns[-1]["created_at"])
+
+        except Exception as e:
+            print(f"Error in ConversationSummarizer: {str(e)}")
+
+    async def summarize(self, summary: str, turns: List[Dict[str, Any]], user_id: Optional[str] = None) -> str:
+        """Fold new turns into an existing summary."""
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+
+        prompt = f"""Update the running summary of a conversation with the new turns below.
+
+Current summary:
+{summary or "(none yet)"}
+
+New turns:
+{transcript}
+
+Keep facts about the user, people, plans and open questions. Drop small talk.
+Write at most {SUMMARY_MAX_WORDS} words and return only the updated summary."""
+
+        started = time.perf_counter()
+        response = await self.model.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": "You maintain concise running summaries of conversations."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_WORDS * 2
+        )
+        record_completion("summary", SUMMARY_MODEL, started, response, user_id=user_id)
+
+        return response.choices[0].message.content.strip()
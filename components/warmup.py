@@ -0,0 +1,106 @@
+from typing import Dict, Any, List
+import asyncio
+import os
+import time
+
+import asyncpg
+
+from .fetcher import HOT_READ_QUERIES
+from .metrics import metrics
+
+# Concurrent keep-alive connections opened to the LLM endpoint at startup
+LLM_PREWARM_CONNECTIONS = int(os.getenv("LLM_PREWARM_CONNECTIONS", 2))
+
+# Most active users (by messages in the last day) whose context is fetched and rendered at startup
+PRELOAD_ACTIVE_USERS = int(os.getenv("PRELOAD_ACTIVE_USERS", 0))
+
+ACTIVE_USERS_QUERY = """
+    SELECT c.user_id
+    FROM messages m
+    JOIN chats c ON c.id = m.chat_id
+    WHERE m.created_at > NOW() - INTERVAL '1 day'
+    GROUP BY c.user_id
+    ORDER BY COUNT(*) DESC
+    LIMIT $1
+"""
+
+STEPS = ("database", "statements", "llm", "contexts")
+
+# Steps that must succeed before the instance takes traffic; the others may fail without blocking readiness
+REQUIRED_STEPS = ("database", "statements")
+
+class Warmup:
+    """Startup warm-up of the DB pool, hot statements, LLM connections and active users' context."""
+
+    def __init__(self):
+        self.status = {step: "pending" for step in STEPS}
+        self.durations_ms = {}
+
+    @property
+    def ready(self) -> bool:
+        """Every step has finished and the required ones succeeded."""
+        return (all(state != "pending" for state in self.status.values())
+                and all(self.status[step] == "done" for step in REQUIRED_STEPS))
+
+    @property
+    def failed(self) -> List[str]:
+        return [step for step in STEPS if self.status[step] == "failed"]
+
+    def report(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "steps": dict(self.status), "failed": self.failed,
+                "duration_ms": dict(self.durations_ms)}
+
+    async def run(self, pipeline, db_pool: asyncpg.Pool) -> None:
+        """Run every step; a failed step is logged and marked so readiness never hangs on it."""
+        await self._step("database", self._hold_min_connections(db_pool, prepare=False))
+        await asyncio.gather(
+            self._step("statements", self._hold_min_connections(db_pool, prepare=True)),
+            self._step("llm", self._prewarm_llm(pipeline))
+        )
+        await self._step("contexts", self._preload_contexts(pipeline, db_pool))
+
+    async def _step(self, name: str, work) -> None:
+        started = time.perf_counter()
+        try:
+            await work
+            if self.status[name] == "pending":
+                self.status[name] = "done"
+        except Exception as e:
+            print(f"Error in warm-up step {name}: {str(e)}")
+            self.status[name] = "failed"
+        self.durations_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+        metrics.set("warmup_ms", self.durations_ms[name], step=name, status=self.status[name])
+
+    async def _hold_min_connections(self, db_pool: asyncpg.Pool, prepare: bool) -> None:
+        """Check out the pool's minimum connections at once so each one is opened (and optionally primed)."""
+        connections = await asyncio.gather(*(db_pool.acquire() for _ in range(db_pool.get_min_size())))
+        try:
+            if prepare:
+                # Executing once puts the statement in the connection's cache; NIL_UUID matches no rows
+                for conn in connections:
+                    for query, args in HOT_READ_QUERIES:
+                        await conn.fetch(query, *args)
+            else:
+                await asyncio.gather(*(conn.fetchval("SELECT 1") for conn in connections))
+        finally:
+            for conn in connections:
+                await db_pool.release(conn)
+
+    async def _prewarm_llm(self, pipeline) -> None:
+        """Open keep-alive connections on the shared client with a cheap authenticated request."""
+        client = pipeline.generator.model
+        await asyncio.gather(*(client.models.list() for _ in range(LLM_PREWARM_CONNECTIONS)))
+
+    async def _preload_contexts(self, pipeline, db_pool: asyncpg.Pool) -> None:
+        """Fetch and render the system prompt of the most active users so their first turn hits the caches."""
+        if PRELOAD_ACTIVE_USERS <= 0:
+            self.status["contexts"] = "skipped"
+            return
+
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch(ACTIVE_USERS_QUERY, PRELOAD_ACTIVE_USERS)
+
+        for row in rows:
+            user_id = str(row["user_id"])
+            context = await pipeline.fetcher.fetch_context(user_id)
+            pipeline.generator._create_system_prompt(context, user_id)
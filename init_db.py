@@ -23,6 +23,12 @@ async def init_db():
             # Drop existing tables in reverse order to handle dependencies
             print("Dropping existing tables...")
             await conn.execute("""
+                DROP TABLE IF EXISTS shard_map CASCADE;
+                DROP TABLE IF EXISTS user_context_snapshot CASCADE;
+                DROP TABLE IF EXISTS llm_budgets CASCADE;
+                DROP TABLE IF EXISTS llm_usage_daily CASCADE;
+                DROP TABLE IF EXISTS messages CASCADE;
+                DROP TABLE IF EXISTS chats CASCADE;
                 DROP TABLE IF EXISTS person_interests CASCADE;
                 DROP TABLE IF EXISTS story_people CASCADE;
                 DROP TABLE IF EXISTS interests CASCADE;
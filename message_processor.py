@@ -13,6 +13,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from components.pipeline import MessageProcessingPipeline
+from components.database import create_pool
 
 @dataclass
 class Message:
@@ -55,10 +56,11 @@ async def get_db_pool():
     if not hasattr(app.state, "db_pool"):
         db_url = os.getenv("DATABASE_URL")
         print(f"Connecting to database with URL: {db_url}")
-        app.state.db_pool = await asyncpg.create_pool(
+        app.state.db_pool = await create_pool(
             db_url,
-            min_size=1,
-            max_size=10
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            adaptive=os.getenv("DB_POOL_ADAPTIVE", "true").lower() == "true"
         )
     return app.state.db_pool
 
@@ -111,16 +113,14 @@ async def generate_title(
 ):
     """Generate a title for a new chat."""
     try:
-        # Use the generator component directly for title generation
+        # Titles run through the pipeline's "title" composition, as in server.py
         message_data = {
             "content": request["message"],
-            "system_prompt": "Generate a short, descriptive title (2-6 words) for a chat that starts with this message."
+            "user_id": request.get("user_id")
         }
         
-        response = await pipeline.generator.process(message_data, {})
-        
         return {
-            "title": response.strip('"').strip()  # Remove any quotes from the title
+            "title": await pipeline.generate_title(message_data)
         }
         
     except Exception as e:
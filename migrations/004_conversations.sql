@@ -0,0 +1,29 @@
+-- Conversation Store Migration
+
+-- Chats Table
+CREATE TABLE IF NOT EXISTS chats (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    title TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT fk_chats_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Messages Table
+CREATE TABLE IF NOT EXISTS messages (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    chat_id UUID NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT fk_messages_chat FOREIGN KEY (chat_id) REFERENCES chats(id) ON DELETE CASCADE
+);
+
+-- Drop existing indexes if they exist
+DROP INDEX IF EXISTS idx_chats_user_id;
+DROP INDEX IF EXISTS idx_messages_chat_created;
+
+-- Create indexes
+CREATE INDEX idx_chats_user_id ON chats(user_id);
+-- Serves "last N turns of a chat" with a single index range scan
+CREATE INDEX idx_messages_chat_created ON messages(chat_id, created_at DESC);
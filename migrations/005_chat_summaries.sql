@@ -0,0 +1,7 @@
+-- Rolling Chat Summaries Migration
+
+-- Summary of the turns older than the recent history window
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS summary TEXT;
+-- Number of turns folded into the summary, and the created_at of the last one
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS summarized_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS summarized_through TIMESTAMP;
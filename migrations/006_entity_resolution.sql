@@ -0,0 +1,13 @@
+-- Entity Resolution Migration
+
+-- Trigram similarity for fuzzy name lookups
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Drop existing indexes if they exist
+DROP INDEX IF EXISTS idx_people_name_trgm;
+DROP INDEX IF EXISTS idx_interests_name_trgm;
+
+-- Create indexes
+-- Serve "names similar to any mentioned name" for users whose name index is not in memory yet
+CREATE INDEX idx_people_name_trgm ON people USING GIN (lower(name) gin_trgm_ops);
+CREATE INDEX idx_interests_name_trgm ON interests USING GIN (lower(name) gin_trgm_ops);
@@ -0,0 +1,10 @@
+-- Knowledge Graph Traversal Migration
+
+-- Drop existing indexes if they exist
+DROP INDEX IF EXISTS idx_story_people_person_id;
+DROP INDEX IF EXISTS idx_person_interests_interest_id;
+
+-- Create indexes
+-- The primary keys cover story -> people and person -> interests; these cover the reverse hops
+CREATE INDEX idx_story_people_person_id ON story_people(person_id);
+CREATE INDEX idx_person_interests_interest_id ON person_interests(interest_id);
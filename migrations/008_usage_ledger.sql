@@ -0,0 +1,28 @@
+-- LLM Usage Ledger Migration
+
+-- Token and cost totals per user, phase, model and day ('' collects calls without a user, e.g. titles)
+CREATE TABLE IF NOT EXISTS llm_usage_daily (
+    user_id TEXT NOT NULL,
+    day DATE NOT NULL,
+    phase TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cached_prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, phase, model)
+);
+
+-- Per-user daily budgets in USD, overriding USER_DAILY_BUDGET_USD (0 means unlimited)
+CREATE TABLE IF NOT EXISTS llm_budgets (
+    user_id TEXT PRIMARY KEY,
+    daily_usd DOUBLE PRECISION NOT NULL
+);
+
+-- Drop existing indexes if they exist
+DROP INDEX IF EXISTS idx_llm_usage_daily_day;
+
+-- Create indexes
+-- Serves "all users over the last N days"; per-user lookups use the primary key
+CREATE INDEX idx_llm_usage_daily_day ON llm_usage_daily(day);
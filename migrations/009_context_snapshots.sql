@@ -0,0 +1,11 @@
+-- User Context Snapshot Migration
+
+-- Pre-built context document per user (profile, interests, people, 5 latest stories), rebuilt in the
+-- same transaction as every insight save; version increases by one on each rebuild
+CREATE TABLE IF NOT EXISTS user_context_snapshot (
+    user_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    document JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT fk_user_context_snapshot_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
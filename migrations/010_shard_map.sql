@@ -0,0 +1,16 @@
+-- Shard Map Migration
+
+-- Which shard holds each user's profile and knowledge graph (users without a row are on main).
+-- Only read on the DATABASE_URL database; shards get the table with the other migrations but leave it empty.
+CREATE TABLE IF NOT EXISTS shard_map (
+    user_id UUID PRIMARY KEY,
+    shard TEXT NOT NULL,
+    moved_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Drop existing indexes if they exist
+DROP INDEX IF EXISTS idx_shard_map_shard;
+
+-- Create indexes
+-- Serves per-shard user counts for rebalancing
+CREATE INDEX idx_shard_map_shard ON shard_map(shard);
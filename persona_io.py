@@ -0,0 +1,226 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+import asyncpg
+
+# Load environment variables
+load_dotenv()
+
+# Exported tables in foreign-key order, with their columns
+TABLES = {
+    "users": ["id", "email", "name", "password", "personality_traits", "communication_style", "demographic", "created_at"],
+    "interests": ["id", "user_id", "name", "summary", "created_at"],
+    "people": ["id", "user_id", "name", "relationship", "demographic", "notes", "created_at"],
+    "stories": ["id", "user_id", "title", "description", "location", "timestamp", "tags", "created_at"],
+    "story_people": ["story_id", "person_id"],
+    "person_interests": ["person_id", "interest_id"]
+}
+
+# Columns holding ids, rewritten through the id map on import
+ID_COLUMNS = {"id", "user_id", "story_id", "person_id", "interest_id"}
+
+# Rows of each table that belong to the selected users ($1, or every user when NULL)
+SELECTIONS = {
+    "users": "$1::uuid[] IS NULL OR id = ANY($1::uuid[])",
+    "interests": "$1::uuid[] IS NULL OR user_id = ANY($1::uuid[])",
+    "people": "$1::uuid[] IS NULL OR user_id = ANY($1::uuid[])",
+    "stories": "$1::uuid[] IS NULL OR user_id = ANY($1::uuid[])",
+    "story_people": "$1::uuid[] IS NULL OR story_id IN (SELECT id FROM stories WHERE user_id = ANY($1::uuid[]))",
+    "person_interests": "$1::uuid[] IS NULL OR person_id IN (SELECT id FROM people WHERE user_id = ANY($1::uuid[]))"
+}
+
+# NDJSON goes through COPY as one JSON document per line; CSV with control characters as quote and
+# delimiter passes the JSON through byte for byte (JSON escapes every control character itself)
+NDJSON_COPY = {"format": "csv", "quote": "\x01", "delimiter": "\x02"}
+
+FORMATS = {"ndjson": ".ndjson", "binary": ".copy"}
+
+# Connections used to copy tables in parallel
+IO_CONNECTIONS = int(os.getenv("PERSONA_IO_CONNECTIONS", len(TABLES)))
+
+def _count(status: str) -> int:
+    """Row count from a COPY command status ("COPY 123")."""
+    return int(status.split()[-1])
+
+def _report(action: str, counts: Dict[str, int], seconds: Dict[str, float], total_seconds: float) -> None:
+    for table in TABLES:
+        if table in counts:
+            rate = counts[table] / seconds[table] if seconds[table] else 0
+            print(f"  {table:<17} {counts[table]:>10} rows  {seconds[table]:>7.2f} s  {rate:>10.0f} rows/s")
+    total = sum(counts.values())
+    print(f"{action} {total} rows in {total_seconds:.2f} s ({total / total_seconds if total_seconds else 0:.0f} rows/s)")
+
+async def select_users(conn: asyncpg.Connection, user_ids: List[str], email_like: Optional[str]) -> Optional[List[str]]:
+    """Ids of the users to export, or None for all of them."""
+    if email_like:
+        rows = await conn.fetch("SELECT id FROM users WHERE email LIKE $1", email_like)
+        user_ids = [*user_ids, *(str(row["id"]) for row in rows)]
+    elif not user_ids:
+        return None
+    return user_ids
+
+async def export_users(pool: asyncpg.Pool, directory: Path, fmt: str = "ndjson",
+                       user_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """Stream every table to `directory` in parallel, all from one consistent snapshot."""
+    directory.mkdir(parents=True, exist_ok=True)
+    counts, seconds = {}, {}
+    started = time.perf_counter()
+
+    async with pool.acquire() as coordinator:
+        # Hold a snapshot open and have every worker read through it, like pg_dump --jobs
+        async with coordinator.transaction(isolation="repeatable_read", readonly=True):
+            snapshot = await coordinator.fetchval("SELECT pg_export_snapshot()")
+            slots = asyncio.Semaphore(IO_CONNECTIONS)
+
+            async def export_table(table: str) -> None:
+                columns = ", ".join(TABLES[table])
+                query = f"SELECT {columns} FROM {table} WHERE {SELECTIONS[table]}"
+                if fmt == "ndjson":
+                    query = f"SELECT row_to_json(t) FROM ({query}) t"
+                options = NDJSON_COPY if fmt == "ndjson" else {"format": "binary"}
+
+                async with slots, pool.acquire() as conn:
+                    async with conn.transaction(isolation="repeatable_read", readonly=True):
+                        await conn.execute(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+                        table_started = time.perf_counter()
+                        status = await conn.copy_from_query(query, user_ids, output=directory / f"{table}{FORMATS[fmt]}",
+                                                            **options)
+                counts[table] = _count(status)
+                seconds[table] = time.perf_counter() - table_started
+
+            await asyncio.gather(*(export_table(table) for table in TABLES))
+
+    manifest = {
+        "format": fmt,
+        "exported_at": datetime.now().isoformat(),
+        "users": len(user_ids) if user_ids is not None else None,
+        "tables": {table: {"columns": TABLES[table], "rows": counts[table]} for table in TABLES}
+    }
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    _report("Exported", counts, seconds, time.perf_counter() - started)
+    return counts
+
+def _insert_query(table: str, source: str, id_map: str, email_prefix: str) -> str:
+    """Move staged rows into `table`, rewriting ids through the id map."""
+    columns = TABLES[table]
+    joins, values = [], []
+    for column in columns:
+        if column in ID_COLUMNS:
+            alias = f"m_{column}"
+            joins.append(f"JOIN {id_map} {alias} ON {alias}.old_id = s.{column}")
+            values.append(f"{alias}.new_id")
+        elif column == "email" and email_prefix:
+            values.append("$1 || s.email")
+        else:
+            values.append(f"s.{column}")
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        SELECT {", ".join(values)}
+        FROM {source} s
+        {" ".join(joins)}
+    """
+
+async def import_users(pool: asyncpg.Pool, directory: Path, remap: bool = False, email_prefix: str = "") -> Dict[str, int]:
+    """Load an export: stage every file with COPY in parallel, then insert with remapped ids in one transaction."""
+    manifest = json.loads((directory / "manifest.json").read_text())
+    fmt = manifest["format"]
+    suffix = uuid.uuid4().hex[:8]
+    staging = {table: f"import_{table}_{suffix}" for table in TABLES}
+    id_map = f"import_id_map_{suffix}"
+    counts, seconds = {}, {}
+    started = time.perf_counter()
+
+    # NDJSON stages whole documents and expands them with jsonb_populate_record; binary stages typed rows
+    sources = {
+        table: (
+            f"(SELECT r.* FROM {staging[table]}, jsonb_populate_record(NULL::{table}, doc) r)"
+            if fmt == "ndjson" else staging[table]
+        )
+        for table in TABLES
+    }
+
+    try:
+        async with pool.acquire() as conn:
+            for table in TABLES:
+                if fmt == "ndjson":
+                    await conn.execute(f"CREATE UNLOGGED TABLE {staging[table]} (doc jsonb)")
+                else:
+                    await conn.execute(f"CREATE UNLOGGED TABLE {staging[table]} AS SELECT {', '.join(TABLES[table])} "
+                                       f"FROM {table} WITH NO DATA")
+
+        slots = asyncio.Semaphore(IO_CONNECTIONS)
+
+        async def stage_table(table: str) -> None:
+            async with slots, pool.acquire() as conn:
+                table_started = time.perf_counter()
+                if fmt == "ndjson":
+                    status = await conn.copy_to_table(staging[table], source=directory / f"{table}{FORMATS[fmt]}",
+                                                      **NDJSON_COPY)
+                else:
+                    status = await conn.copy_to_table(staging[table], source=directory / f"{table}{FORMATS[fmt]}",
+                                                      format="binary")
+                counts[table] = _count(status)
+                seconds[table] = time.perf_counter() - table_started
+
+        await asyncio.gather(*(stage_table(table) for table in TABLES))
+        staged = time.perf_counter()
+
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # Old -> new id for every entity; the join tables only reference them
+                await conn.execute(f"CREATE TEMP TABLE {id_map} (old_id uuid PRIMARY KEY, new_id uuid NOT NULL) ON COMMIT DROP")
+                for table in ("users", "interests", "people", "stories"):
+                    await conn.execute(f"""
+                        INSERT INTO {id_map} (old_id, new_id)
+                        SELECT id, {"gen_random_uuid()" if remap else "id"} FROM {sources[table]} s
+                    """)
+                for table in TABLES:
+                    query = _insert_query(table, sources[table], id_map, email_prefix)
+                    await conn.execute(query, *([email_prefix] if email_prefix and table == "users" else []))
+        print(f"Staged in {staged - started:.2f} s, inserted in {time.perf_counter() - staged:.2f} s")
+
+    finally:
+        async with pool.acquire() as conn:
+            for table in TABLES:
+                await conn.execute(f"DROP TABLE IF EXISTS {staging[table]}")
+
+    _report("Imported", counts, seconds, time.perf_counter() - started)
+    return counts
+
+async def main():
+    parser = argparse.ArgumentParser(description="Export or import users with their interests, people and stories.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write users and their knowledge graph to a directory")
+    export.add_argument("directory", type=Path)
+    export.add_argument("--format", choices=sorted(FORMATS), default="ndjson",
+                        help="ndjson (portable, one JSON row per line) or binary (Postgres COPY, fastest)")
+    export.add_argument("--user", action="append", default=[], help="User id to export (repeatable)")
+    export.add_argument("--email-like", help="Export users whose email matches this LIKE pattern")
+
+    load = commands.add_parser("import", help="Load a directory written by export")
+    load.add_argument("directory", type=Path)
+    load.add_argument("--remap", action="store_true", help="Give every row a new id (clone instead of restore)")
+    load.add_argument("--email-prefix", default="", help="Prefix for imported emails (needed when cloning users)")
+
+    args = parser.parse_args()
+    pool = await asyncpg.create_pool(os.getenv("DATABASE_URL"), min_size=1, max_size=IO_CONNECTIONS + 1)
+    try:
+        if args.command == "export":
+            async with pool.acquire() as conn:
+                user_ids = await select_users(conn, args.user, args.email_like)
+            await export_users(pool, args.directory, args.format, user_ids)
+        else:
+            await import_users(pool, args.directory, args.remap, args.email_prefix)
+    finally:
+        await pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
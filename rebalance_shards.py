@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from dotenv import load_dotenv
+
+from components.database import create_pool
+from components.sharding import ShardRouter, create_shard_router, move_user
+
+# Load environment variables
+load_dotenv()
+
+# Users moved at the same time
+REBALANCE_CONCURRENCY = int(os.getenv("REBALANCE_CONCURRENCY", 4))
+
+# Every user (all have an identity row on main) with the shard currently holding their rows
+PLACEMENTS_QUERY = """
+    SELECT u.id, COALESCE(m.shard, 'main') AS shard
+    FROM users u
+    LEFT JOIN shard_map m ON m.user_id = u.id
+    ORDER BY u.id
+"""
+
+async def misplaced(router: ShardRouter) -> list:
+    """(user_id, current shard, target shard) for users not on their hash-ring shard."""
+    async with router.main.pool.acquire() as conn:
+        rows = await conn.fetch(PLACEMENTS_QUERY)
+    current = Counter(row["shard"] for row in rows)
+    target = Counter(router.target(str(row["id"])) for row in rows)
+    for name in router.shards:
+        print(f"  {name:<12} {current[name]:>8} users now  {target[name]:>8} on the ring")
+    return [(str(row["id"]), row["shard"], router.target(str(row["id"])))
+            for row in rows if row["shard"] != router.target(str(row["id"]))]
+
+async def rebalance(router: ShardRouter, limit: int = 0, dry_run: bool = False,
+                    concurrency: int = REBALANCE_CONCURRENCY) -> int:
+    """Move users onto their hash-ring shard; returns how many were moved."""
+    moves = await misplaced(router)
+    if limit:
+        moves = moves[:limit]
+    print(f"{len(moves)} users to move")
+    if dry_run:
+        for user_id, source, target in moves:
+            print(f"  {user_id}: {source} -> {target}")
+        return 0
+
+    slots = asyncio.Semaphore(concurrency)
+    moved = 0
+    started = time.perf_counter()
+
+    async def move(user_id: str, source: str, target: str) -> None:
+        nonlocal moved
+        async with slots:
+            try:
+                counts = await move_user(router, user_id, target)
+            except Exception as e:
+                print(f"Error moving {user_id} from {source} to {target}: {str(e)}")
+                return
+        moved += 1
+        print(f"  {user_id}: {source} -> {target} ({sum(counts.values())} rows)")
+
+    await asyncio.gather(*(move(*entry) for entry in moves))
+    print(f"Moved {moved} users in {time.perf_counter() - started:.2f} s")
+    return moved
+
+async def main():
+    parser = argparse.ArgumentParser(description="Move users between the shards in DATABASE_SHARD_URLS.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="Users per shard now and according to the hash ring")
+
+    run = commands.add_parser("run", help="Move every user not on their hash-ring shard")
+    run.add_argument("--limit", type=int, default=0, help="Move at most this many users")
+    run.add_argument("--dry-run", action="store_true", help="Only list the moves")
+    run.add_argument("--concurrency", type=int, default=REBALANCE_CONCURRENCY)
+
+    single = commands.add_parser("move", help="Move one user to a given shard")
+    single.add_argument("user_id")
+    single.add_argument("shard")
+
+    args = parser.parse_args()
+    main_pool = await create_pool(os.getenv("DATABASE_URL"))
+    router = await create_shard_router(main_pool)
+    try:
+        if args.command == "status":
+            print(f"{len(await misplaced(router))} users not on their hash-ring shard")
+        elif args.command == "run":
+            await rebalance(router, args.limit, args.dry_run, args.concurrency)
+        else:
+            counts = await move_user(router, args.user_id, args.shard)
+            print(f"Moved {args.user_id} to {args.shard}: {counts}")
+    finally:
+        await router.close()
+        await main_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,66 +1,103 @@
-from fastapi import APIRouter, WebSocket
-from components.pipeline import MessageProcessingPipeline
-import json
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+from components.pipeline import PIPELINE_MODES, MessageProcessingPipeline
+from components.database import create_pool
+from components.protocol import FrameEncoder, FrameError
+from components.admission import AdmissionRejected, admission
+from components.deadline import Deadline
 import os
+import uuid
 from dotenv import load_dotenv
-import asyncpg
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 # Load environment variables
 load_dotenv()
 
 router = APIRouter()
 
+def _canonical_uuid(value: Any) -> Optional[str]:
+    """The UUID in its canonical form (as /process-message sees it), or None if it isn't one."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
 @router.websocket("/ws/pipeline")
 async def pipeline_websocket(websocket: WebSocket):
-    await websocket.accept()
+    # Negotiate the frame protocol (JSON by default, msgpack for clients that offer it)
+    encoder = FrameEncoder.negotiate(websocket)
+    await websocket.accept(subprotocol=encoder.subprotocol)
+    
+    # Reuse the app-wide pipeline (shared pool and chat caches) when the server provides one
+    shared_pipeline = getattr(websocket.app.state, "pipeline", None)
+    db_pool = None
     
-    # Initialize database connection with explicit environment variables
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        await websocket.send_json({
-            "error": "DATABASE_URL environment variable is not set"
-        })
-        await websocket.close()
-        return
+    if shared_pipeline is None:
+        # Initialize database connection with explicit environment variables
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            await encoder.send_error(websocket, "DATABASE_URL environment variable is not set")
+            await websocket.close()
+            return
+            
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            await encoder.send_error(websocket, "OPENAI_API_KEY environment variable is not set")
+            await websocket.close()
+            return
         
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        await websocket.send_json({
-            "error": "OPENAI_API_KEY environment variable is not set"
-        })
-        await websocket.close()
-        return
+        db_pool = await create_pool(
+            database_url,
+            ssl="require"
+        )
     
-    db_pool = await asyncpg.create_pool(
-        database_url,
-        ssl="require"
-    )
+    # Rate limited per key like /process-message when the client sends one
+    api_key = websocket.headers.get("x-api-key") or websocket.query_params.get("api_key")
     
     try:
         # Initialize pipeline with explicit API key
-        pipeline = MessageProcessingPipeline(db_pool, openai_api_key)
+        pipeline = shared_pipeline or MessageProcessingPipeline(db_pool, openai_api_key)
         
         while True:
             # Wait for message data from frontend
-            message_data = await websocket.receive_json()
+            try:
+                message_data = await encoder.receive(websocket)
+            except FrameError as e:
+                await encoder.send_error(websocket, str(e))
+                continue
+            if message_data.get("chat_id"):
+                message_data["chat_id"] = _canonical_uuid(message_data["chat_id"])
+                if not message_data["chat_id"]:
+                    await encoder.send_error(websocket, "chat_id must be a UUID")
+                    continue
+            if message_data.get("pipeline_mode") and message_data["pipeline_mode"] not in PIPELINE_MODES:
+                await encoder.send_error(websocket, f"pipeline_mode must be one of: {', '.join(PIPELINE_MODES)}")
+                continue
+            # Latency budget (client's deadline_ms or the default) counted from arrival
+            try:
+                message_data["deadline_at"] = Deadline.within(message_data.get("deadline_ms")).expires_at
+            except ValueError as e:
+                await encoder.send_error(websocket, str(e))
+                continue
             
-            # Process message through pipeline
-            async for step in pipeline.process_message(message_data):
-                # Send step data to frontend
-                await websocket.send_json({
-                    "phase": step["phase"],
-                    "status": step["status"],
-                    "thinking": step["thinking"],
-                    "details": step.get("details", {}),
-                    **({"response": step["response"]} if "response" in step else {})
-                })
+            # Process message through pipeline, once admitted; rejected messages get an error
+            # frame with retry_after and the connection stays open
+            try:
+                async with admission.admit(api_key, message_data.get("user_id")):
+                    async for step in pipeline.process_message(message_data):
+                        # Send step data to frontend
+                        await encoder.send(websocket, step)
+            except AdmissionRejected as e:
+                await encoder.send_error(websocket, e.reason, status=e.status_code, retry_after=e.retry_after)
+    
+    except WebSocketDisconnect:
+        pass
     
     except Exception as e:
-        await websocket.send_json({
-            "error": str(e)
-        })
+        await encoder.send_error(websocket, str(e))
     
     finally:
-        await db_pool.close()
-        await websocket.close() 
\ No newline at end of file
+        if db_pool:
+            await db_pool.close()
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
@@ -1,18 +1,28 @@
 from fastapi import FastAPI, HTTPException, Depends, Header, Request
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import os
 from dotenv import load_dotenv
 from fastapi.security import APIKeyHeader
 from components.pipeline import MessageProcessingPipeline
-from typing import List, Optional
+from typing import List, Literal, Optional
+from uuid import UUID
+from components.database import create_pool, create_replica_router
+from components.sharding import create_shard_router
+from components.serialization import FastJSONResponse
+from components.metrics import metrics
+from components.warmup import Warmup
+from components.admission import AdmissionRejected, admission
+from components.ledger import ledger
+from components.deadline import Deadline
+from components.idempotency import IdempotencyConflict, fingerprint, idempotency
 from routes import pipeline
-import asyncpg
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Include pipeline route
 app.include_router(pipeline.router, prefix="/api")
@@ -35,31 +45,56 @@ app.add_middleware(
 # Request models
 class MessageRequest(BaseModel):
     user_message: str = Field(..., description="The user's message")
-    chat_id: str = Field(..., description="The chat ID")
+    chat_id: UUID = Field(..., description="The chat ID")
     user_id: str = Field(..., description="The user's ID")
-    message_history: List[dict] = Field(default_factory=list, description="Previous messages in the chat")
+    message_history: List[dict] = Field(default_factory=list, description="Deprecated: previous messages are loaded server-side from chat_id")
     system_prompt: Optional[str] = Field(None, description="Optional system prompt")
+    pipeline_mode: Optional[Literal["staged", "fused"]] = Field(None, description="'staged' or 'fused'; defaults to PIPELINE_MODE")
 
 # Security setup
 API_KEY_NAME = "X-API-Key"
 API_KEY = os.getenv("API_KEY", "your-secret-api-key")  # You'll set this in Railway
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=True)
 
-# Database pool
+# Database pool and the shared pipeline (holds per-chat caches across requests)
 db_pool = None
+replica_router = None
+shard_router = None
+message_pipeline = None
+warmup = Warmup()
 
 @app.on_event("startup")
 async def startup():
-    global db_pool
+    global db_pool, replica_router, shard_router, message_pipeline
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise Exception("DATABASE_URL environment variable is not set")
-    db_pool = await asyncpg.create_pool(database_url, ssl="require")
+    pool_size = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+        # Size each pool between the two from acquire waits and the server's free connections
+        "adaptive": os.getenv("DB_POOL_ADAPTIVE", "true").lower() == "true"
+    }
+    db_pool = await create_pool(database_url, ssl="require", **pool_size)
+    # Read replicas from DATABASE_REPLICA_URLS, if any, with a pool each
+    replica_router = await create_replica_router(db_pool, ssl="require", **pool_size)
+    # Extra shards from DATABASE_SHARD_URLS, if any, with a pool each
+    shard_router = await create_shard_router(db_pool, replica_router, ssl="require", **pool_size)
+    message_pipeline = MessageProcessingPipeline(db_pool, os.getenv("OPENAI_API_KEY"), replica_router, shard_router)
+    app.state.pipeline = message_pipeline
+    await ledger.start(db_pool)
+
+    # Warm up in the background; /ready reports when it has finished
+    app.state.warmup_task = asyncio.create_task(warmup.run(message_pipeline, db_pool))
 
 @app.on_event("shutdown")
 async def shutdown():
     global db_pool
     if db_pool:
+        # Write buffered usage before the pool goes away
+        await ledger.stop()
+        await shard_router.close()
+        await replica_router.close()
         await db_pool.close()
 
 # Add a root endpoint for health check
@@ -67,6 +102,11 @@ async def shutdown():
 async def root():
     return {"status": "ok", "message": "Server is running"}
 
+# Readiness check: only passes once the pool, statements and LLM connections are warm
+@app.get("/ready")
+async def ready():
+    return FastJSONResponse(warmup.report(), status_code=200 if warmup.ready else 503)
+
 async def verify_api_key(api_key: str = Depends(api_key_header)):
     if api_key != API_KEY:
         raise HTTPException(
@@ -79,31 +119,50 @@ async def verify_api_key(api_key: str = Depends(api_key_header)):
 async def process_message(
     request: Request,
     request_data: MessageRequest,
-    api_key: str = Depends(verify_api_key)
+    api_key: str = Depends(verify_api_key),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    deadline_ms: Optional[float] = Header(None, alias="X-Deadline-Ms", gt=0, allow_inf_nan=False)
 ):
     try:
-        # Initialize pipeline for this request
-        pipeline = MessageProcessingPipeline(db_pool, os.getenv("OPENAI_API_KEY"))
-        
         # Process message
         message_data = {
             "content": request_data.user_message,
-            "chat_id": request_data.chat_id,
+            "chat_id": str(request_data.chat_id),
             "user_id": request_data.user_id,
             "message_history": request_data.message_history,
-            "system_prompt": request_data.system_prompt
+            "system_prompt": request_data.system_prompt,
+            "pipeline_mode": request_data.pipeline_mode,
+            # Latency budget counted from arrival, so time queued for admission is included
+            "deadline_at": Deadline.within(deadline_ms).expires_at
         }
         
-        # Process through pipeline and get final result
-        result = None
-        async for step in pipeline.process_message(message_data):
-            if step.get("phase") == "complete":
-                result = step.get("response")
+        # Process through pipeline and get final result, once admitted
+        async def run():
+            result = None
+            async with admission.admit(api_key, request_data.user_id):
+                async for step in message_pipeline.process_message(message_data):
+                    if step.get("phase") == "complete":
+                        result = step.get("response")
+            if not result:
+                raise HTTPException(status_code=500, detail="Pipeline did not produce a response")
+            return result
         
-        if not result:
-            raise HTTPException(status_code=500, detail="Pipeline did not produce a response")
+        # Retries and double submits share one pipeline run instead of saving the insights twice
+        payload = fingerprint(request_data.user_id, str(request_data.chat_id), request_data.user_message)
+        result, outcome = await idempotency.run("process-message", request_data.user_id, idempotency_key, payload, run)
             
-        return result
+        # Return the response directly so FastAPI skips jsonable_encoder
+        return FastJSONResponse(result, headers={"Idempotent-Replayed": "true"} if outcome != "executed" else None)
+    
+    except HTTPException:
+        raise
+    
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    except AdmissionRejected as e:
+        # Fail fast so clients back off instead of piling onto a saturated instance
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
         
     except Exception as e:
         print("Error processing message:", str(e))
@@ -113,25 +172,55 @@ async def process_message(
 async def generate_title(
     request: Request,
     request_data: dict,
-    api_key: str = Depends(verify_api_key)
+    api_key: str = Depends(verify_api_key),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     try:
-        # Initialize pipeline for this request
-        pipeline = MessageProcessingPipeline(db_pool, os.getenv("OPENAI_API_KEY"))
-        
-        # Use the generator component directly for title generation
+        # Titles run through the pipeline's "title" composition
         message_data = {
             "content": request_data["message"],
-            "system_prompt": "Generate a short, descriptive title (2-6 words) for a chat that starts with this message."
+            "user_id": request_data.get("user_id")
         }
         
-        initial_response = await pipeline.generator.process(message_data, {})
-        return {"title": initial_response.strip('"').strip()}
+        async def run():
+            return {"title": await message_pipeline.generate_title(message_data)}
+        
+        payload = fingerprint(request_data.get("user_id"), request_data["message"])
+        result, outcome = await idempotency.run("generate-title", request_data.get("user_id"), idempotency_key, payload, run)
+        return FastJSONResponse(result, headers={"Idempotent-Replayed": "true"} if outcome != "executed" else None)
+        
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
         
     except Exception as e:
         print("Error generating title:", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics(api_key: str = Depends(verify_api_key)):
+    """Process-local metrics: LLM latency, tokens and cost per phase, model and route."""
+    return FastJSONResponse(metrics.snapshot())
+
+@app.get("/usage")
+async def get_usage(user_id: Optional[str] = None, days: int = 7, api_key: str = Depends(verify_api_key)):
+    """Daily LLM tokens and cost per user, phase and model, plus the user's budget when one is given."""
+    try:
+        days = max(1, min(days, 366))
+        result = {"days": days, "usage": await ledger.query(user_id, days)}
+        if user_id:
+            result["budget"] = {**ledger.budget(user_id), "action": ledger.budget_action(user_id)}
+        return FastJSONResponse(result)
+
+    except Exception as e:
+        print("Error fetching usage:", str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        # Compress WebSocket frames for clients that negotiate permessage-deflate
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+    )
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+from components.database import create_pool
+from components.entities import UserContext
+from components.fetcher import FetcherAndSaver
+
+# Load environment variables
+load_dotenv()
+
+# Users checked per run; pass --repair to rebuild the snapshots that differ
+CHECK_LIMIT = int(os.getenv("SNAPSHOT_CHECK_LIMIT", 10000))
+
+USERS_QUERY = """
+    SELECT u.id, s.version, s.document
+    FROM users u
+    LEFT JOIN user_context_snapshot s ON s.user_id = u.id
+    ORDER BY u.id
+    LIMIT $1
+"""
+
+def diff(base: UserContext, snapshot: UserContext) -> list:
+    """Differences between the context built from the base tables and the snapshot."""
+    problems = []
+    if (base.profile and base.profile.to_dict()) != (snapshot.profile and snapshot.profile.to_dict()):
+        problems.append("profile differs")
+    for field in ("interests", "people", "stories"):
+        expected, actual = set(getattr(base, field)), set(getattr(snapshot, field))
+        for item in expected - actual:
+            problems.append(f"{field}: missing {item}")
+        for item in actual - expected:
+            problems.append(f"{field}: stale {item}")
+    return problems
+
+async def main():
+    repair = "--repair" in sys.argv
+    db_pool = await create_pool(os.getenv("DATABASE_URL"))
+    fetcher = FetcherAndSaver(db_pool)
+    checked, missing, drifted = 0, 0, 0
+
+    try:
+        async with db_pool.acquire() as conn:
+            for row in await conn.fetch(USERS_QUERY, CHECK_LIMIT):
+                checked += 1
+                user_id = str(row["id"])
+                if row["document"] is None:
+                    missing += 1
+                    print(f"{user_id}: no snapshot")
+                else:
+                    base = await fetcher._base_context(conn, user_id)
+                    problems = diff(base, UserContext.from_snapshot(row["document"], row["version"]))
+                    if not problems:
+                        continue
+                    drifted += 1
+                    print(f"{user_id} (version {row['version']}):")
+                    for problem in problems:
+                        print(f"  {problem}")
+
+                if repair:
+                    await fetcher.refresh_snapshot(conn, user_id)
+
+        print(f"\nChecked {checked} users: {missing} without a snapshot, {drifted} drifted"
+              + (" (repaired)" if repair and (missing or drifted) else ""))
+    finally:
+        await db_pool.close()
+
+    # Non-zero exit so the check can gate deploys
+    if drifted and not repair:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+from statistics import mean, median
+from dotenv import load_dotenv
+
+from components.database import create_pool
+from components.entities import Insights
+from components.fetcher import (
+    FetcherAndSaver, PROFILE_QUERY, INTERESTS_QUERY, PEOPLE_QUERY, STORIES_QUERY, PERSON_ID_QUERY,
+    NEIGHBOURHOOD_QUERY, SNAPSHOT_PATCH_QUERY, SNAPSHOT_REFRESH_QUERY, GRAPH_MAX_HOPS, GRAPH_FANOUT, GRAPH_MAX_NODES
+)
+from components.resolver import CANDIDATES_QUERY, RESOLVER_CANDIDATES, normalize
+from tests.synthetic_personas import generate_persona, load_persona, remove_synthetic
+
+# Load environment variables
+load_dotenv()
+
+# people:stories:interests per scale, e.g. "100:500:20,1000:5000:50,10000:50000:200"
+SCALES = os.getenv("BENCH_SCALES", "100:500:20,1000:5000:50,10000:50000:200")
+ROUNDS = int(os.getenv("BENCHMARK_ROUNDS", 30))
+OUTPUT_DIR = os.getenv("BENCH_OUTPUT_DIR", os.path.join(os.path.dirname(__file__), "results"))
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(mean(ordered), 3),
+        "p50_ms": round(median(ordered), 3),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+        "max_ms": round(ordered[-1], 3)
+    }
+
+async def timed(rounds: int, fn):
+    samples = []
+    for i in range(rounds):
+        started = time.perf_counter()
+        await fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+def plan_summary(plan) -> dict:
+    """Planning/execution time plus the node types and indexes of an EXPLAIN (ANALYZE, FORMAT JSON) plan."""
+    root = plan[0]
+    nodes, indexes = [], set()
+
+    def walk(node):
+        nodes.append(node["Node Type"])
+        if "Index Name" in node:
+            indexes.add(node["Index Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(root["Plan"])
+    return {
+        "planning_ms": root.get("Planning Time"),
+        "execution_ms": root.get("Execution Time"),
+        "seq_scans": nodes.count("Seq Scan"),
+        "node_types": sorted(set(nodes)),
+        "indexes": sorted(indexes)
+    }
+
+async def explain(conn, query: str, *args) -> dict:
+    plan = await conn.fetchval("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, *args)
+    return plan_summary(json.loads(plan) if isinstance(plan, str) else plan)
+
+def mention_insights(rng: random.Random, people, interests) -> Insights:
+    """A listener-shaped result mixing existing (differently cased) and new names."""
+    known = rng.sample(people, 2)
+    return Insights.from_llm({
+        "people": [{"name": known[0][2].lower(), "context": "mentioned again"},
+                   {"name": f"New Person {rng.randint(0, 10 ** 9)}", "context": "just met"}],
+        "interests": [{"name": rng.choice(interests)[2].upper(), "summary": "still into it"}],
+        "personality_traits": ["curious"],
+        "communication_style": {"key_aspects": ["brief"]},
+        "stories": [{"title": f"Bench story {rng.randint(0, 10 ** 9)}", "description": "A short story",
+                     "people": [known[0][2], known[1][2]], "location": "home"}]
+    })
+
+async def bench_scale(db_pool, fetcher: FetcherAndSaver, people: int, stories: int, interests: int,
+                      rng: random.Random) -> dict:
+    persona = generate_persona(rng, people, stories, interests)
+    async with db_pool.acquire() as conn:
+        started = time.perf_counter()
+        user_id = await load_persona(conn, persona)
+        load_ms = (time.perf_counter() - started) * 1000
+        await conn.execute("ANALYZE people; ANALYZE interests; ANALYZE stories; ANALYZE story_people; ANALYZE person_interests")
+
+    seeds = [p[2] for p in rng.sample(persona["people"], 2)]
+    paths = {
+        "fetch_context": await timed(ROUNDS, lambda _: fetcher.fetch_context(user_id)),
+        "fetch_context_graph": await timed(ROUNDS, lambda _: fetcher.fetch_context(user_id, seeds, [])),
+    }
+
+    # Cold: resolver index dropped before every save; warm: index already loaded
+    async def save_cold(_):
+        fetcher.resolver._indexes.pop(user_id, None)
+        await fetcher.save_insights(user_id, mention_insights(rng, persona["people"], persona["interests"]))
+
+    async def save_warm(_):
+        await fetcher.save_insights(user_id, mention_insights(rng, persona["people"], persona["interests"]))
+
+    paths["save_insights_cold"] = await timed(ROUNDS, save_cold)
+    await fetcher.resolver._load(user_id)
+    paths["save_insights_warm"] = await timed(ROUNDS, save_warm)
+
+    queries = {
+        "profile": (PROFILE_QUERY, user_id),
+        "interests": (INTERESTS_QUERY, user_id),
+        "people": (PEOPLE_QUERY, user_id),
+        "stories": (STORIES_QUERY, user_id),
+        "person_id": (PERSON_ID_QUERY, user_id, seeds[0]),
+        "neighbourhood": (NEIGHBOURHOOD_QUERY, user_id, seeds, [], GRAPH_MAX_HOPS, GRAPH_FANOUT, GRAPH_MAX_NODES),
+        "resolver_candidates": (CANDIDATES_QUERY, user_id, [normalize(n) for n in seeds],
+                                [normalize(persona["interests"][0][2])], RESOLVER_CANDIDATES),
+        # What a save holds the user's row lock for: the whole-graph rebuild vs the patch of a typical save
+        "snapshot_refresh": (SNAPSHOT_REFRESH_QUERY, user_id),
+        "snapshot_patch": (SNAPSHOT_PATCH_QUERY, user_id, True, [persona["interests"][0][2]], seeds, True)
+    }
+    plans = {}
+    async with db_pool.acquire() as conn:
+        for name, (query, *args) in queries.items():
+            plans[name] = await explain(conn, query, *args)
+
+    return {
+        "scale": {"people": people, "stories": stories, "interests": interests,
+                  "story_people": len(persona["story_people"]), "person_interests": len(persona["person_interests"])},
+        "copy_load_ms": round(load_ms, 1),
+        "paths": paths,
+        "plans": plans
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+async def main():
+    rng = random.Random(int(os.getenv("SYNTH_SEED", 7)))
+    db_pool = await create_pool(os.getenv("DATABASE_URL"))
+    fetcher = FetcherAndSaver(db_pool)
+    results = {
+        "revision": git_revision(),
+        "started_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "rounds": ROUNDS,
+        "graph": {"max_hops": GRAPH_MAX_HOPS, "fanout": GRAPH_FANOUT, "max_nodes": GRAPH_MAX_NODES},
+        "scales": []
+    }
+
+    try:
+        async with db_pool.acquire() as conn:
+            results["postgres"] = await conn.fetchval("SHOW server_version")
+
+        for scale in SCALES.split(","):
+            people, stories, interests = (int(n) for n in scale.split(":"))
+            print(f"Scale {people} people / {stories} stories / {interests} interests...")
+            result = await bench_scale(db_pool, fetcher, people, stories, interests, rng)
+            for path, stats in result["paths"].items():
+                print(f"  {path:<22} p50 {stats['p50_ms']:>8.2f} ms  p95 {stats['p95_ms']:>8.2f} ms")
+            for name, plan in result["plans"].items():
+                print(f"  plan {name:<17} {plan['execution_ms']:>8.2f} ms  seq scans {plan['seq_scans']}  {', '.join(plan['indexes'])}")
+            results["scales"].append(result)
+
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(OUTPUT_DIR, f"db_benchmark-{results['revision']}-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {path}")
+
+    finally:
+        async with db_pool.acquire() as conn:
+            await remove_synthetic(conn)
+        await db_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
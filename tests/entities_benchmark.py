@@ -0,0 +1,86 @@
+import tracemalloc
+from datetime import datetime
+
+from components.entities import Insights, UserContext
+from components.serialization import dumps
+
+# Rows shaped like the fetcher's query results (dicts stand in for asyncpg Records)
+USER_ROW = {
+    "name": "Test User",
+    "personality_traits": {"curious": True, "analytical": True},
+    "communication_style": {"key_aspects": ["concise", "friendly", "uses examples"]},
+    "demographic": {"location": "Toronto"}
+}
+INTEREST_ROWS = [{"name": f"Interest {i}", "summary": "Enjoys it on weekends"} for i in range(10)]
+PEOPLE_ROWS = [{"name": f"Person {i}", "relationship": "friend", "notes": "Met at university"} for i in range(20)]
+STORY_ROWS = [
+    {"title": f"Story {i}", "description": "Went hiking and got caught in the rain", "location": "Big Bend",
+     "timestamp": datetime(2024, 1, i + 1)}
+    for i in range(5)
+]
+LLM_INSIGHTS = {
+    "people": [{"name": "Sarah", "context": "friend who works on AI ethics"}],
+    "interests": [{"name": "machine learning", "summary": "talks about it often"}],
+    "personality_traits": ["curious"],
+    "communication_style": {"key_aspects": ["casual"]},
+    "stories": [{"title": "Lunch with Sarah", "description": "Talked about ML", "people": ["Sarah"], "location": ""}]
+}
+
+def dict_context():
+    """The previous shape: a dict per row plus a copied dict once the summary is attached."""
+    context = {
+        "profile": {
+            "name": USER_ROW["name"],
+            "personality_traits": USER_ROW["personality_traits"],
+            "communication_style": USER_ROW["communication_style"],
+            "demographic": USER_ROW["demographic"]
+        },
+        "interests": [dict(i) for i in INTEREST_ROWS],
+        "people": [dict(p) for p in PEOPLE_ROWS],
+        "stories": [dict(s) for s in STORY_ROWS]
+    }
+    return {**context, "conversation_summary": "Talked about weekend plans."}
+
+def typed_context():
+    context = UserContext.from_records(USER_ROW, INTEREST_ROWS, PEOPLE_ROWS, STORY_ROWS)
+    return context.with_summary("Talked about weekend plans.")
+
+def measure_cached(build, count: int = 1000) -> float:
+    """Bytes retained per context when `count` of them are held in a cache."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = [build() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cache
+    return (after - before) / count
+
+def count_allocations(fn, rounds: int = 200) -> float:
+    """Average number of allocations still live after each call (results are kept alive)."""
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    keep = [fn() for _ in range(rounds)]
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del keep
+    stats = snapshot_after.compare_to(snapshot_before, "lineno")
+    return sum(s.count_diff for s in stats if s.count_diff > 0) / rounds
+
+def typed_request():
+    """Per-request work on the typed path: parse insights, build context, serialize the response."""
+    insights = Insights.from_llm(LLM_INSIGHTS)
+    context = typed_context()
+    return dumps({"insights": insights}), context
+
+def dict_request():
+    insights = {**LLM_INSIGHTS}
+    context = dict_context()
+    return dumps({"insights": insights}), context
+
+def main():
+    print(f"{'model':<8} {'bytes/cached context':>21} {'allocs/request':>15}")
+    for name, build, request in (("dict", dict_context, dict_request), ("typed", typed_context, typed_request)):
+        print(f"{name:<8} {measure_cached(build):>21.0f} {count_allocations(request):>15.1f}")
+
+if __name__ == "__main__":
+    main()
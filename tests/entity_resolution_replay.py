@@ -0,0 +1,66 @@
+import asyncio
+import json
+import random
+import sys
+
+from components.entities import Insights
+from components.resolver import KINDS, EntityResolver, NameIndex
+
+# Ways the listener tends to spell the same entity across messages
+PEOPLE = [("Sarah Lee", ["Sarah", "sarah", "Sarah Lee", "sarah lee"]),
+          ("Tom", ["Tom", "tom", "Tom!"]),
+          ("Marco Rossi", ["Marco", "Marco Rossi", "marco"]),
+          ("Lisa", ["Lisa", "lisa", "Lisa."]),
+          ("José Ortega", ["José", "Jose", "Jose Ortega", "José Ortega"]),
+          ("Priya Patel", ["Priya", "priya patel", "Priya Patel"])]
+INTERESTS = [("machine learning", ["machine learning", "Machine Learning", "machine-learning", "Machine learning"]),
+             ("pottery", ["pottery", "Pottery"]),
+             ("hiking", ["hiking", "Hiking", "hikking"]),
+             ("AI ethics", ["AI ethics", "ai ethics", "AI Ethics"])]
+
+def synthetic_corpus(messages: int = 500, seed: int = 7):
+    """Listener-shaped insights where each message mentions a few entities in a random spelling."""
+    rng = random.Random(seed)
+    for _ in range(messages):
+        people = [rng.choice(variants) for _, variants in rng.sample(PEOPLE, rng.randint(0, 2))]
+        interests = [rng.choice(variants) for _, variants in rng.sample(INTERESTS, rng.randint(0, 2))]
+        yield {
+            "people": [{"name": name, "context": ""} for name in people],
+            "interests": [{"name": name, "summary": ""} for name in interests],
+            "stories": [{"title": "Weekend", "description": "", "people": people, "location": ""}] if people else []
+        }
+
+def load_corpus(path: str):
+    """One listener output (JSON) per line, e.g. exported from the insights in pipeline logs."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+async def replay(corpus):
+    resolver = EntityResolver(db_pool=None)
+    # Start warm with an empty index, as for a brand new user, so no database is needed
+    resolver._indexes["replay"] = {kind: NameIndex() for kind in KINDS}
+
+    exact = {kind: set() for kind in KINDS}
+    resolved = {kind: set() for kind in KINDS}
+    for raw in corpus:
+        insights = Insights.from_llm(raw)
+        exact["people"].update(p.name for p in insights.people)
+        exact["interests"].update(i.name for i in insights.interests)
+
+        insights = await resolver.resolve(None, "replay", insights)
+        resolved["people"].update(p.name for p in insights.people)
+        resolved["interests"].update(i.name for i in insights.interests)
+        resolver.remember("replay", insights)
+
+    print(f"{'table':<10} {'exact rows':>10} {'resolved rows':>14} {'prevented':>10}")
+    for kind in KINDS:
+        before, after = len(exact[kind]), len(resolved[kind])
+        prevented = (before - after) / before if before else 0.0
+        print(f"{kind:<10} {before:>10} {after:>14} {prevented:>10.1%}")
+        print(f"  {sorted(resolved[kind])}")
+
+if __name__ == "__main__":
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else synthetic_corpus()
+    asyncio.run(replay(corpus))
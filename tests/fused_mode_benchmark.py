@@ -0,0 +1,97 @@
+import asyncio
+import os
+import time
+import uuid
+from statistics import median
+from dotenv import load_dotenv
+
+from components.database import create_pool
+from components.metrics import metrics
+from components.pipeline import MessageProcessingPipeline
+
+# Load environment variables
+load_dotenv()
+
+# Messages covering small talk, questions and insight-heavy turns
+TEST_MESSAGES = [
+    "hi!",
+    "Thanks, that helps.",
+    "What should I cook tonight?",
+    "I had an interesting conversation with Sarah yesterday about machine learning. She's really passionate about AI ethics.",
+    "My brother Tom just moved to Berlin for a new job and I'm worried we'll drift apart.",
+    "Last weekend I went hiking in Big Bend with Lisa and Marco, and we got caught in a storm on the ridge.",
+    "I've been getting into pottery lately, it's the only thing that really calms me down after work.",
+    "Can you help me plan how to tell my boss I want to go part-time?"
+]
+
+def _counter_total(name: str, **match) -> float:
+    """Sum a counter across label sets that contain `match`."""
+    total = 0.0
+    for (metric, labels), value in metrics.counters.items():
+        labels = dict(labels)
+        if metric == name and all(labels.get(k) == str(v) for k, v in match.items()):
+            total += value
+    return total
+
+async def run_mode(pipeline: MessageProcessingPipeline, user_id: str, mode: str, rounds: int):
+    """Run every test message `rounds` times in one mode and collect latency, tokens and parse rate."""
+    latencies = []
+    tokens_before = _counter_total("llm_prompt_tokens") + _counter_total("llm_completion_tokens")
+    parsed_ok_before = _counter_total("insights_parsed", mode=mode, ok=True)
+    parsed_total_before = _counter_total("insights_parsed", mode=mode)
+
+    for _ in range(rounds):
+        for content in TEST_MESSAGES:
+            message_data = {
+                "content": content,
+                "chat_id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "pipeline_mode": mode
+            }
+            started = time.perf_counter()
+            async for step in pipeline.process_message(message_data):
+                if step["phase"] == "error":
+                    print(f"  error: {step['details']['error']}")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    tokens = _counter_total("llm_prompt_tokens") + _counter_total("llm_completion_tokens") - tokens_before
+    parsed_ok = _counter_total("insights_parsed", mode=mode, ok=True) - parsed_ok_before
+    parsed_total = _counter_total("insights_parsed", mode=mode) - parsed_total_before
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(median(latencies), 1),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1),
+        "tokens_per_request": round(tokens / len(latencies), 1),
+        "parse_success_rate": round(parsed_ok / parsed_total, 3) if parsed_total else None
+    }
+
+async def main():
+    rounds = int(os.getenv("BENCHMARK_ROUNDS", 2))
+    db_pool = await create_pool(os.getenv("DATABASE_URL"), ssl="require")
+
+    try:
+        async with db_pool.acquire() as conn:
+            test_user = await conn.fetchrow("SELECT id FROM users WHERE email = 'test@example.com'")
+            if not test_user:
+                raise ValueError("Test user not found. Please run migrations first.")
+
+        pipeline = MessageProcessingPipeline(db_pool, os.getenv("OPENAI_API_KEY"))
+
+        results = {}
+        for mode in ("staged", "fused"):
+            print(f"Running {mode} mode...")
+            results[mode] = await run_mode(pipeline, str(test_user["id"]), mode, rounds)
+
+        print(f"\n{'mode':<8} {'requests':>8} {'p50 ms':>9} {'p95 ms':>9} {'tokens/req':>11} {'parse ok':>9}")
+        for mode, r in results.items():
+            print(f"{mode:<8} {r['requests']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['tokens_per_request']:>11} {str(r['parse_success_rate']):>9}")
+
+        # Let background insight saves finish before closing the pool
+        await asyncio.sleep(2)
+
+    finally:
+        await db_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from statistics import median
+from dotenv import load_dotenv
+
+from components.database import create_pool
+from components.fetcher import NEIGHBOURHOOD_QUERY
+
+# Load environment variables
+load_dotenv()
+
+# Dense synthetic graph for one throwaway user
+PEOPLE = int(os.getenv("GRAPH_BENCH_PEOPLE", 500))
+INTERESTS = int(os.getenv("GRAPH_BENCH_INTERESTS", 100))
+STORIES = int(os.getenv("GRAPH_BENCH_STORIES", 3000))
+PEOPLE_PER_STORY = (3, 8)
+INTERESTS_PER_PERSON = (3, 10)
+
+async def build_graph(conn, user_id: str, rng: random.Random):
+    """Insert a user with a dense people/interests/stories graph; returns the people names."""
+    await conn.execute("INSERT INTO users (id, email, name, password) VALUES ($1, $2, 'Graph Bench', 'x')",
+                       user_id, f"graph-bench-{user_id}@example.com")
+
+    people = [(uuid.uuid4(), f"Person {i}") for i in range(PEOPLE)]
+    interests = [(uuid.uuid4(), f"Interest {i}") for i in range(INTERESTS)]
+    stories = [(uuid.uuid4(), f"Story {i}") for i in range(STORIES)]
+
+    await conn.copy_records_to_table("people", columns=["id", "user_id", "name"],
+                                     records=[(pid, user_id, name) for pid, name in people])
+    await conn.copy_records_to_table("interests", columns=["id", "user_id", "name"],
+                                     records=[(iid, user_id, name) for iid, name in interests])
+    await conn.copy_records_to_table("stories", columns=["id", "user_id", "title", "description", "timestamp"],
+                                     records=[(sid, user_id, title, "", None) for sid, title in stories])
+    await conn.copy_records_to_table("story_people", columns=["story_id", "person_id"], records=[
+        (sid, pid) for sid, _ in stories
+        for pid, _ in rng.sample(people, rng.randint(*PEOPLE_PER_STORY))
+    ])
+    await conn.copy_records_to_table("person_interests", columns=["person_id", "interest_id"], records=[
+        (pid, iid) for pid, _ in people
+        for iid, _ in rng.sample(interests, rng.randint(*INTERESTS_PER_PERSON))
+    ])
+    await conn.execute("ANALYZE people; ANALYZE interests; ANALYZE stories; ANALYZE story_people; ANALYZE person_interests")
+    return [name for _, name in people]
+
+async def time_query(conn, user_id: str, names, hops: int, fanout: int, rounds: int, rng: random.Random):
+    latencies = []
+    rows = 0
+    for _ in range(rounds):
+        seeds = rng.sample(names, 2)
+        started = time.perf_counter()
+        result = await conn.fetch(NEIGHBOURHOOD_QUERY, user_id, seeds, [], hops, fanout, 12)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rows += len(result)
+    latencies.sort()
+    return median(latencies), latencies[int(0.95 * (len(latencies) - 1))], rows / rounds
+
+async def main():
+    rounds = int(os.getenv("BENCHMARK_ROUNDS", 50))
+    rng = random.Random(7)
+    user_id = str(uuid.uuid4())
+    db_pool = await create_pool(os.getenv("DATABASE_URL"), ssl="require")
+
+    try:
+        async with db_pool.acquire() as conn:
+            print(f"Building graph: {PEOPLE} people, {INTERESTS} interests, {STORIES} stories...")
+            names = await build_graph(conn, user_id, rng)
+
+            plan = await conn.fetch("EXPLAIN " + NEIGHBOURHOOD_QUERY, user_id, names[:2], [], 2, 5, 12)
+            used = sorted({row[0] for row in plan if "Index" in row[0]})
+            print("Indexes in plan:")
+            for line in used:
+                print(f"  {line.strip()}")
+
+            print(f"\n{'hops':>4} {'fanout':>6} {'p50 ms':>8} {'p95 ms':>8} {'rows':>6}")
+            for hops in (1, 2):
+                for fanout in (3, 5, 10):
+                    p50, p95, rows = await time_query(conn, user_id, names, hops, fanout, rounds, rng)
+                    print(f"{hops:>4} {fanout:>6} {p50:>8.2f} {p95:>8.2f} {rows:>6.1f}")
+
+    finally:
+        async with db_pool.acquire() as conn:
+            await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+        await db_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+import asyncpg
+
+from persona_io import IO_CONNECTIONS, export_users, import_users
+from tests.synthetic_personas import EMAIL_PREFIX, generate_persona, load_persona, remove_synthetic
+
+# Load environment variables
+load_dotenv()
+
+# Users and graph size per user loaded before timing export and import
+USERS = int(os.getenv("SYNTH_USERS", 5))
+PEOPLE = int(os.getenv("SYNTH_PEOPLE", 2000))
+STORIES = int(os.getenv("SYNTH_STORIES", 10000))
+INTERESTS = int(os.getenv("SYNTH_INTERESTS", 100))
+
+async def main():
+    rng = random.Random(int(os.getenv("SYNTH_SEED", 7)))
+    pool = await asyncpg.create_pool(os.getenv("DATABASE_URL"), min_size=1, max_size=IO_CONNECTIONS + 1)
+
+    try:
+        started = time.perf_counter()
+        async with pool.acquire() as conn:
+            user_ids = [
+                await load_persona(conn, generate_persona(rng, PEOPLE, STORIES, INTERESTS))
+                for _ in range(USERS)
+            ]
+        print(f"Loaded {USERS} synthetic users in {time.perf_counter() - started:.2f} s\n")
+
+        for fmt in ("ndjson", "binary"):
+            with tempfile.TemporaryDirectory() as directory:
+                print(f"[{fmt}]")
+                await export_users(pool, Path(directory), fmt, user_ids)
+                size = sum(f.stat().st_size for f in Path(directory).iterdir())
+                print(f"  {size / 1024 / 1024:.1f} MB on disk")
+                # Clone with fresh ids; the prefix keeps emails unique and the clones removable
+                await import_users(pool, Path(directory), remap=True, email_prefix=f"{EMAIL_PREFIX}{fmt}-")
+                print()
+
+    finally:
+        async with pool.acquire() as conn:
+            print(f"Removed {await remove_synthetic(conn)} synthetic users")
+        await pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
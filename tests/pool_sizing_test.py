@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+import asyncpg
+
+from components.database import create_pool
+from components.metrics import metrics
+from components.pool import AdaptivePool
+
+# Load environment variables
+load_dotenv()
+
+# Needs DATABASE_URL; each simulated worker gets its own adaptive pool, as separate server processes would
+WORKERS = int(os.getenv("POOL_TEST_WORKERS", 3))
+CONCURRENCY = int(os.getenv("BENCHMARK_CONCURRENCY", 64))
+SECONDS = float(os.getenv("BENCHMARK_SECONDS", 30))
+MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 40))
+
+# Time each request holds its connection, and sizing decisions every second so the test stays short
+QUERY_MS = float(os.getenv("POOL_TEST_QUERY_MS", 5))
+ADJUST_SECONDS = 1.0
+
+async def worker_pool(i: int) -> AdaptivePool:
+    pool = await create_pool(os.getenv("DATABASE_URL"), min_size=1, max_size=MAX_SIZE,
+                             max_inactive_connection_lifetime=5)
+    return AdaptivePool(pool, f"worker{i}", start_size=2, adjust_seconds=ADJUST_SECONDS).start()
+
+async def load(pool: AdaptivePool, concurrency: int, seconds: float, counts: dict) -> None:
+    """`concurrency` request loops, each holding a connection for QUERY_MS per request."""
+    deadline = time.perf_counter() + seconds
+
+    async def loop() -> None:
+        while time.perf_counter() < deadline:
+            try:
+                async with pool.acquire() as conn:
+                    await conn.execute("SELECT pg_sleep($1)", QUERY_MS / 1000)
+                counts[pool.name] += 1
+            except asyncpg.TooManyConnectionsError:
+                counts["refused"] += 1
+                await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+
+async def watch(pools: list, seconds: float, history: dict) -> None:
+    """Print the limits, open connections and server headroom once per sizing decision."""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(ADJUST_SECONDS)
+        for pool in pools:
+            history.setdefault(pool.name, []).append(pool.limit)
+        print(f"  limits {[p.limit for p in pools]}  open {[p.get_size() for p in pools]}  "
+              f"waiting {[p.waiting for p in pools]}  headroom {pools[0].headroom}")
+
+def wait_p95(pool: AdaptivePool) -> float:
+    return metrics.histogram("db_pool_acquire_wait_ms", pool=pool.name).percentile(95)
+
+async def main():
+    pools = [await worker_pool(i) for i in range(WORKERS)]
+    counts = {pool.name: 0 for pool in pools}
+    counts["refused"] = 0
+    history = {}
+
+    try:
+        # All but the last worker saturate first, so the late one has to win connections back from them
+        late = max(5.0, SECONDS / 3)
+        print(f"Load: {WORKERS - 1} workers x {CONCURRENCY} concurrent requests, pools sized 1..{MAX_SIZE}")
+        await asyncio.gather(watch(pools, late, history),
+                             *(load(pool, CONCURRENCY, late, counts) for pool in pools[:-1]))
+
+        print(f"{pools[-1].name} joins for {SECONDS:.0f} s")
+        for pool in pools:
+            counts[pool.name] = 0
+        metrics.histograms.clear()
+        await asyncio.gather(watch(pools, SECONDS, history),
+                             *(load(pool, CONCURRENCY, SECONDS, counts) for pool in pools))
+
+        rates = {pool.name: counts[pool.name] / SECONDS for pool in pools}
+        mean = sum(rates.values()) / len(rates)
+        for pool in pools:
+            print(f"{pool.name}: limit {pool.limit}, {rates[pool.name]:.0f} requests/s, "
+                  f"acquire wait p95 {wait_p95(pool):.1f} ms")
+
+        # Converged: over the last five decisions every limit stayed within a quarter of its level (pools
+        # sharing a full server keep trading a few connections)
+        tail = {name: limits[-5:] for name, limits in history.items()}
+        unsettled = [name for name, limits in tail.items() if max(limits) - min(limits) > max(2, max(limits) // 4)]
+        # Not starved: every worker, including the late one, gets at least half the mean throughput
+        starved = [name for name, rate in rates.items() if rate < mean / 2]
+        print(f"Converged: {WORKERS - len(unsettled)}/{WORKERS} pools; starved: {starved or 'none'}; "
+              f"refused connections: {counts['refused']}")
+
+        # Load drops: the limits come back down
+        await asyncio.gather(watch(pools, 8 * ADJUST_SECONDS, history),
+                             *(load(pool, 1, 8 * ADJUST_SECONDS, counts) for pool in pools))
+        print(f"After load: limits {[p.limit for p in pools]}")
+
+        if unsettled or starved or counts["refused"]:
+            raise AssertionError(f"unsettled {unsettled}, starved {starved}, {counts['refused']} refused connections")
+
+    finally:
+        for pool in pools:
+            await pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+
+from components.listener import ListeningIdentifier
+from components.prefilter import InsightGate
+from components.resolver import EntityResolver
+
+# Load environment variables
+load_dotenv()
+
+# Mix of small talk, questions and insight-heavy turns; pass a file (one message per line) to use real traffic
+MESSAGES = [
+    "ok", "thanks!", "Thanks, that helps.", "hi!", "lol yes", "makes sense", "Can you explain recursion?",
+    "What should I cook tonight?", "How do I center a div?", "Sounds good, talk later",
+    "I had an interesting conversation with Sarah yesterday about machine learning.",
+    "My brother Tom just moved to Berlin for a new job and I'm worried we'll drift apart.",
+    "Last weekend I went hiking in Big Bend with Lisa and Marco.",
+    "I've been getting into pottery lately, it calms me down after work.",
+    "My boss keeps scheduling meetings at 7am and I'm exhausted.",
+    "I'm pretty introverted, big parties drain me.",
+    "Can you help me plan how to tell my boss I want to go part-time?"
+]
+
+THRESHOLDS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+
+async def main():
+    messages = MESSAGES
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    listener = ListeningIdentifier(os.getenv("OPENAI_API_KEY"))
+    gate = InsightGate(EntityResolver(db_pool=None))
+
+    # Run the real extractor once per message, then replay the gate at each threshold
+    results = []
+    for content in messages:
+        insights = await listener.process({"content": content})
+        decision = gate.check("", content)
+        results.append((content, decision.score, insights.has_content))
+        print(f"{decision.score:5.2f}  {'insights' if insights.has_content else 'empty   '}  {content}")
+
+    with_content = sum(1 for _, _, found in results if found)
+    print(f"\n{'threshold':>9} {'skip rate':>10} {'missed':>7} {'missed rate':>12}")
+    for threshold in THRESHOLDS:
+        skipped = [found for _, score, found in results if score < threshold]
+        missed = sum(skipped)
+        print(f"{threshold:>9} {len(skipped) / len(results):>10.1%} {missed:>7} "
+              f"{(missed / with_content if with_content else 0):>12.1%}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
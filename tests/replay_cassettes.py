@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+from components.cassette import RecordingClient, Replay, ReplayClient, load_cassette, recorder
+from components.database import create_pool
+from components.llm import set_client
+from components.metrics import metrics
+from components.pipeline import MessageProcessingPipeline
+from components.serialization import dumps, loads
+
+# Load environment variables
+load_dotenv()
+
+# Replays run against a local Postgres with the migrations applied (DATABASE_URL); no OpenAI key is needed
+REPLAY_API_KEY = "replay"
+REPLAY_EMAIL_PREFIX = "replay-"
+DEFAULT_BASELINE = Path("tests/cassettes/baseline.json")
+
+# A p95 only counts as a regression when it grows by more than the tolerance and this many ms
+REPLAY_NOISE_MS = float(os.getenv("REPLAY_NOISE_MS", 5))
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered)))) - 1]
+
+def timings(tape: dict) -> dict:
+    """Per-execution numbers compared across runs: total, each phase, and LLM/DB time."""
+    result = {"total": tape["duration_ms"] or 0.0,
+              "llm": sum(call.get("latency_ms", 0) for call in tape["llm"]),
+              "db": sum(query["elapsed_ms"] for query in tape["queries"])}
+    for step in tape["steps"]:
+        if step["status"] == "complete" and "duration_ms" in step["details"]:
+            result[f"phase.{step['phase']}"] = step["details"]["duration_ms"]
+    return result
+
+async def seed(pool, recorded: list) -> None:
+    """Give every recorded user the profile, interests, people and stories they had, as replay-* users."""
+    users = {}
+    for tape in recorded:
+        user_id = tape["message_data"].get("user_id")
+        if user_id and tape.get("context"):
+            users[user_id] = (tape["context"], tape["message_data"].get("chat_id"))
+
+    async with pool.acquire() as conn:
+        for user_id, (context, chat_id) in users.items():
+            owner = await conn.fetchval("SELECT email FROM users WHERE id = $1", user_id)
+            if owner is not None and not owner.startswith(REPLAY_EMAIL_PREFIX):
+                continue  # a real local user; replay against their rows as they are
+            profile = context.get("profile") or {"name": "Replay User"}
+            async with conn.transaction():
+                await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+                await conn.execute("""
+                    INSERT INTO users (id, email, name, password, personality_traits, communication_style, demographic)
+                    VALUES ($1, $2, $3, 'replay', $4, $5, $6)
+                """, user_id, f"{REPLAY_EMAIL_PREFIX}{user_id}@example.com", profile["name"],
+                    profile.get("personality_traits") or {}, profile.get("communication_style") or {},
+                    profile.get("demographic") or {})
+                await conn.executemany("INSERT INTO interests (user_id, name, summary) VALUES ($1, $2, $3)",
+                                       [(user_id, i["name"], i.get("summary")) for i in context.get("interests", [])])
+                await conn.executemany(
+                    "INSERT INTO people (user_id, name, relationship, notes) VALUES ($1, $2, $3, $4)",
+                    [(user_id, p["name"], p.get("relationship"), p.get("notes")) for p in context.get("people", [])])
+                await conn.executemany("""
+                    INSERT INTO stories (user_id, title, description, location, timestamp)
+                    VALUES ($1, $2, $3, $4, COALESCE($5::text::timestamp, NOW()))
+                """, [(user_id, s["title"], s.get("description"), s.get("location"), s.get("timestamp"))
+                      for s in context.get("stories", [])])
+                if chat_id:
+                    await conn.execute("""
+                        INSERT INTO chats (id, user_id, title) VALUES ($1, $2, 'Replay')
+                        ON CONFLICT (id) DO NOTHING
+                    """, chat_id, user_id)
+
+async def replay(pool, recorded: list, concurrency: int, collected: list) -> list:
+    """Run every recorded execution once from freshly seeded rows and a cold pipeline; returns the new tapes
+    (the recorder hands them to `collected`)."""
+    await seed(pool, recorded)
+    pipeline = MessageProcessingPipeline(pool, REPLAY_API_KEY)
+    first = len(collected)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(tape: dict) -> None:
+        async with slots:
+            Replay(tape).start()
+            async for step in pipeline.process_message(dict(tape["message_data"])):
+                if step["phase"] == "error":
+                    print(f"Error replaying message: {step['thinking']}")
+
+    # Each execution in its own task, so its replay and tape stay its own
+    await asyncio.gather(*(asyncio.create_task(run(tape)) for tape in recorded))
+    # Background extraction and summaries belong to the run too
+    await asyncio.gather(*pipeline._background, *pipeline.conversations._pending, return_exceptions=True)
+    return [loads(dumps(tape.to_dict())) for tape in collected[first:]]
+
+def report(recorded: list, replayed: list, baseline: dict, tolerance: float) -> list:
+    """Print p50/p95 per metric next to the recording and the baseline; returns the regressions."""
+    before = [timings(tape) for tape in recorded]
+    after = [timings(tape) for tape in replayed]
+    names = sorted({name for t in after for name in t}, key=lambda n: (n != "total", n))
+    regressions = []
+
+    print(f"\n{'metric':<24} {'recorded p95':>13} {'p50':>9} {'p95':>9} {'baseline p95':>13}")
+    for name in names:
+        values = [t[name] for t in after if name in t]
+        p95 = percentile(values, 95)
+        recorded_p95 = percentile([t[name] for t in before if name in t], 95)
+        base = baseline.get(name)
+        flag = ""
+        if base is not None and p95 > base * (1 + tolerance) + REPLAY_NOISE_MS:
+            regressions.append(name)
+            flag = f"  REGRESSION (+{(p95 / base - 1) * 100 if base else 100:.0f}%)"
+        print(f"{name:<24} {recorded_p95:>13.1f} {percentile(values, 50):>9.1f} {p95:>9.1f} "
+              f"{'-' if base is None else f'{base:.1f}':>13}{flag}")
+
+    matches = {dict(labels)["how"]: int(value) for (name, labels), value in metrics.counters.items()
+               if name == "replay_llm_match"}
+    print(f"\nLLM calls matched by {matches}")
+    return regressions
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay recorded pipeline executions and compare p95 latencies.")
+    parser.add_argument("cassettes", nargs="+", type=Path, help="JSONL cassettes recorded with PIPELINE_RECORD_DIR")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiplier on recorded LLM latencies (0 measures the pipeline's own time)")
+    parser.add_argument("--repeat", type=int, default=3, help="Replays of each execution")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed replays first (connections, statements)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p95 growth over the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run's p95s as the baseline")
+    args = parser.parse_args()
+
+    recorded = [tape for path in args.cassettes for tape in load_cassette(path)]
+    print(f"Loaded {len(recorded)} executions from {len(args.cassettes)} cassettes")
+
+    # Recorded answers instead of OpenAI, themselves recorded so the new tapes carry LLM time too
+    set_client(REPLAY_API_KEY, RecordingClient(ReplayClient(args.scale)))
+    # Every replayed execution is taped, and the pool's connections time their queries into the tapes
+    collected = []
+    recorder.sink, recorder.rate = collected.append, 1.0
+    pool = await create_pool(os.getenv("DATABASE_URL"))
+
+    try:
+        for _ in range(args.warmup):
+            await replay(pool, recorded, args.concurrency, collected)
+        metrics.counters.clear()
+
+        started = time.perf_counter()
+        replayed = []
+        for _ in range(args.repeat):
+            replayed += await replay(pool, recorded, args.concurrency, collected)
+        print(f"Replayed {len(replayed)} executions in {time.perf_counter() - started:.2f} s (latency scale {args.scale})")
+
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        regressions = report(recorded, replayed, baseline.get(str(args.scale), {}), args.tolerance)
+
+        if args.update_baseline or not baseline.get(str(args.scale)):
+            after = [timings(tape) for tape in replayed]
+            names = sorted({name for t in after for name in t})
+            baseline[str(args.scale)] = {name: round(percentile([t[name] for t in after if name in t], 95), 1)
+                                         for name in names}
+            args.baseline.parent.mkdir(parents=True, exist_ok=True)
+            args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+            print(f"Stored p95 baseline for latency scale {args.scale} in {args.baseline}")
+            regressions = []
+
+    finally:
+        async with pool.acquire() as conn:
+            await conn.execute("DELETE FROM users WHERE email LIKE $1", f"{REPLAY_EMAIL_PREFIX}%")
+        await pool.close()
+
+    # Non-zero exit so the replay can gate builds
+    if regressions:
+        print(f"\np95 regressions over the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from dotenv import load_dotenv
+
+from components.database import DATABASE_REPLICA_URLS, create_pool, create_replica_router
+from components.entities import Insights
+from components.fetcher import FetcherAndSaver
+from components.metrics import metrics
+from tests.synthetic_personas import generate_persona, load_persona, remove_synthetic
+
+# Load environment variables
+load_dotenv()
+
+# Needs a primary (DATABASE_URL) and at least one streaming replica (DATABASE_REPLICA_URLS), see README
+ROUNDS = int(os.getenv("BENCHMARK_ROUNDS", 20))
+
+# A replica that never answers, to check that reads fail over around it
+DEAD_REPLICA_URL = "postgresql://postgres@127.0.0.1:1/postgres"
+
+def reads() -> dict:
+    return {dict(labels).get("source"): value for (name, labels), value in metrics.counters.items() if name == "db_reads"}
+
+async def main():
+    if not DATABASE_REPLICA_URLS:
+        raise ValueError("Set DATABASE_REPLICA_URLS to the replica's DSN")
+
+    db_pool = await create_pool(os.getenv("DATABASE_URL"))
+    router = await create_replica_router(db_pool)
+    fetcher = FetcherAndSaver(db_pool, router)
+    rng = random.Random(7)
+
+    try:
+        async with db_pool.acquire() as conn:
+            user_id = await load_persona(conn, generate_persona(rng, 50, 100, 10))
+        await router.check()
+        print("Replicas: " + ", ".join(f"{r.name} healthy={r.healthy} lag={r.lag_bytes}B" for r in router.replicas))
+
+        # Read-your-writes: every read right after a save must see it, wherever it was served
+        stale = 0
+        for i in range(ROUNDS):
+            name = f"Replica Check {i}"
+            await fetcher.save_insights(user_id, Insights.from_llm({"people": [{"name": name, "context": "just met"}]}))
+            context = await fetcher.fetch_context(user_id)
+            stale += name not in {p.name for p in context.people}
+        print(f"Read-your-writes: {ROUNDS - stale}/{ROUNDS} reads saw the preceding write; reads by source {reads()}")
+
+        # Once the replica has replayed the write, the user's reads move back to it
+        started = time.perf_counter()
+        while router.choose(user_id) is None and time.perf_counter() - started < 10:
+            await asyncio.sleep(0.05)
+            await router.check()
+        served = await fetcher.fetch_context(user_id)
+        print(f"Back on a replica after {(time.perf_counter() - started) * 1000:.0f} ms "
+              f"({len(served.people)} people visible); reads by source {reads()}")
+
+        # Reads by other users never wait for this user's writes
+        before = reads().get("replica", 0)
+        await fetcher.fetch_context(str(uuid.uuid4()))
+        print(f"Unrelated user served by replica: {reads().get('replica', 0) > before}")
+
+        # A dead replica is marked unhealthy and reads keep working
+        dead = await create_replica_router(db_pool, [DEAD_REPLICA_URL, *DATABASE_REPLICA_URLS], min_size=0)
+        fetcher = FetcherAndSaver(db_pool, dead)
+        await asyncio.gather(*(fetcher.fetch_context(user_id) for _ in range(10)))
+        print("With a dead replica: " + ", ".join(f"{r.name} healthy={r.healthy}" for r in dead.replicas)
+              + f"; reads by source {reads()}")
+        await dead.close()
+
+        if stale:
+            raise AssertionError(f"{stale} reads missed the user's own write")
+
+    finally:
+        async with db_pool.acquire() as conn:
+            await remove_synthetic(conn)
+        await router.close()
+        await db_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from components import serialization
+
+# Number of simulated requests per measurement
+ITERATIONS = 2000
+
+def build_context() -> Dict[str, Any]:
+    """Build a context dict shaped like FetcherAndSaver.fetch_context output."""
+    now = datetime.now()
+    return {
+        "profile": {
+            "name": "Sophie Martinez",
+            "personality_traits": {"traits": ["empathetic", "curious", "creative", "reflective"]},
+            "communication_style": {
+                "message_length": {"preferred_word_count": 120, "range_tolerance": 40},
+                "formality_level": {"level": 2.5, "scale_info": "1-5"},
+                "question_frequency": {"questions_per_response": 2},
+                "response_structure": {"type": "conversational", "elements": ["empathy", "reflection", "question"]}
+            },
+            "demographic": {"age": 29, "location": "Austin, TX", "occupation": "UX designer"}
+        },
+        "interests": [
+            {"name": f"Interest {i}", "summary": "Enjoys exploring this topic in depth on weekends." * 2}
+            for i in range(20)
+        ],
+        "people": [
+            {"name": f"Person {i}", "relationship": "friend", "notes": "Met at university, shares a love of hiking. " * 3}
+            for i in range(30)
+        ],
+        "stories": [
+            {
+                "title": f"Story {i}",
+                "description": "A long weekend trip with friends that changed how I think about work. " * 4,
+                "location": "Big Bend",
+                "timestamp": now - timedelta(days=i)
+            }
+            for i in range(5)
+        ]
+    }
+
+def build_frames(context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Build the frames a single pipeline run emits over the WebSocket."""
+    insights = {
+        "people": [{"name": "Lisa", "context": "close friend"}],
+        "interests": [{"name": "hiking", "summary": "weekend hikes"}],
+        "personality_traits": ["reflective"],
+        "communication_style": {"key_aspects": ["warm", "open"]},
+        "stories": []
+    }
+    response = {
+        "status": "success",
+        "assistant_message": {
+            "id": str(uuid.uuid4()),
+            "role": "assistant",
+            "content": "That sounds like a lot to carry. " * 20,
+            "created_at": datetime.now().isoformat(),
+            "chat_id": str(uuid.uuid4())
+        },
+        "insights": insights
+    }
+    return [
+        {"phase": "understanding", "status": "in_progress", "thinking": "Understanding...", "details": {}},
+        {"phase": "understanding", "status": "complete", "thinking": "Extracted", "details": {"insights": insights}},
+        {"phase": "context", "status": "in_progress", "thinking": "Building...", "details": {}},
+        {"phase": "context", "status": "complete", "thinking": "Retrieved", "details": {"context": context}},
+        {"phase": "generation", "status": "in_progress", "thinking": "Crafting...", "details": {}},
+        {"phase": "generation", "status": "complete", "thinking": "Generated", "details": {"response_length": 640}},
+        {"phase": "adjustment", "status": "in_progress", "thinking": "Adjusting...", "details": {}},
+        {"phase": "adjustment", "status": "complete", "thinking": "Adjusted", "details": {}},
+        {"phase": "complete", "status": "complete", "thinking": "Ready", "response": response}
+    ]
+
+def stdlib_request(jsonb_columns: List[str], frames: List[Dict[str, Any]]) -> None:
+    """Baseline path: stdlib json for JSONB, Starlette send_json, jsonable_encoder + JSONResponse."""
+    for column in jsonb_columns:
+        json.loads(column)
+    for frame in frames:
+        json.dumps(jsonable_encoder(frame), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    response = frames[-1]["response"]
+    json.dumps(jsonable_encoder(response), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def fast_request(jsonb_columns: List[str], frames: List[Dict[str, Any]]) -> None:
+    """New path: one codec decode per JSONB column, serializer used for every frame and the response."""
+    for column in jsonb_columns:
+        serialization.loads(column)
+    for frame in frames:
+        serialization.dumps_str(frame)
+    serialization.dumps(frames[-1]["response"])
+
+def measure(fn, *args) -> float:
+    """Return CPU microseconds per request."""
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        fn(*args)
+    return (time.process_time() - start) / ITERATIONS * 1e6
+
+def main():
+    context = build_context()
+    frames = build_frames(context)
+    jsonb_columns = [json.dumps(context["profile"][k]) for k in ("personality_traits", "communication_style", "demographic")]
+
+    baseline = measure(stdlib_request, jsonb_columns, frames)
+    results = {"stdlib + jsonable_encoder": baseline}
+    for name in serialization.SERIALIZERS:
+        serialization.set_serializer(name)
+        results[f"serialization[{name}]"] = measure(fast_request, jsonb_columns, frames)
+
+    print(f"CPU time per request over {ITERATIONS} iterations:")
+    for name, micros in results.items():
+        print(f"  {name:<28} {micros:8.1f} us  ({baseline / micros:4.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import random
+import time
+from dotenv import load_dotenv
+
+from components.database import create_pool
+from components.entities import Insights
+from components.fetcher import FetcherAndSaver
+from components.sharding import DATABASE_SHARD_URLS, SHARD_MAIN, create_shard_router, move_user
+from tests.synthetic_personas import generate_persona, load_persona, remove_synthetic
+
+# Load environment variables
+load_dotenv()
+
+# Needs DATABASE_URL plus at least one shard in DATABASE_SHARD_URLS, each with the migrations applied (see README)
+USERS = int(os.getenv("SYNTH_USERS", 40))
+CONCURRENCY = int(os.getenv("BENCHMARK_CONCURRENCY", 32))
+SECONDS = float(os.getenv("BENCHMARK_SECONDS", 10))
+
+# Small pools, so the connection limit of a single database is what throughput runs into
+POOL_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 5))
+
+async def workload(fetcher: FetcherAndSaver, user_ids: list, seconds: float) -> float:
+    """Context reads with a save every fourth request, from CONCURRENCY workers; returns requests/s."""
+    done = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(rng: random.Random) -> None:
+        nonlocal done
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(user_ids)
+            if done % 4 == 0:
+                await fetcher.save_insights(user_id, Insights.from_llm(
+                    {"interests": [{"name": f"load test {rng.randrange(20)}", "summary": "from the sharding test"}]}))
+            await fetcher.fetch_context(user_id)
+            done += 1
+
+    await asyncio.gather(*(worker(random.Random(i)) for i in range(CONCURRENCY)))
+    return done / seconds
+
+async def counts_by_shard(router, user_id: str) -> dict:
+    """People rows of a user on every shard."""
+    counts = {}
+    for name, shard in router.shards.items():
+        async with shard.pool.acquire() as conn:
+            counts[name] = await conn.fetchval("SELECT COUNT(*) FROM people WHERE user_id = $1", user_id)
+    return counts
+
+async def main():
+    if not DATABASE_SHARD_URLS:
+        raise ValueError("Set DATABASE_SHARD_URLS to name=DSN pairs for the extra shards")
+
+    main_pool = await create_pool(os.getenv("DATABASE_URL"), max_size=POOL_SIZE)
+    router = await create_shard_router(main_pool, max_size=POOL_SIZE)
+    fetcher = FetcherAndSaver(main_pool, shards=router)
+    rng = random.Random(7)
+
+    try:
+        async with main_pool.acquire() as conn:
+            user_ids = [await load_persona(conn, generate_persona(rng, 50, 100, 10)) for _ in range(USERS)]
+        print(f"Loaded {USERS} users on {SHARD_MAIN}; shards: {', '.join(router.shards)}")
+
+        # Throughput with everyone on main, then with each user moved to their hash-ring shard
+        single = await workload(fetcher, user_ids, SECONDS)
+        print(f"All users on {SHARD_MAIN}: {single:.0f} requests/s")
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            await move_user(router, user_id, router.target(user_id))
+        print(f"Rebalanced {USERS} users in {time.perf_counter() - started:.2f} s: "
+              + ", ".join(f"{name}={sum(router.target(u) == name for u in user_ids)}" for name in router.shards))
+
+        sharded = await workload(fetcher, user_ids, SECONDS)
+        print(f"Sharded: {sharded:.0f} requests/s ({sharded / single:.2f}x)")
+
+        # Routing: every user's rows are on exactly their target shard, and reads find them
+        misrouted = 0
+        for user_id in user_ids:
+            counts = await counts_by_shard(router, user_id)
+            target = router.target(user_id)
+            context = await fetcher.fetch_context(user_id)
+            if any(count for name, count in counts.items() if name != target) or len(context.people) != counts[target]:
+                misrouted += 1
+                print(f"  {user_id}: target {target}, people rows {counts}, {len(context.people)} read")
+        print(f"Routing: {USERS - misrouted}/{USERS} users read and stored on their shard")
+
+        # Online move: saves keep landing while the user moves away from their shard and back
+        user_id = user_ids[0]
+        home = router.target(user_id)
+        away = next(name for name in router.shards if name != home)
+        names = [f"Moving Friend {i}" for i in range(40)]
+
+        async def writes() -> None:
+            for name in names:
+                await fetcher.save_insights(user_id, Insights.from_llm({"people": [{"name": name, "context": "met"}]}))
+
+        async def moves() -> None:
+            for target in (away, home):
+                await asyncio.sleep(0.05)
+                await move_user(router, user_id, target)
+
+        await asyncio.gather(writes(), moves())
+        stored = {p.name for p in (await fetcher.fetch_context(user_id)).people}
+        lost = [name for name in names if name not in stored]
+        print(f"Online move {home} -> {away} -> {home}: {len(names) - len(lost)}/{len(names)} concurrent saves kept, "
+              f"rows per shard {await counts_by_shard(router, user_id)}")
+
+        if misrouted or lost:
+            raise AssertionError(f"{misrouted} misrouted users, {len(lost)} saves lost during the move")
+
+    finally:
+        for shard in router.shards.values():
+            async with shard.pool.acquire() as conn:
+                await remove_synthetic(conn)
+        async with main_pool.acquire() as conn:
+            await conn.execute("DELETE FROM shard_map WHERE NOT EXISTS (SELECT 1 FROM users WHERE id = shard_map.user_id)")
+        await router.close()
+        await main_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from dotenv import load_dotenv
+
+from components.database import create_pool
+
+# Load environment variables
+load_dotenv()
+
+# Emails of generated users start with this, so they can be found and removed
+EMAIL_PREFIX = "synthetic-"
+
+FIRST_NAMES = ["Sarah", "Tom", "Marco", "Lisa", "Priya", "José", "Emily", "Noah", "Aisha", "Kenji", "Olivia", "Liam",
+               "Fatima", "Lucas", "Mei", "Daniel", "Sofia", "Omar", "Hannah", "Mateo", "Zoe", "Ivan", "Chloe", "Ravi"]
+LAST_NAMES = ["Lee", "Rossi", "Patel", "Ortega", "Zhang", "Kim", "Müller", "Cohen", "Okafor", "Silva", "Nguyen",
+              "Dubois", "Kowalski", "Haddad", "Tanaka", "Brown", "García", "Ivanova", "Smith", "Larsen"]
+RELATIONSHIPS = ["friend", "close friend", "coworker", "manager", "sister", "brother", "mother", "father", "partner",
+                 "neighbour", "roommate", "mentor", "cousin", "teammate", "ex", "acquaintance"]
+INTEREST_TOPICS = ["machine learning", "pottery", "hiking", "rock climbing", "jazz", "sourdough baking", "chess",
+                   "urban gardening", "photography", "marathon running", "board games", "woodworking", "poetry",
+                   "astronomy", "film noir", "cycling", "meditation", "interior design", "birdwatching", "salsa"]
+PLACES = ["Big Bend", "Berlin", "Toronto", "Lisbon", "Kyoto", "the office", "Mom's place", "Central Park", "Austin",
+          "a cabin upstate", "the climbing gym", "Barcelona", "home", "Mexico City", ""]
+TAGS = ["travel", "work", "family", "health", "friendship", "conflict", "celebration", "loss", "learning", "outdoors"]
+SENTENCES = [
+    "We met during a rainy week when nothing seemed to go right.",
+    "They always remember small details about what I said months ago.",
+    "Lately we have been talking about moving to a smaller city.",
+    "I still think about the argument we had over the holidays.",
+    "They were the first person I called after I got the job offer.",
+    "We tend to drift apart in winter and reconnect every spring.",
+    "Their advice on negotiating my salary turned out to be spot on.",
+    "It took a long time before I felt comfortable being honest with them.",
+    "We started a tradition of cooking something new every Sunday.",
+    "I worry that I don't make enough time for them anymore."
+]
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+def generate_persona(rng: random.Random, people: int, stories: int, interests: int,
+                     note_sentences: int = 12) -> Dict[str, List[tuple]]:
+    """Rows for one user, shaped for COPY into users/interests/people/stories and the link tables."""
+    user_id = uuid.uuid4()
+    now = datetime.now()
+
+    # Unique names: mostly "First Last", some first names only, numbered once combinations run out
+    names, seen = [], set()
+    while len(names) < people:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        name = first if rng.random() < 0.2 else f"{first} {last}"
+        if name in seen:
+            name = f"{first} {last} {len(names)}"
+        seen.add(name)
+        names.append(name)
+
+    interest_names = [
+        INTEREST_TOPICS[i % len(INTEREST_TOPICS)] + ("" if i < len(INTEREST_TOPICS) else f" {i // len(INTEREST_TOPICS)}")
+        for i in range(interests)
+    ]
+
+    user = (user_id, f"{EMAIL_PREFIX}{user_id}@example.com", f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "synthetic",
+            {"traits": rng.sample(["curious", "analytical", "empathetic", "creative", "reflective", "direct"], 3)},
+            {
+                "message_length": {"preferred_word_count": rng.choice([40, 80, 150]), "range_tolerance": 30},
+                "formality_level": {"level": rng.choice([1.5, 2.5, 3.5, 4.5]), "scale_info": "1-5"},
+                "question_frequency": {"questions_per_response": rng.choice([0, 1, 2])}
+            },
+            {"age": rng.randint(18, 80), "location": rng.choice(PLACES[:-1])})
+
+    interest_rows = [(uuid.uuid4(), user_id, name, _paragraph(rng, 2)) for name in interest_names]
+    people_rows = [
+        (uuid.uuid4(), user_id, name, rng.choice(RELATIONSHIPS), _paragraph(rng, rng.randint(1, note_sentences)))
+        for name in names
+    ]
+    story_rows = [
+        (uuid.uuid4(), user_id, f"{rng.choice(['Trip to', 'Dinner in', 'Weekend at', 'Argument at', 'Surprise in'])} "
+                                f"{rng.choice(PLACES[:-1])} #{i}",
+         _paragraph(rng, rng.randint(2, 8)), rng.choice(PLACES),
+         now - timedelta(days=rng.randint(0, 5 * 365), minutes=rng.randint(0, 1440)),
+         rng.sample(TAGS, rng.randint(0, 3)))
+        for i in range(stories)
+    ]
+
+    story_people = [
+        (story[0], person[0])
+        for story in story_rows
+        for person in rng.sample(people_rows, min(len(people_rows), rng.randint(1, 5)))
+    ]
+    person_interests = [
+        (person[0], interest[0])
+        for person in people_rows
+        for interest in rng.sample(interest_rows, min(len(interest_rows), rng.randint(0, 4)))
+    ]
+
+    return {
+        "user": user,
+        "interests": interest_rows,
+        "people": people_rows,
+        "stories": story_rows,
+        "story_people": story_people,
+        "person_interests": person_interests
+    }
+
+async def load_persona(conn, persona: Dict[str, Any]) -> str:
+    """Insert one generated persona, bulk-loading everything but the user row with COPY."""
+    user_id, email, name, password, traits, style, demographic = persona["user"]
+    async with conn.transaction():
+        await conn.execute("""
+            INSERT INTO users (id, email, name, password, personality_traits, communication_style, demographic)
+            VALUES ($1, $2, $3, $4, $5, $6, $7)
+        """, user_id, email, name, password, traits, style, demographic)
+        await conn.copy_records_to_table("interests", columns=["id", "user_id", "name", "summary"],
+                                         records=persona["interests"])
+        await conn.copy_records_to_table("people", columns=["id", "user_id", "name", "relationship", "notes"],
+                                         records=persona["people"])
+        await conn.copy_records_to_table("stories", columns=["id", "user_id", "title", "description", "location",
+                                                             "timestamp", "tags"],
+                                         records=persona["stories"])
+        await conn.copy_records_to_table("story_people", columns=["story_id", "person_id"],
+                                         records=persona["story_people"])
+        await conn.copy_records_to_table("person_interests", columns=["person_id", "interest_id"],
+                                         records=persona["person_interests"])
+    return str(user_id)
+
+async def remove_synthetic(conn) -> int:
+    """Delete every generated user (their rows cascade)."""
+    result = await conn.execute("DELETE FROM users WHERE email LIKE $1", f"{EMAIL_PREFIX}%")
+    return int(result.split()[-1])
+
+async def main():
+    users = int(os.getenv("SYNTH_USERS", 1))
+    people = int(os.getenv("SYNTH_PEOPLE", 10000))
+    stories = int(os.getenv("SYNTH_STORIES", 50000))
+    interests = int(os.getenv("SYNTH_INTERESTS", 200))
+    rng = random.Random(int(os.getenv("SYNTH_SEED", 7)))
+
+    db_pool = await create_pool(os.getenv("DATABASE_URL"))
+    try:
+        async with db_pool.acquire() as conn:
+            if os.getenv("SYNTH_CLEAN", "").lower() == "true":
+                print(f"Removed {await remove_synthetic(conn)} synthetic users")
+                return
+            for _ in range(users):
+                user_id = await load_persona(conn, generate_persona(rng, people, stories, interests))
+                print(json.dumps({"user_id": user_id, "people": people, "stories": stories, "interests": interests}))
+            await conn.execute("ANALYZE")
+    finally:
+        await db_pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,6 @@
 import requests
 import json
+import uuid
 
 BASE_URL = "http://localhost:8000"
 
@@ -17,7 +18,7 @@ def test_process_message():
         f"{BASE_URL}/process-message",
         json={
             "user_message": "Hello, how are you?",
-            "chat_id": "test-chat-1",
+            "chat_id": str(uuid.uuid4()),
             "user_id": "test-user-1",
             "message_history": [],
             "system_prompt": "You are a helpful assistant."
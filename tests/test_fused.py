@@ -0,0 +1,51 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from components.entities import EMPTY_CONTEXT, EMPTY_INSIGHTS
+from components.fused import FusedResponder, parse_fused
+from components.generator import ResponseGenerator
+
+# Runs offline: the OpenAI clients are replaced by canned completions
+INSIGHTS = {"people": [{"name": "Dana", "context": "sister"}], "interests": [], "personality_traits": [],
+            "communication_style": {"key_aspects": []}, "stories": []}
+
+def completions(*contents):
+    """A client whose chat.completions.create returns `contents` in turn."""
+    replies = iter(contents)
+
+    async def create(**kwargs):
+        message = SimpleNamespace(content=next(replies))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+def process(fused_output: str, plain_output: str = "Plain reply"):
+    generator = ResponseGenerator("test-key")
+    generator.model = completions(plain_output)
+    fused = FusedResponder("test-key", generator)
+    fused.model = completions(fused_output)
+    return asyncio.run(fused.process({"content": "I saw Dana today", "user_id": "u1"}, EMPTY_CONTEXT))
+
+def test_plain_json():
+    reply, insights, parsed = process(json.dumps({"reply": "Nice!", "insights": INSIGHTS}))
+    assert (reply, parsed) == ("Nice!", True)
+    assert [p.name for p in insights.people] == ["Dana"]
+
+def test_fenced_json():
+    content = "```json\n" + json.dumps({"reply": "Nice!", "insights": INSIGHTS}) + "\n```"
+    reply, insights, parsed = process(content)
+    assert (reply, parsed) == ("Nice!", True)
+    assert [p.name for p in insights.people] == ["Dana"]
+
+def test_unreadable_outputs_never_reach_the_user():
+    for content in ("[1, 2]", '"just a string"', json.dumps({"insights": INSIGHTS}),
+                    json.dumps({"reply": "  ", "insights": INSIGHTS}), json.dumps({"reply": 3}),
+                    "```json\n{\"reply\": \n```", "not json at all"):
+        reply, insights, parsed = process(content)
+        assert (reply, insights, parsed) == ("Plain reply", EMPTY_INSIGHTS, False), content
+
+def test_parse_fused_rejects_non_objects():
+    assert parse_fused("null") is None
+    assert parse_fused("42") is None
+    assert parse_fused('{"reply": "ok"}')[0] == "ok"
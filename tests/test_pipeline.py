@@ -4,7 +4,7 @@ from dotenv import load_dotenv
 import json
 from datetime import datetime
 from components.pipeline import MessageProcessingPipeline
-import asyncpg
+from components.database import create_pool
 import uuid
 
 # Load environment variables
@@ -36,8 +36,8 @@ async def test_pipeline():
     """Test the message processing pipeline with narrative output."""
     print("\n🚀 Initializing test pipeline...")
     
-    # Initialize database connection
-    db_pool = await asyncpg.create_pool(
+    # Initialize database connection (with the JSON codecs the fetcher relies on)
+    db_pool = await create_pool(
         os.getenv("DATABASE_URL"),
         ssl="require"
     )
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from components.stages import Stage, StagePipeline
+
+# Runs offline: stages are plain coroutines, no database or OpenAI
+
+def produce(log, name, outputs, delay=0.0):
+    """A stage body that waits `delay` seconds, logs start and end, and returns `outputs`."""
+    async def run(values):
+        log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        log.append(f"end {name}")
+        return dict(outputs)
+    return run
+
+def fail(error):
+    async def run(values):
+        raise error
+    return run
+
+def collect(pipeline, values):
+    async def main():
+        return [event async for event in pipeline.run(values)]
+    return asyncio.run(main())
+
+def test_stages_wait_for_their_needs():
+    log = []
+    pipeline = StagePipeline([
+        Stage("answer", produce(log, "answer", {"answer": "a"}), needs=["context"], provides=["answer"]),
+        Stage("context", produce(log, "context", {"context": "c"}), needs=["message"], provides=["context"]),
+    ], inputs=["message"])
+    values = {"message": "m"}
+    collect(pipeline, values)
+    assert log == ["start context", "end context", "start answer", "end answer"]
+    assert values == {"message": "m", "context": "c", "answer": "a"}
+
+def test_independent_stages_run_concurrently():
+    log = []
+    pipeline = StagePipeline([
+        Stage("slow", produce(log, "slow", {"slow": 1}, delay=0.05), needs=["message"], provides=["slow"]),
+        Stage("fast", produce(log, "fast", {"fast": 2}), needs=["message"], provides=["fast"]),
+    ], inputs=["message"])
+    collect(pipeline, {"message": "m"})
+    assert log == ["start slow", "start fast", "end fast", "end slow"]
+
+def test_phase_events_merge_their_stages():
+    log = []
+    pipeline = StagePipeline([
+        Stage("people", produce(log, "people", {"people": [], "details": {"people": 0}}, delay=0.02),
+              needs=["message"], provides=["people"], phase="analysis", thinking=("Reading", "Read")),
+        Stage("topics", produce(log, "topics", {"topics": [], "details": {"topics": 0}}),
+              needs=["message"], provides=["topics"], phase="analysis", thinking=("Reading", "Read")),
+        Stage("reply", produce(log, "reply", {"reply": "r"}), needs=["people", "topics"], provides=["reply"],
+              phase="generation", thinking=("Writing", "Written")),
+    ], inputs=["message"])
+    events = collect(pipeline, {"message": "m"})
+
+    assert [(e["phase"], e["status"]) for e in events] == [
+        ("analysis", "in_progress"), ("analysis", "complete"),
+        ("generation", "in_progress"), ("generation", "complete"),
+    ]
+    assert events[0]["thinking"] == "Reading" and events[1]["thinking"] == "Read"
+    details = events[1]["details"]
+    assert (details["people"], details["topics"]) == (0, 0)
+    assert set(details["stage_ms"]) == {"people", "topics"}
+    assert "stage_ms" not in events[3]["details"] and "duration_ms" in events[3]["details"]
+
+def test_error_uses_the_fallback():
+    pipeline = StagePipeline([
+        Stage("context", fail(RuntimeError("db down")), needs=["message"], provides=["context"],
+              phase="context", fallback=lambda values, error: {"context": "empty"}),
+    ], inputs=["message"])
+    values = {"message": "m"}
+    events = collect(pipeline, values)
+    assert values["context"] == "empty"
+    assert events[-1]["details"]["fallback"] == "error"
+
+def test_timeout_uses_the_fallback():
+    log = []
+    pipeline = StagePipeline([
+        Stage("context", produce(log, "context", {"context": "full"}, delay=1), needs=["message"],
+              provides=["context"], phase="context", timeout_ms=20,
+              fallback=lambda values, error: {"context": "empty"}),
+    ], inputs=["message"])
+    values = {"message": "m"}
+    events = collect(pipeline, values)
+    assert values["context"] == "empty"
+    assert events[-1]["details"]["fallback"] == "timeout"
+    assert log == ["start context"]
+
+def test_error_without_fallback_stops_the_pipeline():
+    log = []
+    pipeline = StagePipeline([
+        Stage("context", fail(RuntimeError("db down")), needs=["message"], provides=["context"]),
+        Stage("slow", produce(log, "slow", {"slow": 1}, delay=1), needs=["message"], provides=["slow"]),
+    ], inputs=["message"])
+    with pytest.raises(RuntimeError, match="db down"):
+        collect(pipeline, {"message": "m"})
+    # The still-running stage is cancelled rather than left behind
+    assert log == ["start slow"]
+
+def test_missing_output_is_an_error():
+    pipeline = StagePipeline([
+        Stage("context", produce([], "context", {}), needs=["message"], provides=["context"]),
+    ], inputs=["message"])
+    with pytest.raises(ValueError, match="did not provide context"):
+        collect(pipeline, {"message": "m"})
+
+def test_invalid_graphs_are_rejected():
+    noop = produce([], "noop", {})
+    with pytest.raises(ValueError):
+        StagePipeline([Stage("a", noop, provides=["x"]), Stage("b", noop, provides=["x"])])
+    with pytest.raises(ValueError):
+        StagePipeline([Stage("a", noop, needs=["missing"], provides=["x"])], inputs=["message"])
+    with pytest.raises(ValueError):
+        StagePipeline([Stage("a", noop, needs=["y"], provides=["x"]), Stage("b", noop, needs=["x"], provides=["y"])])
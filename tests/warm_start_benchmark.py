@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import time
+import uuid
+from statistics import median
+
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+PORT = int(os.getenv("BENCHMARK_PORT", 8765))
+BASE_URL = f"http://127.0.0.1:{PORT}"
+API_KEY = os.getenv("API_KEY", "your-secret-api-key")
+TEST_USER_ID = os.getenv("TEST_USER_ID")
+
+def wait_for(path: str, timeout: float = 120) -> None:
+    """Poll until `path` returns 200."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f"{BASE_URL}{path}", timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"{path} not ready after {timeout}s")
+
+def first_good_response(gate: str) -> dict:
+    """Boot a fresh server, wait for `gate`, and time the first successful /process-message."""
+    boot = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(PORT)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(gate)
+        gate_passed = time.perf_counter()
+
+        response = requests.post(
+            f"{BASE_URL}/process-message",
+            headers={"X-API-Key": API_KEY},
+            json={
+                "user_message": "Hey, how was your day?",
+                "chat_id": str(uuid.uuid4()),
+                "user_id": TEST_USER_ID
+            },
+            timeout=120
+        )
+        done = time.perf_counter()
+        response.raise_for_status()
+
+        return {
+            "gate_ms": (gate_passed - boot) * 1000,
+            "first_request_ms": (done - gate_passed) * 1000,
+            "boot_to_response_ms": (done - boot) * 1000
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    if not TEST_USER_ID:
+        raise ValueError("Set TEST_USER_ID to an existing user id")
+
+    runs = int(os.getenv("BENCHMARK_RUNS", 3))
+    # "/" passes as soon as the app is up (before); "/ready" waits for warm-up (after)
+    for gate in ("/", "/ready"):
+        results = [first_good_response(gate) for _ in range(runs)]
+        print(f"gate {gate}:")
+        for key in ("gate_ms", "first_request_ms", "boot_to_response_ms"):
+            print(f"  {key:<20} median {median(r[key] for r in results):8.1f}")
+
+if __name__ == "__main__":
+    main()